@@ -0,0 +1,108 @@
+# Builds synthetic but valid BW1 and BW2 resource archives for the benchmarks.
+# The archives are written with the same code the tools use: textures with bwtex
+# and the archive itself with restool's packer.
+import io
+import json
+import os
+import random
+
+from common import quiet
+
+from PIL import Image
+
+import bwtex
+from restool import pack_folder_to_res
+
+TEXTURE_FORMATS = {
+    "bw1": ("DXT1", "P8", "RGBA"),
+    "bw2": ("DXT1", "P4", "P8", "I4", "I8", "IA4", "IA8", "RGBA")
+}
+
+GAME_NAMES = {
+    "bw1": "Battalion Wars",
+    "bw2": "Battalion Wars 2"
+}
+
+
+def make_test_image(rnd, width, height, colors=64):
+    # Random pixels from a limited set of colors, so that palette formats don't spend
+    # all their time reducing the amount of colors.
+    palette = [bytes((rnd.randrange(256), rnd.randrange(256), rnd.randrange(256), rnd.choice((0, 128, 255))))
+               for i in range(colors)]
+    pixels = b"".join(rnd.choice(palette) for i in range(width*height))
+    return Image.frombytes("RGBA", (width, height), pixels)
+
+
+def make_texture(game, name, fmt, img):
+    png = io.BytesIO()
+    img.save(png, "PNG")
+    png.seek(0)
+
+    cls = bwtex.BW1Texture if game == "bw1" else bwtex.BW2Texture
+    tex = cls.from_path(png, name, fmt, autogenmipmaps=True)
+
+    data = io.BytesIO()
+    with quiet():
+        tex.write(data)
+    return data.getvalue()
+
+
+def build_fixture_folder(folder, game, textures_per_format=2, texture_size=128,
+                         sounds=10, sound_size=64*1024, models=10, model_size=32*1024,
+                         animations=10, effects=10, scripts=10, seed=0):
+    # Writes an extracted archive folder like the one dump_res_to_folder creates.
+    rnd = random.Random(seed)
+
+    subfolders = {}
+    for subfolder in ("Textures", "Sounds", "Models", "Animations", "SpecialEffects", "Scripts"):
+        subfolders[subfolder] = os.path.join(folder, subfolder)
+        os.makedirs(subfolders[subfolder], exist_ok=True)
+
+    with open(os.path.join(folder, "resinfo.txt"), "w") as f:
+        json.dump({"Game": GAME_NAMES[game], "Level name": "C1_Bench"}, f, indent=" "*4)
+
+    texturenames = []
+    for fmt in TEXTURE_FORMATS[game]:
+        for i in range(textures_per_format):
+            name = "{0}_{1}".format(fmt, i)
+            texturenames.append(name)
+            img = make_test_image(rnd, texture_size, texture_size)
+            with open(os.path.join(subfolders["Textures"], name+".texture"), "wb") as f:
+                f.write(make_texture(game, name, fmt, img))
+
+    # Every model mentions one of the textures, so that model texture association has work to do.
+    for i in range(models):
+        name = "model_{0}".format(i)
+        modelfolder = os.path.join(subfolders["Models"], name)
+        os.makedirs(modelfolder, exist_ok=True)
+        with open(os.path.join(modelfolder, name+".modl"), "wb") as f:
+            f.write(rnd.randbytes(model_size))
+            if texturenames:
+                f.write(texturenames[i % len(texturenames)].encode("ascii") + b"\x00")
+
+    for i in range(sounds):
+        with open(os.path.join(subfolders["Sounds"], "sound_{0}.adp".format(i)), "wb") as f:
+            f.write(rnd.randbytes(sound_size))
+
+    for i in range(animations):
+        with open(os.path.join(subfolders["Animations"], "anim_{0}.anim".format(i)), "wb") as f:
+            f.write(rnd.randbytes(4096))
+
+    for i in range(effects):
+        with open(os.path.join(subfolders["SpecialEffects"], "effect_{0}.txt".format(i)), "wb") as f:
+            f.write("effect {0}\n".format(i).encode("ascii")*64)
+
+    for i in range(scripts):
+        with open(os.path.join(subfolders["Scripts"], "script_{0}.luap".format(i)), "wb") as f:
+            f.write(rnd.randbytes(2048))
+
+
+def build_fixture_archive(path, game, **kwargs):
+    # Builds a fixture folder next to path and packs it into the archive at path.
+    # BW2 archives should end with .res.gz, BW1 archives with .res
+    folder = path + "_Source"
+    build_fixture_folder(folder, game, **kwargs)
+    with quiet():
+        pack_folder_to_res(folder, path)
+
+    return path
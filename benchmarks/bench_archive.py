@@ -0,0 +1,147 @@
+# Times parsing, extracting and repacking of synthetic resource archives and
+# converting the textures inside them.
+#
+#   python benchmarks/bench_archive.py
+#   python benchmarks/bench_archive.py --textures 8 --sounds 100 --compare benchmarks/results/old.json
+import argparse
+import io
+import os
+import shutil
+import tempfile
+
+from common import (time_call, summarize, run_info, save_results, load_results, print_results, quiet)
+from archive_fixtures import build_fixture_archive
+
+import bwtex
+from lib.bw_archive import BWArchive
+from lib.bw_archive_stream import BWArchiveStream
+from restool import dump_res_to_folder, pack_folder_to_res, choose_open_func
+
+
+def find_textures(folder):
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(folder):
+        for filename in filenames:
+            if filename.endswith(".texture"):
+                paths.append(os.path.join(dirpath, filename))
+    paths.sort()
+    return paths
+
+
+def bench_game(game, workdir, args):
+    archive_path = os.path.join(workdir, "bench_" + game + (".res" if game == "bw1" else ".res.gz"))
+    build_fixture_archive(archive_path, game,
+                          textures_per_format=args.textures, texture_size=args.texture_size,
+                          sounds=args.sounds, sound_size=args.sound_size,
+                          models=args.models, model_size=args.model_size,
+                          animations=args.scripts, effects=args.scripts, scripts=args.scripts)
+
+    with choose_open_func(archive_path)(archive_path, "rb") as f:
+        archive_size = len(f.read())
+    archive_mb = archive_size / (1024*1024)
+    results = {}
+
+    def parse():
+        with choose_open_func(archive_path)(archive_path, "rb") as f:
+            BWArchive(f)
+    times = time_call(parse, args.repeat)
+    results[game+".parse"] = summarize(times, throughput=archive_mb/min(times), unit="MB/s")
+
+    def parse_stream():
+        with choose_open_func(archive_path)(archive_path, "rb") as f:
+            for resource in BWArchiveStream(f).resources():
+                pass
+    times = time_call(parse_stream, args.repeat)
+    results[game+".parse_stream"] = summarize(times, throughput=archive_mb/min(times), unit="MB/s")
+
+    extracted = os.path.join(workdir, "extracted_" + game)
+    def clean_extract_folder():
+        shutil.rmtree(extracted, ignore_errors=True)
+        return extracted
+    times = time_call(lambda folder: dump_res_to_folder(archive_path, folder), args.repeat, setup=clean_extract_folder)
+    results[game+".extract"] = summarize(times, throughput=archive_mb/min(times), unit="MB/s")
+
+    repacked = os.path.join(workdir, "repacked_" + os.path.basename(archive_path))
+    times = time_call(lambda: pack_folder_to_res(extracted, repacked), args.repeat)
+    results[game+".repack"] = summarize(times, throughput=archive_mb/min(times), unit="MB/s")
+
+    with choose_open_func(archive_path)(archive_path, "rb") as f:
+        original_data = f.read()
+    with choose_open_func(repacked)(repacked, "rb") as f:
+        if f.read() != original_data:
+            print("Warning: repacked {0} archive differs from the original".format(game))
+
+    # Texture round trip: decode every mipmap of every extracted texture, then encode it again
+    cls = bwtex.BW1Texture if game == "bw1" else bwtex.BW2Texture
+    texture_datas = []
+    for path in find_textures(extracted):
+        with open(path, "rb") as f:
+            texture_datas.append(f.read())
+
+    def decode_textures():
+        textures = []
+        for data in texture_datas:
+            tex = cls.from_file(io.BytesIO(data))
+            for mipmap in tex.mipmaps:
+                pass
+            textures.append(tex)
+        return textures
+    times = time_call(decode_textures, args.repeat)
+    with quiet():
+        decoded = decode_textures()
+    pixels = sum(mipmap.width*mipmap.height for tex in decoded for mipmap in tex.mipmaps)
+    results[game+".texture_decode"] = summarize(times, throughput=pixels/1000000/min(times), unit="MP/s")
+
+    def encode_textures():
+        for tex in decoded:
+            tex.write(io.BytesIO())
+    times = time_call(encode_textures, args.repeat)
+    results[game+".texture_encode"] = summarize(times, throughput=pixels/1000000/min(times), unit="MP/s")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark archive and texture handling on synthetic archives.")
+    parser.add_argument("--game", choices=("bw1", "bw2"), action="append",
+                        help="Game to benchmark, can be given more than once. Default: both")
+    parser.add_argument("--textures", type=int, default=2, help="Textures of each format. Default: 2")
+    parser.add_argument("--texture-size", type=int, default=128, help="Width and height of textures. Default: 128")
+    parser.add_argument("--sounds", type=int, default=20, help="Default: 20")
+    parser.add_argument("--sound-size", type=int, default=256*1024, help="Size of a sound in bytes. Default: 262144")
+    parser.add_argument("--models", type=int, default=20, help="Default: 20")
+    parser.add_argument("--model-size", type=int, default=64*1024, help="Size of a model in bytes. Default: 65536")
+    parser.add_argument("--scripts", type=int, default=20,
+                        help="Amount of scripts, animations and effects each. Default: 20")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each benchmark. Default: 3")
+    parser.add_argument("--output", default=None,
+                        help="Where to save the results. Default: benchmarks/results/archive_<revision>_<time>.json")
+    parser.add_argument("--compare", default=None, help="Results of an earlier run to compare against.")
+    parser.add_argument("--keep", default=None,
+                        help="Folder to build the fixtures in, which is kept afterwards. Default: a temporary folder")
+
+    args = parser.parse_args()
+    games = args.game or ["bw1", "bw2"]
+
+    if args.keep is not None:
+        os.makedirs(args.keep, exist_ok=True)
+        workdir = args.keep
+    else:
+        tempdir = tempfile.TemporaryDirectory()
+        workdir = tempdir.name
+
+    results = {}
+    for game in games:
+        print("Benchmarking", game)
+        results.update(bench_game(game, workdir, args))
+
+    settings = dict(vars(args))
+    settings["game"] = games
+    path = save_results("archive", run_info(settings), results, args.output)
+
+    baseline = load_results(args.compare) if args.compare is not None else None
+    print_results(results, baseline)
+    print("Saved results to", path)
+
+    if args.keep is None:
+        tempdir.cleanup()
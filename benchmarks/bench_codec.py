@@ -0,0 +1,214 @@
+# Checks that every texture format still encodes and decodes to exactly the same bytes
+# as the reference outputs in benchmarks/golden/codec.json, and measures how fast the
+# encoders and decoders are.
+#
+#   python benchmarks/bench_codec.py                   check against the golden outputs and time all formats
+#   python benchmarks/bench_codec.py --skip-throughput only check the outputs
+#   python benchmarks/bench_codec.py --update-golden   record new golden outputs, only do this when
+#                                                      a change of the output is intended
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+
+from common import (BENCHMARK_DIR, time_call, summarize, run_info, save_results, load_results, print_results)
+
+from PIL import Image
+
+from lib.texture_utils import (ImageFormat, PaletteFormat, IMAGE_FORMATS_THAT_USE_PALETTES, MAX_COLORS_FOR_IMAGE_FORMAT,
+                               BLOCK_WIDTHS, BLOCK_HEIGHTS, BLOCK_DATA_SIZES, encode_image, decode_image)
+
+GOLDEN_PATH = os.path.join(BENCHMARK_DIR, "golden", "codec.json")
+
+# Sizes that are smaller than a block, not a multiple of the block size in one or both directions and a few regular ones
+SIZES = [(1, 1), (3, 5), (8, 8), (13, 7), (5, 17), (32, 32), (64, 64), (100, 60)]
+
+
+def make_test_image(width, height, seed, colors=None):
+    # Deterministic image with gradients, noise and several levels of alpha.
+    # Images for palette formats only use a small amount of colors.
+    rnd = random.Random(seed)
+    pixels = bytearray()
+    if colors is not None:
+        palette = [bytes((rnd.randrange(256), rnd.randrange(256), rnd.randrange(256), rnd.choice((0, 255, rnd.randrange(256)))))
+                   for i in range(colors)]
+        for i in range(width*height):
+            pixels += rnd.choice(palette)
+    else:
+        for y in range(height):
+            for x in range(width):
+                pixels += bytes(((x*7+y*3) & 0xFF, (x*y) & 0xFF, rnd.randrange(256), rnd.choice((0, 8, 128, 255, 255))))
+
+    return Image.frombytes("RGBA", (width, height), bytes(pixels))
+
+
+def get_cases():
+    # Yields (name, image format, palette format). Formats without a palette ignore the palette format.
+    for image_format in ImageFormat:
+        if image_format in IMAGE_FORMATS_THAT_USE_PALETTES:
+            for palette_format in PaletteFormat:
+                yield "{0}_{1}".format(image_format.name, palette_format.name), image_format, palette_format
+        else:
+            yield image_format.name, image_format, PaletteFormat.RGB5A3
+
+
+def get_data_size(image_format, width, height):
+    blocks_x = (width + BLOCK_WIDTHS[image_format] - 1) // BLOCK_WIDTHS[image_format]
+    blocks_y = (height + BLOCK_HEIGHTS[image_format] - 1) // BLOCK_HEIGHTS[image_format]
+    return blocks_x*blocks_y*BLOCK_DATA_SIZES[image_format]
+
+
+def get_test_image(image_format, width, height):
+    colors = 40 if image_format in IMAGE_FORMATS_THAT_USE_PALETTES else None
+    return make_test_image(width, height, width*1000+height, colors)
+
+
+def get_raw_test_data(image_format, width, height):
+    # Random image data and a full palette, to cover bit patterns the encoders never produce
+    rnd = random.Random(width*1000+height+image_format.value)
+    data = rnd.randbytes(get_data_size(image_format, width, height))
+    if image_format in IMAGE_FORMATS_THAT_USE_PALETTES:
+        num_colors = MAX_COLORS_FOR_IMAGE_FORMAT[image_format]
+        palette = rnd.randbytes(num_colors*2)
+    else:
+        num_colors = 0
+        palette = None
+    return data, palette, num_colors
+
+
+def sha256(data):
+    return hashlib.sha256(bytes(data)).hexdigest()
+
+
+def make_many_colors_image(width, height):
+    # Every pixel has a different opaque color that stays different in RGB5A3, so with more
+    # than 16384 pixels the colors have to be reduced for C14X2
+    pixels = bytearray()
+    for i in range(width*height):
+        pixels += bytes(((i & 0x1F) << 3, ((i >> 5) & 0x1F) << 3, ((i >> 10) & 0x1F) << 3, 255))
+
+    return Image.frombytes("RGBA", (width, height), bytes(pixels))
+
+
+def get_many_colors_cases():
+    # Yields (name, image format, palette format, image) for images with more colors than the format can hold:
+    # C4 and C8 are reduced by Pillow, C14X2 needs more than 16384 colors before it has to reduce them.
+    for name, image_format, palette_format in get_cases():
+        if image_format in IMAGE_FORMATS_THAT_USE_PALETTES:
+            yield name + "_1000colors_64x64", image_format, palette_format, make_test_image(64, 64, 1000, 1000)
+    yield "C14X2_RGB5A3_reduced_129x129", ImageFormat.C14X2, PaletteFormat.RGB5A3, make_many_colors_image(129, 129)
+
+
+def encode_and_decode(image, image_format, palette_format):
+    image_data, palette_data, encoded_colors = encode_image(image, image_format, palette_format)
+    image_data = image_data.getvalue()
+    palette_data = palette_data.getvalue()
+
+    decoded = decode_image(image_data, palette_data, image_format, palette_format, len(encoded_colors),
+                           image.width, image.height)
+
+    return {
+        "encoded": sha256(image_data),
+        "palette": sha256(palette_data),
+        "decoded": sha256(decoded.tobytes())
+    }
+
+
+def compute_outputs():
+    outputs = {}
+    for name, image_format, palette_format in get_cases():
+        for width, height in SIZES:
+            image = get_test_image(image_format, width, height)
+            values = encode_and_decode(image, image_format, palette_format)
+
+            raw_data, raw_palette, num_colors = get_raw_test_data(image_format, width, height)
+            decoded_raw = decode_image(raw_data, raw_palette, image_format, palette_format, num_colors, width, height)
+            values["decoded_raw"] = sha256(decoded_raw.tobytes())
+
+            outputs["{0}_{1}x{2}".format(name, width, height)] = values
+
+    for name, image_format, palette_format, image in get_many_colors_cases():
+        outputs[name] = encode_and_decode(image, image_format, palette_format)
+
+    return outputs
+
+
+def check_outputs(outputs, golden):
+    mismatches = []
+    for case, values in outputs.items():
+        if case not in golden:
+            mismatches.append("{0}: no golden output".format(case))
+            continue
+        for key, value in values.items():
+            if golden[case].get(key) != value:
+                mismatches.append("{0}: {1} differs".format(case, key))
+
+    return mismatches
+
+
+def measure_throughput(size, repeat):
+    results = {}
+    megapixels = size*size/1000000
+    for name, image_format, palette_format in get_cases():
+        # The palette format hardly changes the speed
+        if image_format in IMAGE_FORMATS_THAT_USE_PALETTES and palette_format != PaletteFormat.RGB5A3:
+            continue
+
+        image = get_test_image(image_format, size, size)
+        times = time_call(lambda: encode_image(image, image_format, palette_format), repeat)
+        results[name+".encode"] = summarize(times, throughput=megapixels/min(times), unit="MP/s")
+
+        image_data, palette_data, encoded_colors = encode_image(image, image_format, palette_format)
+        image_data = image_data.getvalue()
+        palette_data = palette_data.getvalue()
+        times = time_call(lambda: decode_image(image_data, palette_data, image_format, palette_format,
+                                               len(encoded_colors), size, size), repeat)
+        results[name+".decode"] = summarize(times, throughput=megapixels/min(times), unit="MP/s")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check texture codec outputs against golden outputs and measure throughput.")
+    parser.add_argument("--update-golden", action="store_true",
+                        help="Save the current outputs as the new golden outputs instead of checking them.")
+    parser.add_argument("--skip-throughput", action="store_true", help="Only check the outputs.")
+    parser.add_argument("--size", type=int, default=256, help="Width and height of the images used for timing. Default: 256")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each benchmark. Default: 3")
+    parser.add_argument("--output", default=None,
+                        help="Where to save the results. Default: benchmarks/results/codec_<revision>_<time>.json")
+    parser.add_argument("--compare", default=None, help="Results of an earlier run to compare against.")
+
+    args = parser.parse_args()
+
+    outputs = compute_outputs()
+
+    if args.update_golden:
+        os.makedirs(os.path.dirname(GOLDEN_PATH), exist_ok=True)
+        with open(GOLDEN_PATH, "w") as f:
+            json.dump(outputs, f, indent=4, sort_keys=True)
+            f.write("\n")
+        print("Saved golden outputs of {0} cases to {1}".format(len(outputs), GOLDEN_PATH))
+        mismatches = []
+    else:
+        with open(GOLDEN_PATH, "r") as f:
+            golden = json.load(f)
+        mismatches = check_outputs(outputs, golden)
+        for mismatch in mismatches:
+            print("MISMATCH", mismatch)
+        print("{0} of {1} cases match the golden outputs".format(
+            len(outputs) - len(set(mismatch.split(":")[0] for mismatch in mismatches)), len(outputs)))
+
+    if not args.skip_throughput:
+        results = measure_throughput(args.size, args.repeat)
+        settings = dict(vars(args))
+        path = save_results("codec", run_info(settings), results, args.output)
+
+        baseline = load_results(args.compare) if args.compare is not None else None
+        print_results(results, baseline)
+        print("Saved results to", path)
+
+    if mismatches:
+        sys.exit(1)
@@ -0,0 +1,95 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+
+@contextlib.contextmanager
+def quiet():
+    # The tools log their progress through the bw loggers, which show nothing unless a script
+    # calls setup_logging. This only hides what is still printed directly, e.g. by massconvert
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def time_call(func, repeat, setup=None):
+    # Calls func repeat times and returns the time of each call in seconds.
+    # setup is called before every call and its result is passed to func, it isn't timed.
+    times = []
+    for i in range(repeat):
+        arg = setup() if setup is not None else None
+        with quiet():
+            start = time.perf_counter()
+            if setup is not None:
+                func(arg)
+            else:
+                func()
+            times.append(time.perf_counter() - start)
+
+    return times
+
+
+def summarize(times, **extra):
+    result = {"best": min(times), "mean": sum(times)/len(times), "runs": len(times)}
+    result.update(extra)
+    return result
+
+
+def git_revision():
+    try:
+        revision = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                           stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return revision.decode("ascii").strip()
+
+
+def run_info(settings):
+    return {"revision": git_revision(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": settings}
+
+
+def save_results(name, info, results, path=None):
+    # By default results are saved as benchmarks/results/<name>_<revision>_<time>.json
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, "{0}_{1}_{2}.json".format(
+            name, info["revision"] or "unknown", time.strftime("%Y%m%d-%H%M%S")))
+
+    with open(path, "w") as f:
+        json.dump({"info": info, "results": results}, f, indent=4)
+
+    return path
+
+
+def load_results(path):
+    with open(path, "r") as f:
+        return json.load(f)["results"]
+
+
+def print_results(results, baseline=None):
+    # results maps benchmark names to the output of summarize(). If baseline results are given,
+    # the speedup compared to them is printed as well.
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        line = "{0}  {1:10.4f}s best  {2:10.4f}s mean".format(name.ljust(width), result["best"], result["mean"])
+        if "throughput" in result:
+            line += "  {0:10.2f} {1}".format(result["throughput"], result["unit"])
+        if baseline is not None and name in baseline:
+            line += "  {0:6.2f}x".format(baseline[name]["best"]/result["best"])
+        print(line)
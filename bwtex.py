@@ -1,7 +1,13 @@
+import io
+import logging
+import os
 from math import log2
 from PIL import Image
 from lib.read_binary import *
 from lib.texture_utils import * 
+from lib.profiling import span
+
+log = logging.getLogger("bw.texture")
 
 PALLETE = b"PAL "
 MIP = b"MIP "
@@ -49,6 +55,13 @@ FORMAT = {
 }
 
 
+MIPMAP_FILTERS = {
+    "nearest": Image.NEAREST,
+    "box": Image.BOX,
+    "lanczos": Image.LANCZOS
+}
+
+
 # The statistically most used header values for each format
 FORMATDEFAULTSBW2 = {
     "DXT1": (4100, 255, 255, 1, 1024, 0),
@@ -72,9 +85,249 @@ def valuerange_assertion(val, start, end):
         raise RuntimeError("Value needs to be in range of {0} to {1} but is {2}.")
 
 
+def format_header_values(tex, mipcount):
+    # The header values as they are put into png names, read back by header_from_string
+    unkint7 = tex.unkint7 
+    if unkint7 == 0xFFFFFFFF:
+        unkint7 = -1
+    if mipcount > 1:
+        values = ["MipMap", tex.unkint2, tex.unkint3, tex.unkint4, tex.unkint5, tex.unkint6, unkint7]
+    else:
+        values = [tex.unkint2, tex.unkint3, tex.unkint4, tex.unkint5, tex.unkint6, unkint7]
+    
+    return ".".join(str(x) for x in values)
+
+
+class TextureHeader(object):
+    # Header values and section layout of a BW1/BW2 texture, as returned by read_header.
+    # Offsets are positions in the file the header was read from.
+    def __init__(self, name):
+        self.name = name 
+        
+        self.size_x = 0
+        self.size_y = 0
+        self.fmt = "DXT1"
+        self.unkint1 = 1
+        self.unkint2 = 0
+        self.unkint3 = 0
+        self.unkint4 = 0
+        self.unkint5 = 0
+        self.unkint6 = 0
+        self.unkint7 = 0
+        self.mipcount = 0
+        
+        self.palette_offset = None
+        self.palette_size = 0
+        self.mip_sections = [] # (offset, size) of the image data of each mipmap
+        self.end_offset = 0
+    
+    @property
+    def num_colors(self):
+        return self.palette_size//2  # Max 16 for P4 and max 256 for P8
+    
+    def mip_dimensions(self, level):
+        return max(self.size_x//(2**level), 1), max(self.size_y//(2**level), 1)
+    
+    def header_to_string(self):
+        return format_header_values(self, self.mipcount)
+    
+    def create_texture(self, cls):
+        tex = cls(self.name)
+        tex.fmt = self.fmt
+        tex.size_x = self.size_x
+        tex.size_y = self.size_y
+        tex.unkint1 = self.unkint1
+        tex.unkint2 = self.unkint2
+        tex.unkint3 = self.unkint3
+        tex.unkint4 = self.unkint4
+        tex.unkint5 = self.unkint5
+        tex.unkint6 = self.unkint6
+        tex.unkint7 = self.unkint7
+        return tex
+
+
+def read_texture_sections(f, header):
+    # Records the offset and size of the palette and mipmap sections that follow a texture header, skipping over their data.
+    section = read_id(f)
+    assert section in (MIP, PALLETE)
+    size = read_uint32_le(f)
+    
+    if header.fmt in ("P4", "P8"):
+        assert section == PALLETE
+        header.palette_offset = f.tell()
+        header.palette_size = size
+        f.seek(size, 1)
+        section = read_id(f)
+        size = read_uint32_le(f)
+        assert section == MIP
+    else:
+        assert section == MIP
+    
+    header.mip_sections.append((f.tell(), size))
+    f.seek(size, 1)
+    
+    if header.mipcount > 1:
+        assert log2(header.size_x) % 1 == 0 and log2(header.size_y) % 1 == 0
+    
+    for i in range(header.mipcount-1):
+        section = read_id(f)
+        size = read_uint32_le(f)
+        assert section == MIP
+        header.mip_sections.append((f.tell(), size))
+        f.seek(size, 1)
+    
+    header.end_offset = f.tell()
+
+
+def read_texture_mipmaps(f, header, tex, cache=True, decode_cache=None):
+    if header.palette_offset is not None:
+        f.seek(header.palette_offset)
+        palette = f.read(header.palette_size)
+    else:
+        palette = None 
+    
+    tex.mipmaps = LazyMipmaps(tex.fmt, palette, header.num_colors, cache=cache, decode_cache=decode_cache)
+    for i, (offset, size) in enumerate(header.mip_sections):
+        f.seek(offset)
+        imagedata = f.read(size)
+        mip_tex_x, mip_tex_y = header.mip_dimensions(i)
+        tex.mipmaps.append_encoded(imagedata, mip_tex_x, mip_tex_y)
+    
+    f.seek(header.end_offset)
+
+
+def generate_mipmaps(img, mipmap_filter="nearest"):
+    # Creates the smaller mipmap levels of a power of 2 image, halving the size each level.
+    # With the box and lanczos filters every level is downsampled from the level before it.
+    # Nearest neighbour sampling always samples the full size image, as chaining it would shift the sampled pixels further each level.
+    if mipmap_filter not in MIPMAP_FILTERS:
+        raise RuntimeError("Unknown mipmap filter: {0}. Needs to be one of {1}.".format(mipmap_filter, ", ".join(MIPMAP_FILTERS)))
+    resample = MIPMAP_FILTERS[mipmap_filter]
+    
+    if mipmap_filter != "nearest":
+        img = img.convert("RGBA")
+    
+    mipmaps = []
+    mipmap_count = int(log2(min(img.width, img.height)))
+    mipmap_width = img.width 
+    mipmap_height = img.height 
+    previous_image = img
+    
+    for i in range(1, mipmap_count):
+        mipmap_width //= 2
+        mipmap_height //= 2
+        if mipmap_filter == "nearest":
+            mipmap_image = img.resize((mipmap_width, mipmap_height), resample)
+        else:
+            mipmap_image = previous_image.resize((mipmap_width, mipmap_height), resample)
+        mipmaps.append(mipmap_image)
+        previous_image = mipmap_image
+    
+    return mipmaps
+
+
+def write_texture_sections(f, fmt, mipmaps, workers=None, executor=None):
+    # Encodes all mipmaps in one go with a shared palette and writes the palette and mipmap sections.
+    # With workers > 1 the encoding is spread over that many processes, see encode_mipmap_chain for executor.
+    with span("texture.encode."+fmt, "texture"):
+        mipmap_datas, palettedata, _ = encode_mipmap_chain(mipmaps, FORMAT[fmt], PaletteFormat.RGB5A3,
+                                                           workers=workers, executor=executor)
+    if fmt in ("P4", "P8"):
+        write_id(f, PALLETE)
+        write_uint32_le(f, 512)
+        f.write(palettedata.getbuffer())
+        f.write(b"\x00"*(512-len(palettedata.getbuffer())))
+    
+    for imgdata in mipmap_datas:
+        write_id(f, MIP)
+        write_uint32_le(f, len(imgdata.getbuffer()))
+        f.write(imgdata.getbuffer())
+
+
+class LazyMipmaps(object):
+    # List-like sequence of mipmap images which keeps the raw image data of each mipmap
+    # and only decodes it when the mipmap is first accessed.
+    # With cache=False a mipmap is decoded again on every access instead of being kept in memory.
+    # A DecodeCache (see lib/texture_cache.py) can be passed to share decoded mipmaps between textures with the same data.
+    def __init__(self, fmt, palette, num_colors, cache=True, decode_cache=None):
+        self.fmt = fmt
+        self.palette = palette
+        self.num_colors = num_colors
+        self.cache = cache
+        self.decode_cache = decode_cache
+        
+        self._images = []
+        self._rawdata = []
+        self._sizes = []
+    
+    def append_encoded(self, imagedata, width, height):
+        self._images.append(None)
+        self._rawdata.append(imagedata)
+        self._sizes.append((width, height))
+    
+    def append(self, image):
+        self._images.append(image)
+        self._rawdata.append(None)
+        self._sizes.append(image.size)
+    
+    def extend(self, images):
+        for image in images:
+            self.append(image)
+    
+    def is_decoded(self, level):
+        return self._images[level] is not None
+    
+    def get_rawdata(self, level):
+        # Raw encoded image data of a mipmap, or None if the mipmap was not read from a file.
+        return self._rawdata[level]
+    
+    def get_size(self, level):
+        return self._sizes[level]
+    
+    def _decode(self, level):
+        image = self._images[level]
+        if image is None:
+            width, height = self._sizes[level]
+            if self.decode_cache is not None:
+                key = self.decode_cache.make_key(self.fmt, self.palette, self.num_colors, self._rawdata[level], width, height)
+                image = self.decode_cache.get(key, width, height)
+            
+            if image is None:
+                with span("texture.decode."+self.fmt, "texture"):
+                    image = decode_image(
+                                self._rawdata[level], self.palette, FORMAT[self.fmt], PaletteFormat.RGB5A3, self.num_colors, 
+                                width, height
+                                )
+                if self.decode_cache is not None:
+                    self.decode_cache.put(key, image)
+            if self.cache:
+                self._images[level] = image
+        return image
+    
+    def __len__(self):
+        return len(self._images)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._decode(i) for i in range(*index.indices(len(self)))]
+        
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("mipmap index out of range")
+        return self._decode(index)
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._decode(i)
+
+
 class Texture(object):
     def __init__(self, name):
         self.name = name 
+    
+    def header_to_string(self):
+        return format_header_values(self, len(self.mipmaps))
         
     def dump_to_file(self, filepath):
         img = QImage(self.size_x, self.size_y, QImage.Format_ARGB32)
@@ -111,17 +364,6 @@ class BW2Texture(Texture):
         self.mipmaps = []
         #self.mipmaps_decoded = []
     
-    def header_to_string(self):
-        unkint7 = self.unkint7 
-        if unkint7 == 0xFFFFFFFF:
-            unkint7 = -1
-        if len(self.mipmaps) > 1:
-            values = ["MipMap", self.unkint2, self.unkint3, self.unkint4, self.unkint5, self.unkint6, unkint7]
-        else:
-            values = [self.unkint2, self.unkint3, self.unkint4, self.unkint5, self.unkint6, unkint7]
-        
-        return ".".join(str(x) for x in values)
-        
     def header_from_string(self, string):
         values = string.split(".")
         if len(values) == 0:
@@ -140,7 +382,7 @@ class BW2Texture(Texture):
         if values[0] in (4, 12, 20):
             valmap = {4: 4100, 12: 4108, 20: 4116}
             new = valmap[values[0]]
-            print("BW1 values detected. Changing", values[0], "to", new)
+            log.info("BW1 values detected. Changing %s to %s", values[0], new)
             values[0] = new
             
         if values[0] not in (4100, 4108, 4116): raise RuntimeError("Unknown value for value 1: {0}. Needs to be 4, 12 or 20.".format(values[0]))
@@ -160,7 +402,7 @@ class BW2Texture(Texture):
             self.unkint7 = 0xFFFFFFFF
             
     @classmethod
-    def from_path(cls, path, name, fmt, unkint2=None, unkint3=None, unkint4=None, unkint5=None, unkint6=None, unkint7=None, mipmaps=1, autogenmipmaps=False, mipmappaths = []):
+    def from_path(cls, path, name, fmt, unkint2=None, unkint3=None, unkint4=None, unkint5=None, unkint6=None, unkint7=None, mipmaps=1, autogenmipmaps=False, mipmappaths = [], mipmap_filter="nearest"):
         if unkint2 is None: unkint2 = FORMATDEFAULTSBW2[fmt][0]
         if unkint3 is None: unkint3 = FORMATDEFAULTSBW2[fmt][1]
         if unkint4 is None: unkint4 = FORMATDEFAULTSBW2[fmt][2]
@@ -178,29 +420,21 @@ class BW2Texture(Texture):
         tex.unkint5 = unkint5
         tex.unkint6 = unkint6
         tex.unkint7 = unkint7
-        img = Image.open(path)
+        # path can also be an image that was already opened
+        img = path if isinstance(path, Image.Image) else Image.open(path)
         tex.mipmaps.append(img)
         
         if autogenmipmaps:
             if log2(img.width) % 1 != 0 or log2(img.height) % 1 != 0:
-                print("Warning: Cannot generate mipmaps for non-power of 2 texture. Skipping mipmap generation.")
+                log.warning("Cannot generate mipmaps for non-power of 2 texture. Skipping mipmap generation.")
             else:
-                mipmap_count = int(log2(min(img.width, img.height)))
-                mipmap_width = img.width 
-                mipmap_height = img.height 
-                
-                for i in range(mipmap_count):
-                    if i != 0:
-                        mipmap_width //= 2
-                        mipmap_height //= 2
-                        mipmap_image = img.resize((mipmap_width, mipmap_height), Image.NEAREST)
-                        tex.mipmaps.append(mipmap_image)
+                tex.mipmaps.extend(generate_mipmaps(img, mipmap_filter))
         
         return tex
     
-    def write(self, f):
+    def write(self, f, workers=None, executor=None):
         start = f.tell()
-        print(self.name, len(self.name))
+        log.debug("Writing texture %s", self.name)
         assert len(self.name) <= 0x20-1
         f.write(self.name.encode("ascii"))
         f.write(b"\x00"*(0x20 - f.tell()))
@@ -227,121 +461,67 @@ class BW2Texture(Texture):
         write_uint32(f, mipcount)
         assert f.tell()-start == 0x70
         
-        imgdata, palettedata, _ = encode_image(image, FORMAT[self.fmt], PaletteFormat.RGB5A3, mipmap_count=1)
-        if self.fmt in ("P4", "P8"):
-            write_id(f, PALLETE)
-            write_uint32_le(f, 512)
-            f.write(palettedata.getbuffer())
-            f.write(b"\x00"*(512-len(palettedata.getbuffer())))
-        
-        write_id(f, MIP)
-        write_uint32_le(f, len(imgdata.getbuffer()))
-        f.write(imgdata.getbuffer())
-        
-        if len(self.mipmaps) > 1:
-            for mipmap in self.mipmaps[1:]:
-                imgdata, palettedata, _ = encode_image(mipmap, FORMAT[self.fmt], PaletteFormat.RGB5A3, mipmap_count=1)
-                write_id(f, MIP)
-                write_uint32_le(f, len(imgdata.getbuffer()))
-                f.write(imgdata.getbuffer())
+        write_texture_sections(f, self.fmt, self.mipmaps[:], workers=workers, executor=executor)
     
     @classmethod 
-    def from_file(cls, f):
-        #f.seek(0)
-        start = f.tell()
+    def read_header(cls, f):
+        # Parses the header and section layout of a texture without decoding any image data.
         name = f.read(0x20).rstrip(b"\x00").decode("ascii")
-        tex = cls(name)
+        header = TextureHeader(name)
         
         size_x2 = read_uint32(f)
         size_y2 = read_uint32(f)
-        tex.unkint1 = read_uint32(f)
-        assert tex.unkint1 == 1
-        tex.unkint2 = read_uint32(f) 
-        assert tex.unkint2 in (4100, 4108, 4116)
+        header.unkint1 = read_uint32(f)
+        assert header.unkint1 == 1
+        header.unkint2 = read_uint32(f) 
+        assert header.unkint2 in (4100, 4108, 4116)
         
         fmt = f.read(0x8)
         assert fmt in (DXT1, IA8, IA4, I8, I4, P8, P4, RGBA)
-        tex.fmt = FORMATTOSTR[fmt]
+        header.fmt = FORMATTOSTR[fmt]
         color_format = f.read(0x8)
         assert color_format == b"8B8G8R8A"
         
-        tex.unkint3 = read_uint32(f) 
-        assert tex.unkint3 <= 255
+        header.unkint3 = read_uint32(f) 
+        assert header.unkint3 <= 255
         
-        tex.unkint4 = read_uint32(f)
-        assert tex.unkint4 <= 255
+        header.unkint4 = read_uint32(f)
+        assert header.unkint4 <= 255
         
         
-        tex.unkint5 = read_uint32(f)
-        assert tex.unkint5 <= 255
+        header.unkint5 = read_uint32(f)
+        assert header.unkint5 <= 255
         
-        tex.unkint6 = read_uint32(f)
-        assert tex.unkint6 <= 1024
+        header.unkint6 = read_uint32(f)
+        assert header.unkint6 <= 1024
         
-        tex.unkint7 = read_uint32(f)
-        assert 0 <= tex.unkint7 <= 25 or tex.unkint7 == 0xFFFFFFFF
+        header.unkint7 = read_uint32(f)
+        assert 0 <= header.unkint7 <= 25 or header.unkint7 == 0xFFFFFFFF
         pad = f.read(12) # between 0 and 25, or 0xFFFFFFFF
         assert pad == b"\x00"*12
-        #tex.unkints = f.read(0x10)
         
         mipcount = read_uint32(f)
-        tex.size_x = read_uint32(f)
-        tex.size_y = read_uint32(f)
+        header.size_x = read_uint32(f)
+        header.size_y = read_uint32(f)
         mipcount2 = read_uint32(f)
         
-        assert tex.size_x == size_x2
-        assert tex.size_y == size_y2
+        assert header.size_x == size_x2
+        assert header.size_y == size_y2
         assert mipcount == mipcount2
         assert mipcount >= 1
+        header.mipcount = mipcount
         
-        section = read_id(f)
-        #print(section)
-        size = read_uint32_le(f)
-        #print(name, tex.format)
-        if tex.fmt in ("P4", "P8"):
-            print(tex.fmt, section)
-            print(tex.name)
-            assert section == PALLETE
-            palette = BytesIO(f.read(size))
-            num_colors = len(palette.getbuffer())//2  # Max 16 for P4 and max 256 for P8
-            section = read_id(f)
-            size = read_uint32_le(f)
-            assert section == MIP
-        else:
-            palette = None 
-            num_colors = 0
-            assert section == MIP
-        
-        #tex.mipmaps.append(f.read(size))
-        print(section, hex(size))
-        print(hex(f.tell()))
-        imagedata = BytesIO(f.read(size)+b"\x00"*256*256)
-        
-        #assert size == len(imagedata.getbuffer())
-        print(FORMAT[tex.fmt], hex(size), tex.size_x, tex.size_y)
-        mip = decode_image(
-                        imagedata, palette, FORMAT[tex.fmt], PaletteFormat.RGB5A3, num_colors, 
-                        tex.size_x, tex.size_y
-                        )
-        
-        tex.mipmaps.append(mip)
-        
-        if mipcount > 1:
-            assert log2(tex.size_x) % 1 == 0 and log2(tex.size_y) % 1 == 0
-        
-        for i in range(mipcount-1):
-            section = read_id(f)
-            size = read_uint32_le(f)
-            assert section == MIP
-            imagedata = BytesIO(f.read(size)+b"\x00"*256*256)
-            mip_tex_x = max(tex.size_x//(2**(i+1)), 1)
-            mip_tex_y = max(tex.size_y//(2**(i+1)), 1)
-            #print(tex.size_x, mip_tex_x, tex.size_y, mip_tex_y)
-            mip = decode_image(
-                        imagedata, palette, FORMAT[tex.fmt], PaletteFormat.RGB5A3, num_colors, 
-                        mip_tex_x, mip_tex_y
-                        )
-            tex.mipmaps.append(mip)
+        read_texture_sections(f, header)
+        return header
+    
+    @classmethod 
+    def from_file(cls, f, cache_mipmaps=True, decode_cache=None):
+        # Mipmaps are decoded on first access, see LazyMipmaps.
+        header = cls.read_header(f)
+        tex = header.create_texture(cls)
+        log.debug("Read texture %s: %s %sx%s", tex.name, tex.fmt, tex.size_x, tex.size_y)
+        
+        read_texture_mipmaps(f, header, tex, cache=cache_mipmaps, decode_cache=decode_cache)
         return tex 
         
         
@@ -365,17 +545,6 @@ class BW1Texture(Texture):
         self.mipmaps = []
         #self.mipmaps_decoded = []
     
-    def header_to_string(self):
-        unkint7 = self.unkint7 
-        if unkint7 == 0xFFFFFFFF:
-            unkint7 = -1
-        if len(self.mipmaps) > 1:
-            values = ["MipMap", self.unkint2, self.unkint3, self.unkint4, self.unkint5, self.unkint6, unkint7]
-        else:
-            values = [self.unkint2, self.unkint3, self.unkint4, self.unkint5, self.unkint6, unkint7]
-        
-        return ".".join(str(x) for x in values)
-    
     def header_from_string(self, string):
         values = string.split(".")
         if len(values) == 0:
@@ -395,7 +564,7 @@ class BW1Texture(Texture):
         if values[0] in (4100, 4108, 4116):
             valmap = {4100: 4, 4108: 12, 4116: 20}
             new = valmap[values[0]]
-            print("BW2 values detected. Changing", values[0], "to", new)
+            log.info("BW2 values detected. Changing %s to %s", values[0], new)
             values[0] = new
             
         if values[0] not in (4, 12, 20): raise RuntimeError("Unknown value for value 1: {0}. Needs to be 4, 12 or 20.".format(values[0]))
@@ -416,7 +585,7 @@ class BW1Texture(Texture):
        
             
     @classmethod
-    def from_path(cls, path, name, fmt, unkint2=None, unkint3=None, unkint4=None, unkint5=None, unkint6=None, unkint7=None, mipmaps=1, autogenmipmaps=False, mipmappaths = []):
+    def from_path(cls, path, name, fmt, unkint2=None, unkint3=None, unkint4=None, unkint5=None, unkint6=None, unkint7=None, mipmaps=1, autogenmipmaps=False, mipmappaths = [], mipmap_filter="nearest"):
         if unkint2 is None: unkint2 = FORMATDEFAULTSBW1[fmt][0]
         if unkint3 is None: unkint3 = FORMATDEFAULTSBW1[fmt][1]
         if unkint4 is None: unkint4 = FORMATDEFAULTSBW1[fmt][2]
@@ -434,28 +603,20 @@ class BW1Texture(Texture):
         tex.unkint5 = unkint5
         tex.unkint6 = unkint6
         tex.unkint7 = unkint7
-        img = Image.open(path)
+        # path can also be an image that was already opened
+        img = path if isinstance(path, Image.Image) else Image.open(path)
         tex.mipmaps.append(img)
         
         if autogenmipmaps:
             if log2(img.width) % 1 != 0 or log2(img.height) % 1 != 0:
-                print("Warning: Cannot generate mipmaps for non-power of 2 texture. Skipping mipmap generation.")
+                log.warning("Cannot generate mipmaps for non-power of 2 texture. Skipping mipmap generation.")
             else:
-                mipmap_count = int(log2(min(img.width, img.height)))
-                mipmap_width = img.width 
-                mipmap_height = img.height 
-                
-                for i in range(mipmap_count):
-                    if i != 0:
-                        mipmap_width //= 2
-                        mipmap_height //= 2
-                        mipmap_image = img.resize((mipmap_width, mipmap_height), Image.NEAREST)
-                        tex.mipmaps.append(mipmap_image)
+                tex.mipmaps.extend(generate_mipmaps(img, mipmap_filter))
         return tex
     
-    def write(self, f):
+    def write(self, f, workers=None, executor=None):
         start = f.tell()
-        print(self.name, len(self.name))
+        log.debug("Writing texture %s", self.name)
         assert len(self.name) <= 0x10
         f.write(self.name.encode("ascii"))
         f.write(b"\x00"*(0x10 - len(self.name)))
@@ -480,105 +641,139 @@ class BW1Texture(Texture):
         write_uint32_le(f, mipcount)
         assert f.tell()-start == 0x54
         
-        imgdata, palettedata, _ = encode_image(image, FORMAT[self.fmt], PaletteFormat.RGB5A3, mipmap_count=1)
-        if self.fmt in ("P4", "P8"):
-            write_id(f, PALLETE)
-            write_uint32_le(f, 512)
-            f.write(palettedata.getbuffer())
-            f.write(b"\x00"*(512-len(palettedata.getbuffer())))
-        
-        write_id(f, MIP)
-        write_uint32_le(f, len(imgdata.getbuffer()))
-        f.write(imgdata.getbuffer())
-        
-        if len(self.mipmaps) > 1:
-            for mipmap in self.mipmaps[1:]:
-                imgdata, palettedata, _ = encode_image(mipmap, FORMAT[self.fmt], PaletteFormat.RGB5A3, mipmap_count=1)
-                write_id(f, MIP)
-                write_uint32_le(f, len(imgdata.getbuffer()))
-                f.write(imgdata.getbuffer())
+        write_texture_sections(f, self.fmt, self.mipmaps[:], workers=workers, executor=executor)
                 
     @classmethod 
-    def from_file(cls, f):
+    def read_header(cls, f):
+        # Parses the header and section layout of a texture without decoding any image data.
         name = f.read(0x10).rstrip(b"\x00").decode("ascii")
-        tex = cls(name)
+        header = TextureHeader(name)
         assert len(name) <= 0x10
-        tex.size_x = read_uint32_le(f)
-        tex.size_y = read_uint32_le(f)
+        header.size_x = read_uint32_le(f)
+        header.size_y = read_uint32_le(f)
 
-        tex.unkint1 = read_uint32_le(f)
-        assert tex.unkint1 == 1
-        tex.unkint2 = read_uint32_le(f)
-        assert tex.unkint2 in (4, 12, 20)
+        header.unkint1 = read_uint32_le(f)
+        assert header.unkint1 == 1
+        header.unkint2 = read_uint32_le(f)
+        assert header.unkint2 in (4, 12, 20)
         
         fmt = bytes(reversed(f.read(0x8)))
         assert fmt in FORMATTOSTR
-        tex.fmt = FORMATTOSTR[fmt]
+        header.fmt = FORMATTOSTR[fmt]
         
         outputformat = f.read(0x8)
         assert outputformat == b"A8R8G8B8"
-        tex.unkint3 = read_uint32_le(f)
-        tex.unkint4 = read_uint32_le(f)
-        tex.unkint5 = read_uint32_le(f)
-        tex.unkint6 = read_uint32_le(f)
-        tex.unkint7 = read_uint32_le(f)
-        
-        assert tex.unkint3 <= 255 
-        assert tex.unkint4 <= 255
-        assert tex.unkint5 <= 255
-        assert tex.unkint6 <= 1024 
-        assert tex.unkint7 == 0xFFFFFFFF or 0 <= tex.unkint7 <= 25  # Only values up to 11 have been seen, using BW2 as limit
+        header.unkint3 = read_uint32_le(f)
+        header.unkint4 = read_uint32_le(f)
+        header.unkint5 = read_uint32_le(f)
+        header.unkint6 = read_uint32_le(f)
+        header.unkint7 = read_uint32_le(f)
+        
+        assert header.unkint3 <= 255 
+        assert header.unkint4 <= 255
+        assert header.unkint5 <= 255
+        assert header.unkint6 <= 1024 
+        assert header.unkint7 == 0xFFFFFFFF or 0 <= header.unkint7 <= 25  # Only values up to 11 have been seen, using BW2 as limit
         
         pad = f.read(0xC)
         assert pad == b"\x00"*0xC
-        mipcount = read_uint32_le(f)
-        print(mipcount,"mips")
-        section = read_id(f)
-        assert section in (MIP, PALLETE)
-        #print(section)
-        size = read_uint32_le(f)
-        #print(name, tex.format)
-        
-        if tex.fmt in ("P4", "P8"):
-            assert section == PALLETE
-            palette = BytesIO(f.read(size))
-            num_colors = len(palette.getbuffer())//2  # Max 16 for P4 and max 256 for P8
-            section = read_id(f)
-            size = read_uint32_le(f)
-            assert section == MIP
+        header.mipcount = read_uint32_le(f)
+        
+        read_texture_sections(f, header)
+        return header
+    
+    @classmethod 
+    def from_file(cls, f, cache_mipmaps=True, decode_cache=None):
+        # Mipmaps are decoded on first access, see LazyMipmaps.
+        header = cls.read_header(f)
+        tex = header.create_texture(cls)
+        log.debug("Read texture %s: %s %sx%s, %s mipmaps", tex.name, tex.fmt, tex.size_x, tex.size_y, header.mipcount)
+        
+        read_texture_mipmaps(f, header, tex, cache=cache_mipmaps, decode_cache=decode_cache)
+        return tex
+
+
+TEXTURE_CLASSES = {
+    "bw1": BW1Texture,
+    "bw2": BW2Texture
+}
+
+
+# Conversion between .texture files and PNGs, used by conv.py, massconvert.py and the GUI.
+# PNGs are named name.FORMAT.headervalues.png so that converting them back keeps format and header values.
+def png_path_for_texture(texture_path, tex):
+    return texture_path.replace(".texture", "")+"."+tex.fmt+"."+tex.header_to_string()+".png"
+
+
+def parse_png_name(path, fmt=None):
+    # Returns texture name, format, header values and whether mipmaps should be generated.
+    # fmt overrides the format from the file name. Unknown formats fall back to DXT1.
+    settings = os.path.basename(path).split(".")
+    name = settings.pop(0)
+    
+    if fmt is None:
+        if len(settings) > 2:
+            fmt = settings.pop(0)
+            if fmt not in STRTOFORMAT:
+                fmt = "DXT1"
         else:
-            palette = None 
-            num_colors = 0
-            assert section == MIP
- 
-        #tex.mipmaps.append(f.read(size))
-        print(section, hex(size))
-        print(hex(f.tell()))
-        imagedata = BytesIO(f.read(size)+b"\x00"*256*256)
-        
-        #assert size == len(imagedata.getbuffer())
-        #print(FORMAT[tex.fmt], hex(size), tex.size_x, tex.size_y)
-        mip = decode_image(
-                        imagedata, palette, FORMAT[tex.fmt], PaletteFormat.RGB5A3, num_colors, 
-                        tex.size_x, tex.size_y
-                        )
-        
-        tex.mipmaps.append(mip)
-        
-        if mipcount > 1:
-            assert log2(tex.size_x) % 1 == 0 and log2(tex.size_y) % 1 == 0
-        
-        for i in range(mipcount-1):
-            section = read_id(f)
-            size = read_uint32_le(f)
-            assert section == MIP
-            imagedata = BytesIO(f.read(size)+b"\x00"*256*256)
-            mip_tex_x = max(tex.size_x//(2**(i+1)), 1)
-            mip_tex_y = max(tex.size_y//(2**(i+1)), 1)
-            #print(tex.size_x, mip_tex_x, tex.size_y, mip_tex_y)
-            mip = decode_image(
-                        imagedata, palette, FORMAT[tex.fmt], PaletteFormat.RGB5A3, num_colors, 
-                        mip_tex_x, mip_tex_y
-                        )
-            tex.mipmaps.append(mip)
-        return tex
\ No newline at end of file
+            fmt = "DXT1"
+    
+    if len(settings) > 1:
+        gen_mipmap = settings[0].lower() == "mipmap"
+    else:
+        gen_mipmap = False
+    
+    return name, fmt, ".".join(settings), gen_mipmap
+
+
+def convert_texture_to_png(in_path, game, out_path=None, decode_cache=None):
+    with open(in_path, "rb") as f:
+        tex = TEXTURE_CLASSES[game].from_file(f, decode_cache=decode_cache)
+    log.info("Texture format: %s", tex.fmt)
+    
+    if out_path is None:
+        out_path = png_path_for_texture(in_path, tex)
+    tex.mipmaps[0].save(out_path)
+    return out_path
+
+
+def encode_png_texture(in_path, game, fmt=None, mipmap_filter="nearest", workers=None, encode_cache=None,
+                       executor=None):
+    # Returns the data of the .texture file for a PNG named like png_path_for_texture names them.
+    # encode_cache is an EncodeCache from lib.texture_cache, or None to always encode
+    name, fmt, settings, gen_mipmap = parse_png_name(in_path, fmt)
+    
+    # The PNG is only decoded once, for the cache key and the encoder
+    img = Image.open(in_path)
+    img.load()
+    
+    if encode_cache is not None:
+        cache_key = encode_cache.make_key(img, game, name, fmt, settings, gen_mipmap, mipmap_filter)
+        texdata = encode_cache.get(cache_key)
+        if texdata is not None:
+            log.info("Using cached texture for %s", in_path)
+            return texdata
+    
+    log.info("Converting to format %s", fmt)
+    tex = TEXTURE_CLASSES[game].from_path(path=img, name=name, fmt=fmt, autogenmipmaps=gen_mipmap,
+                                          mipmap_filter=mipmap_filter)
+    tex.header_from_string(settings)
+    
+    f = io.BytesIO()
+    tex.write(f, workers=workers, executor=executor)
+    texdata = f.getvalue()
+    if encode_cache is not None:
+        encode_cache.put(cache_key, texdata)
+    return texdata
+
+
+def convert_png_to_texture(in_path, game, out_path=None, fmt=None, mipmap_filter="nearest", workers=None,
+                           encode_cache=None, executor=None):
+    texdata = encode_png_texture(in_path, game, fmt, mipmap_filter, workers, encode_cache, executor)
+    if out_path is None:
+        out_path = in_path+".texture"
+    
+    with open(out_path, "wb") as f:
+        f.write(texdata)
+    return out_path
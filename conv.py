@@ -1,11 +1,15 @@
 import argparse
+import multiprocessing
 import sys 
 import os 
 import bwtex 
+from lib.texture_cache import EncodeCache, DecodeCache
+from lib import profiling
+from lib import logging_setup
 
 
 if __name__ == "__main__":
-    
+    multiprocessing.freeze_support()
 
     parser = argparse.ArgumentParser()
     parser.add_argument("input",
@@ -14,66 +18,54 @@ if __name__ == "__main__":
                         action='store_true')
     parser.add_argument('--bw2',
                         action='store_true')
+    parser.add_argument('--info',
+                        action='store_true',
+                        help="Print the header values of a .texture file without converting it.")
     parser.add_argument("-f", "--format", default=None, 
                         help=("Format of new BW1/BW2 texture. Default: DXT1 \n"
                                 "For BW1: One of DXT1, P8, RGBA.\n" 
                                 "For BW2: One of DXT1, P4, P8, I4, I8, IA4, IA8, RGBA"))
+    parser.add_argument("--mipmap-filter", default="nearest",
+                        choices=list(bwtex.MIPMAP_FILTERS),
+                        help=("Filter used for downsampling generated mipmaps. Default: nearest"))
+    parser.add_argument("-j", "--jobs", default=1, type=int,
+                        help=("Number of processes used for encoding the texture. 0 uses all cores. Default: 1"))
+    parser.add_argument("--no-cache", action="store_true",
+                        help=("Always encode or decode the texture instead of reusing the result of an earlier identical conversion."))
+    parser.add_argument("--disk-cache", action="store_true",
+                        help=("Also keep decoded textures in the cache folder so later conversions of the same texture can reuse them."))
     parser.add_argument("output", default=None, nargs = '?',
                         help=("Path to output") )
 
+    profiling.add_arguments(parser)
+    logging_setup.add_arguments(parser)
+
     args = parser.parse_args()
+    logging_setup.setup_logging(args.debug)
+    profiling.start_from_arguments(args)
     assert (args.bw1 or args.bw2) and not (args.bw1 and args.bw2)
     #in_path = sys.argv[1]
     in_path = args.input 
+    game = "bw1" if args.bw1 else "bw2"
     
-    if in_path.endswith(".texture"):
+    if in_path.endswith(".texture") and args.info:
         with open(in_path, "rb") as f:
             if args.bw1:
-                tex = bwtex.BW1Texture.from_file(f)  
+                header = bwtex.BW1Texture.read_header(f)
             else:
-                tex = bwtex.BW2Texture.from_file(f)  
-        print("Texture format:", tex.fmt)
-        if args.output is not None:
-            outpath = args.output 
-        else:
-            settings = tex.header_to_string()
-            outpath = in_path.replace(".texture", "")+"."+tex.fmt+"."+settings+".png"
-        tex.mipmaps[0].save(outpath)
-        """if len(tex.mipmaps) > 1:
-            print("saved mipmap")
-            for i, mip in enumerate(tex.mipmaps[1:]):
-                mip.save(in_path+".mip{0}".format(i)+".png")"""
+                header = bwtex.BW2Texture.read_header(f)
+        print("Name:", header.name)
+        print("Texture format:", header.fmt)
+        print("Size: {0}x{1}".format(header.size_x, header.size_y))
+        print("Mipmaps:", header.mipcount)
+        print("Header values:", header.header_to_string())
+    elif in_path.endswith(".texture"):
+        decode_cache = None if args.no_cache else DecodeCache(use_disk=args.disk_cache)
+        bwtex.convert_texture_to_png(in_path, game, args.output, decode_cache=decode_cache)
     else:
-        settings = os.path.basename(in_path).split(".")
-        name = settings.pop(0)
-        
-        if args.format is None:
-            if len(settings) > 2:
-                fmt = settings.pop(0)
-                if fmt not in bwtex.STRTOFORMAT:
-                    fmt = "DXT1"
-            else:
-                fmt = "DXT1"
-        else:
-            fmt = args.format
-        
-        if len(settings) > 1:
-            gen_mipmap = settings[0].lower() == "mipmap"
-        else:
-            gen_mipmap = False
-        
-        print("Converting to format", fmt)
-        if args.bw1:
-            tex = bwtex.BW1Texture.from_path(path=in_path, name=name, fmt=fmt, autogenmipmaps=gen_mipmap)
-        else:
-            tex = bwtex.BW2Texture.from_path(path=in_path, name=name, fmt=fmt, autogenmipmaps=gen_mipmap)
-        
-        tex.header_from_string(".".join(settings))
-        
-        if args.output is None:
-            outpath = in_path+".texture"
-        else:
-            outpath = args.output
-        
-        with open(outpath, "wb") as f:
-            tex.write(f)
\ No newline at end of file
+        encode_cache = None if args.no_cache else EncodeCache()
+        bwtex.convert_png_to_texture(in_path, game, args.output, fmt=args.format,
+                                     mipmap_filter=args.mipmap_filter, workers=args.jobs or os.cpu_count(),
+                                     encode_cache=encode_cache)
+    
+    profiling.finish_from_arguments(args)
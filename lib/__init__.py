@@ -1 +1,7 @@
+import logging
+
 __author__ = 'User'
+
+# Library code stays silent unless a script configures logging, see logging_setup.py
+logging.getLogger("bw").addHandler(logging.NullHandler())
+
@@ -48,57 +48,65 @@ class BTI:
     self.palette_data = BytesIO(read_bytes(data, header_offset+self.palette_data_offset, palette_data_size))
   
   def read_header(self, data, header_offset=0):
-    self.image_format = ImageFormat(read_u8(data, header_offset+0))
+    with get_buffer(data) as buffer:
+      self.read_header_from_buffer(buffer, header_offset=header_offset)
+  
+  def read_header_from_buffer(self, buffer, header_offset=0):
+    self.image_format = ImageFormat(unpack_u8(buffer, header_offset+0))
     
-    self.alpha_setting = read_u8(data, header_offset+1)
-    self.width = read_u16(data, header_offset+2)
-    self.height = read_u16(data, header_offset+4)
+    self.alpha_setting = unpack_u8(buffer, header_offset+1)
+    self.width = unpack_u16(buffer, header_offset+2)
+    self.height = unpack_u16(buffer, header_offset+4)
     
-    self.wrap_s = WrapMode(read_u8(data, header_offset+6))
-    self.wrap_t = WrapMode(read_u8(data, header_offset+7))
+    self.wrap_s = WrapMode(unpack_u8(buffer, header_offset+6))
+    self.wrap_t = WrapMode(unpack_u8(buffer, header_offset+7))
     
-    self.palettes_enabled = bool(read_u8(data, header_offset+8))
-    self.palette_format = PaletteFormat(read_u8(data, header_offset+9))
-    self.num_colors = read_u16(data, header_offset+0xA)
-    self.palette_data_offset = read_u32(data, header_offset+0xC)
+    self.palettes_enabled = bool(unpack_u8(buffer, header_offset+8))
+    self.palette_format = PaletteFormat(unpack_u8(buffer, header_offset+9))
+    self.num_colors = unpack_u16(buffer, header_offset+0xA)
+    self.palette_data_offset = unpack_u32(buffer, header_offset+0xC)
     
-    self.min_filter = FilterMode(read_u8(data, header_offset+0x14))
-    self.mag_filter = FilterMode(read_u8(data, header_offset+0x15))
+    self.min_filter = FilterMode(unpack_u8(buffer, header_offset+0x14))
+    self.mag_filter = FilterMode(unpack_u8(buffer, header_offset+0x15))
     
-    self.min_lod = read_u8(data, header_offset+0x16)
-    self.max_lod = read_u8(data, header_offset+0x17) # seems to be equal to (mipmap_count-1)*8
-    self.mipmap_count = read_u8(data, header_offset+0x18)
-    self.unknown_3 = read_u8(data, header_offset+0x19)
-    self.lod_bias = read_u16(data, header_offset+0x1A)
+    self.min_lod = unpack_u8(buffer, header_offset+0x16)
+    self.max_lod = unpack_u8(buffer, header_offset+0x17) # seems to be equal to (mipmap_count-1)*8
+    self.mipmap_count = unpack_u8(buffer, header_offset+0x18)
+    self.unknown_3 = unpack_u8(buffer, header_offset+0x19)
+    self.lod_bias = unpack_u16(buffer, header_offset+0x1A)
     
-    self.image_data_offset = read_u32(data, header_offset+0x1C)
+    self.image_data_offset = unpack_u32(buffer, header_offset+0x1C)
   
   def save_header_changes(self):
-    write_u8(self.data, self.header_offset+0, self.image_format.value)
+    with get_buffer(self.data) as buffer:
+      self.save_header_changes_to_buffer(buffer)
+  
+  def save_header_changes_to_buffer(self, buffer):
+    pack_into_u8(buffer, self.header_offset+0, self.image_format.value)
     
-    write_u8(self.data, self.header_offset+1, self.alpha_setting)
-    write_u16(self.data, self.header_offset+2, self.width)
-    write_u16(self.data, self.header_offset+4, self.height)
+    pack_into_u8(buffer, self.header_offset+1, self.alpha_setting)
+    pack_into_u16(buffer, self.header_offset+2, self.width)
+    pack_into_u16(buffer, self.header_offset+4, self.height)
     
-    write_u8(self.data, self.header_offset+6, self.wrap_s.value)
-    write_u8(self.data, self.header_offset+7, self.wrap_t.value)
+    pack_into_u8(buffer, self.header_offset+6, self.wrap_s.value)
+    pack_into_u8(buffer, self.header_offset+7, self.wrap_t.value)
     
     self.palettes_enabled = self.needs_palettes()
-    write_u8(self.data, self.header_offset+8, int(self.palettes_enabled))
-    write_u8(self.data, self.header_offset+9, self.palette_format.value)
-    write_u16(self.data, self.header_offset+0xA, self.num_colors)
-    write_u32(self.data, self.header_offset+0xC, self.palette_data_offset)
+    pack_into_u8(buffer, self.header_offset+8, int(self.palettes_enabled))
+    pack_into_u8(buffer, self.header_offset+9, self.palette_format.value)
+    pack_into_u16(buffer, self.header_offset+0xA, self.num_colors)
+    pack_into_u32(buffer, self.header_offset+0xC, self.palette_data_offset)
     
-    write_u8(self.data, self.header_offset+0x14, self.min_filter.value)
-    write_u8(self.data, self.header_offset+0x15, self.mag_filter.value)
+    pack_into_u8(buffer, self.header_offset+0x14, self.min_filter.value)
+    pack_into_u8(buffer, self.header_offset+0x15, self.mag_filter.value)
     
-    write_u8(self.data, self.header_offset+0x16, self.min_lod)
-    write_u8(self.data, self.header_offset+0x17, self.max_lod)
-    write_u8(self.data, self.header_offset+0x18, self.mipmap_count)
-    write_u8(self.data, self.header_offset+0x19, self.unknown_3)
-    write_u16(self.data, self.header_offset+0x1A, self.lod_bias)
+    pack_into_u8(buffer, self.header_offset+0x16, self.min_lod)
+    pack_into_u8(buffer, self.header_offset+0x17, self.max_lod)
+    pack_into_u8(buffer, self.header_offset+0x18, self.mipmap_count)
+    pack_into_u8(buffer, self.header_offset+0x19, self.unknown_3)
+    pack_into_u16(buffer, self.header_offset+0x1A, self.lod_bias)
     
-    write_u32(self.data, self.header_offset+0x1C, self.image_data_offset)
+    pack_into_u32(buffer, self.header_offset+0x1C, self.image_data_offset)
   
   @property
   def block_width(self):
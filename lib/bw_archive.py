@@ -1,14 +1,20 @@
 
 import io
+import logging
 import struct
 
 
 from .helper import unpack_uint32
 from .bw_archive_base import BWArchiveBase, BWSection, BWResource
+from .profiling import span
+
+log = logging.getLogger("bw.archive")
 
 
 
 class ArchiveHeader(BWSection):
+    __slots__ = ("filename",)
+
     def __init__(self, name, size, memview):
         assert name == b"RXET"
         strlength = unpack_uint32(memview, offset=0)
@@ -35,6 +41,8 @@ class ArchiveHeader(BWSection):
 
 
 class TextureSection(BWSection):
+    __slots__ = ()
+
     def __init__(self, name, size, memview):
         assert name == b"FTBX"
         super().__init__(name, size, memview, section_offset=4)
@@ -48,6 +56,8 @@ class TextureSection(BWSection):
 
 
 class TextureSectionBW2(BWSection):
+    __slots__ = ()
+
     def __init__(self, name, size, memview):
         assert name == b"FTBG"
         super().__init__(name, size, memview, section_offset=4)
@@ -61,6 +71,8 @@ class TextureSectionBW2(BWSection):
 
 
 class TextureEntry(BWSection):
+    __slots__ = ("res_name", "width", "height", "unknown1", "unknown2", "tex_type", "draw_type", "unknowns")
+
     def __init__(self, name, size, memview):
         assert name == b"TXET"
 
@@ -107,6 +119,8 @@ class TextureEntry(BWSection):
 
 
 class TextureEntryBW2(BWResource):
+    __slots__ = ("res_name",)
+
     def __init__(self, name, size, memview):
         assert name == b"DXTG"
 
@@ -127,6 +141,8 @@ class TextureEntryBW2(BWResource):
 """
 
 class SoundSection(BWSection):
+    __slots__ = ("filename",)
+
     def __init__(self, name, size, memview):
         assert name == b"DNOS"
         strlength = unpack_uint32(memview, offset=0)
@@ -154,6 +170,8 @@ class SoundSection(BWSection):
 
 
 class SoundCount(BWSection):
+    __slots__ = ("count",)
+
     def __init__(self, name, size, memview):
         assert name == b"HFSB"
         super().__init__(name, size, memview, section_offset=4)
@@ -167,6 +185,8 @@ class SoundCount(BWSection):
 
 
 class SoundName(BWSection):
+    __slots__ = ("res_name",)
+
     def __init__(self, name, size, memview):
         assert name == b"HPSD"
         super().__init__(name, size, memview, section_offset=0x20)
@@ -180,6 +200,8 @@ class SoundName(BWSection):
 
 
 class ParticleEntry(BWResource):
+    __slots__ = ("res_name", "particle_data")
+
     def __init__(self, name, size, memview):
         assert name == b"FEQT"
         super().__init__(name, size, memview)
@@ -200,6 +222,8 @@ class ParticleEntry(BWResource):
 
 
 class AnimationEntry(BWResource):
+    __slots__ = ("res_name", "animation_data")
+
     def __init__(self, name, size, memview):
         assert name == b"MINA"
         super().__init__(name, size, memview)
@@ -222,6 +246,8 @@ class AnimationEntry(BWResource):
 
 
 class ModelSection(BWSection):
+    __slots__ = ("res_name",)
+
     def __init__(self, name, size, memview):
         assert name == b"LDOM"
         strlength = unpack_uint32(memview, 0)
@@ -250,6 +276,8 @@ class ModelSubsection(BWSection):
 """
 
 class ScriptEntry(BWResource):
+    __slots__ = ("res_name", "script_data")
+
     def __init__(self, name, size, memview):
         super().__init__(name, size, memview)
         strlength = unpack_uint32(self._data, 0)
@@ -268,58 +296,63 @@ class ScriptEntry(BWResource):
 
 
 class BWArchive(BWArchiveBase):
+    __slots__ = ("rxet", "ftb", "dnos", "hfsb", "sounds", "models", "animations", "effects", "scripts", "textures")
+
     def __init__(self, f):
         super().__init__(f)
 
         is_bw1 = True
 
-        # Unpack RXET into an object containing other resources
-        assert self.entries[0].name == b"RXET"
-        self.entries[0] = self.rxet = self.entries[0].as_section(cls=ArchiveHeader)
-        assert len(self.rxet.entries) == 1
-
-        assert self.rxet.entries[0].name in (b"FTBX", b"FTBG")
-        is_bw1 = (self.rxet.entries[0].name == b"FTBX")
+        with span("archive.parse.textures", "archive"):
+            # Unpack RXET into an object containing other resources
+            assert self.entries[0].name == b"RXET"
+            self.entries[0] = self.rxet = self.entries[0].as_section(cls=ArchiveHeader)
+            assert len(self.rxet.entries) == 1
 
-        if is_bw1:
-            self.rxet.entries[0] = self.ftb = self.rxet.entries[0].as_section(cls=TextureSection)
-        else:
-            self.rxet.entries[0] = self.ftb = self.rxet.entries[0].as_section(cls=TextureSectionBW2)
+            assert self.rxet.entries[0].name in (b"FTBX", b"FTBG")
+            is_bw1 = (self.rxet.entries[0].name == b"FTBX")
 
-        for i in range(len(self.ftb.entries)):
             if is_bw1:
-                self.ftb.entries[i] = self.ftb.entries[i].as_section(cls=TextureEntry)
+                self.rxet.entries[0] = self.ftb = self.rxet.entries[0].as_section(cls=TextureSection)
             else:
-                self.ftb.entries[i] = self.ftb.entries[i].as_section(cls=TextureEntryBW2)
-            #else:
-            #    raise RuntimeError("Unknown image entry name:", self.ftb.entries[i].name)
-
-        assert self.entries[1].name == b"DNOS"
-        self.entries[1] = self.dnos = self.entries[1].as_section(cls=SoundSection)
-
-        assert self.dnos.entries[0].name == b"HFSB"
-        self.dnos.entries[0] = self.hfsb = self.dnos.entries[0].as_section(cls=SoundCount)
-        print(self.hfsb.count, len(self.dnos.entries))
-        for i in range(1, len(self.dnos.entries)):
-            assert self.dnos.entries[i].name in (b"HPSD", b"DPSD")
-
-            if self.dnos.entries[i].name == b"HPSD":
-                assert self.dnos.entries[i+1].name == b"DPSD"
-                self.dnos.entries[i] = self.dnos.entries[i].as_section(cls=SoundName)
-
-        for i, entry in enumerate(self.entries):
-            if entry.name == b"FEQT":
-                self.entries[i] = self.entries[i].as_section(cls=ParticleEntry)
-                print(entry.name, bytes(self.entries[i].res_name))
-            elif entry.name == b"MINA":
-                self.entries[i] = self.entries[i].as_section(cls=AnimationEntry)
-                print(entry.name, bytes(self.entries[i].res_name))
-            elif entry.name == b"LDOM":
-                self.entries[i] = self.entries[i].as_section(cls=ModelSection)
-                print(entry.name, bytes(self.entries[i].res_name))
-            elif entry.name == b"PRCS":
-                self.entries[i] = self.entries[i].as_section(cls=ScriptEntry)
-                print(entry.name, bytes(self.entries[i].res_name))
+                self.rxet.entries[0] = self.ftb = self.rxet.entries[0].as_section(cls=TextureSectionBW2)
+
+            for i in range(len(self.ftb.entries)):
+                if is_bw1:
+                    self.ftb.entries[i] = self.ftb.entries[i].as_section(cls=TextureEntry)
+                else:
+                    self.ftb.entries[i] = self.ftb.entries[i].as_section(cls=TextureEntryBW2)
+                #else:
+                #    raise RuntimeError("Unknown image entry name:", self.ftb.entries[i].name)
+
+        with span("archive.parse.sounds", "archive"):
+            assert self.entries[1].name == b"DNOS"
+            self.entries[1] = self.dnos = self.entries[1].as_section(cls=SoundSection)
+
+            assert self.dnos.entries[0].name == b"HFSB"
+            self.dnos.entries[0] = self.hfsb = self.dnos.entries[0].as_section(cls=SoundCount)
+            log.debug("%s sounds, %s sound section entries", self.hfsb.count, len(self.dnos.entries))
+            for i in range(1, len(self.dnos.entries)):
+                assert self.dnos.entries[i].name in (b"HPSD", b"DPSD")
+
+                if self.dnos.entries[i].name == b"HPSD":
+                    assert self.dnos.entries[i+1].name == b"DPSD"
+                    self.dnos.entries[i] = self.dnos.entries[i].as_section(cls=SoundName)
+
+        with span("archive.parse.resources", "archive"):
+            for i, entry in enumerate(self.entries):
+                if entry.name == b"FEQT":
+                    self.entries[i] = self.entries[i].as_section(cls=ParticleEntry)
+                    log.debug("%s %s", entry.name, bytes(self.entries[i].res_name))
+                elif entry.name == b"MINA":
+                    self.entries[i] = self.entries[i].as_section(cls=AnimationEntry)
+                    log.debug("%s %s", entry.name, bytes(self.entries[i].res_name))
+                elif entry.name == b"LDOM":
+                    self.entries[i] = self.entries[i].as_section(cls=ModelSection)
+                    log.debug("%s %s", entry.name, bytes(self.entries[i].res_name))
+                elif entry.name == b"PRCS":
+                    self.entries[i] = self.entries[i].as_section(cls=ScriptEntry)
+                    log.debug("%s %s", entry.name, bytes(self.entries[i].res_name))
 
         self.sounds = [(self.dnos.entries[i], self.dnos.entries[i+1]) for i in range(1, len(self.dnos.entries), 2)]
         self.models = [x for x in filter(lambda k: k.name == b"LDOM", self.entries)]
@@ -374,7 +407,7 @@ class BWArchive(BWArchiveBase):
             #if hasattr(res, "res_name"):
                 #print("Comparing:", bytes(res.res_name).strip(b"\x00").upper(), name)
             if hasattr(res, "res_name") and bytes(res.res_name).strip(b"\x00").upper() == name:
-                print("found", name, "at position", i)
+                log.debug("found %s at position %s", name, i)
                 return res
 
         return None
@@ -394,6 +427,8 @@ class BWArchive(BWArchiveBase):
 
 
 class BW1Archive(BWArchive):
+    __slots__ = ()
+
     def __init__(self, f):
         super().__init__(f)
 
@@ -401,6 +436,8 @@ class BW1Archive(BWArchive):
 
 
 class BW2Archive(BWArchive):
+    __slots__ = ()
+
     def __init__(self, f):
         super().__init__(f)
 
@@ -2,18 +2,30 @@ import io
 import struct
 from array import array
 
-from .helper import read_uint32, write_uint32
+from .helper import write_uint32
+from .profiling import span
+
+
+# Name and size of a section, the size doesn't include these 8 bytes.
+SECTION_HEADER = struct.Struct("4sI")
 
 
 class BWResource(object):
+    # Archives can have tens of thousands of entries, so entries only hold the FourCC name, the size
+    # and a memoryview into the shared archive data. The file object is only created when it is used,
+    # as creating it copies the data.
+    __slots__ = ("name", "_size", "_data", "_fileobj")
+
     def __init__(self, name, size, memview):
         self.name = name
         self._size = size
         self._data = memview
-        self._fileobj = io.BytesIO(self._data)
+        self._fileobj = None
 
     @property
     def fileobj(self):
+        if self._fileobj is None:
+            self._fileobj = io.BytesIO(self._data)
         return self._fileobj
 
     # File object and data object should be kept up to date together when
@@ -32,10 +44,11 @@ class BWResource(object):
 
     @data.setter
     def data(self, data):
-        self._fileobj.close()
+        if self._fileobj is not None:
+            self._fileobj.close()
 
         self._data = data
-        self._fileobj = io.BytesIO(self._data)
+        self._fileobj = None
     
     def write(self, file):
         name, length, data = self.pack()
@@ -60,6 +73,8 @@ class BWResource(object):
             
             
 class BWResourceFromData(BWResource):
+    __slots__ = ()
+
     def __init__(self, name, data):
         self.name = name 
         self._fileobj = None
@@ -67,15 +82,17 @@ class BWResourceFromData(BWResource):
 
 
 class BWSection(BWResource):
+    __slots__ = ("entries", "_header")
+
     def __init__(self, name, size, memview, section_offset=0):
         super().__init__(name, size, memview)
 
         self.entries = []
         self._header = self._data[0:section_offset]
-        self._fileobj.seek(section_offset)
 
-        while self._fileobj.tell() < self._size:
-            name, size, entry_memview = read_section(self._fileobj, memview)
+        offset = section_offset
+        while offset < self._size:
+            name, size, entry_memview, offset = read_section(memview, offset)
             res_obj = BWResource(name, size, entry_memview)
 
             self.entries.append(res_obj)
@@ -109,15 +126,19 @@ class BWSection(BWResource):
 
 
 class BWArchiveBase(BWSection):
+    __slots__ = ()
+
     # f should be a file open in binary mode
     def __init__(self, f):
         # We read the content of the file into memory and put it in a bytearray,
         # which is necessary so the content can be modified.
-        file_content = bytearray(f.read())
+        with span("archive.read", "io"):
+            file_content = bytearray(f.read())
         #file_content = array("B", f.read())
 
-
-        super().__init__(name=None, size=len(file_content), memview=file_content)
+        # All entries are views into this memoryview, slicing the bytearray itself would copy the data.
+        with span("archive.parse.sections", "archive"):
+            super().__init__(name=None, size=len(file_content), memview=memoryview(file_content))
 
     def write(self, f):
         unused, size, data = self.pack()
@@ -125,13 +146,12 @@ class BWArchiveBase(BWSection):
 
 
 
-def read_section(f, memview):
-    name = f.read(4)
-    size = read_uint32(f)
+# Reads the section starting at offset. Returns the name, size, a view of the section data
+# and the offset of the next section.
+def read_section(memview, offset):
+    name, size = SECTION_HEADER.unpack_from(memview, offset)
 
-    offset = f.tell()
-    data = memoryview(memview[offset:(offset+size)])#f.read(data_len)
-    f.seek(size, io.SEEK_CUR)
+    offset += SECTION_HEADER.size
+    data = memview[offset:(offset+size)]
 
-    #print(len(memview), len(f.getbuffer()))
-    return name, size, data
+    return name, size, data, offset+size
@@ -0,0 +1,226 @@
+import gzip
+import os
+import struct
+import zlib
+
+from .bw_archive_base import SECTION_HEADER
+from .profiling import span
+
+
+UINT32 = struct.Struct("I")
+
+GZIP_MAGIC = b"\x1f\x8b"
+# Enough for the archive header of any level, longer level names are handled by reading again
+SNIFF_HEAD_SIZE = 128
+
+
+def read_exact(f, size):
+    with span("archive.stream.read", "io"):
+        data = f.read(size)
+    if len(data) != size:
+        raise RuntimeError("Unexpected end of archive, tried to read {0} bytes but got {1}".format(size, len(data)))
+    return data
+
+
+def read_section_header(f):
+    header = f.read(SECTION_HEADER.size)
+    if len(header) == 0:
+        return None, 0
+    if len(header) != SECTION_HEADER.size:
+        raise RuntimeError("Unexpected end of archive in section header")
+
+    return SECTION_HEADER.unpack(header)
+
+
+def split_named_data(data):
+    # Scripts, animations, effects and models start with the length of their name followed by the name.
+    strlength = UINT32.unpack_from(data, 0)[0]
+    return data[4:4+strlength], data[4+strlength:]
+
+
+class StreamedResource(object):
+    __slots__ = ("kind", "name", "res_name", "data")
+
+    def __init__(self, kind, name, res_name, data):
+        self.kind = kind
+        self.name = name
+        self.res_name = res_name
+        self.data = data
+
+
+class BWArchiveStream(object):
+    # Reads an archive front to back from a file object that only needs to support read(),
+    # e.g. a gzip file. Unlike BWArchive the archive is never held in memory as a whole,
+    # only the resource that was read last.
+    # f should be a file open in binary mode
+    def __init__(self, f):
+        self._f = f
+
+        name, size = read_section_header(f)
+        assert name == b"RXET"
+        strlength = UINT32.unpack(read_exact(f, 4))[0]
+        self.filename = read_exact(f, strlength)
+
+        # RXET contains nothing but the texture section
+        name, size = read_section_header(f)
+        assert name in (b"FTBX", b"FTBG")
+        self._is_bw1 = (name == b"FTBX")
+        self.texture_count = UINT32.unpack(read_exact(f, 4))[0]
+        self._texture_section_left = size - 4
+
+    def is_bw(self):
+        return self._is_bw1
+
+    def is_bw2(self):
+        return not self._is_bw1
+
+    # Yields the resources in the order they are stored in: all textures, all sounds, then
+    # models, animations, effects and scripts. Can only be iterated once.
+    def resources(self):
+        f = self._f
+
+        texture_name = b"TXET" if self._is_bw1 else b"DXTG"
+        # BW1 texture names are 16 bytes long, BW2 texture names 22 bytes.
+        texture_name_length = 0x10 if self._is_bw1 else 0x16
+
+        while self._texture_section_left > 0:
+            name, size = read_section_header(f)
+            assert name == texture_name
+            data = memoryview(read_exact(f, size))
+            self._texture_section_left -= SECTION_HEADER.size + size
+
+            yield StreamedResource("texture", name, data[0:texture_name_length], data)
+
+        name, size = read_section_header(f)
+        assert name == b"DNOS"
+        strlength = UINT32.unpack(read_exact(f, 4))[0]
+        read_exact(f, strlength)
+        sound_section_left = size - 4 - strlength
+
+        name, size = read_section_header(f)
+        assert name == b"HFSB"
+        read_exact(f, size)
+        sound_section_left -= SECTION_HEADER.size + size
+
+        while sound_section_left > 0:
+            name, size = read_section_header(f)
+            assert name == b"HPSD"
+            sound_header = read_exact(f, size)
+            sound_section_left -= SECTION_HEADER.size + size
+
+            name, size = read_section_header(f)
+            assert name == b"DPSD"
+            data = memoryview(read_exact(f, size))
+            sound_section_left -= SECTION_HEADER.size + size
+
+            yield StreamedResource("sound", name, memoryview(sound_header)[0:0x20], data)
+
+        while True:
+            name, size = read_section_header(f)
+            if name is None:
+                break
+
+            data = memoryview(read_exact(f, size))
+
+            if name == b"LDOM":
+                # The model data is embedded inside another LDOM section
+                res_name, modeldata = split_named_data(data)
+                inner_name, inner_size = SECTION_HEADER.unpack_from(modeldata, 0)
+                assert inner_name == b"LDOM" and SECTION_HEADER.size + inner_size == len(modeldata)
+                yield StreamedResource("model", name, res_name, modeldata[SECTION_HEADER.size:])
+            elif name == b"MINA":
+                res_name, animation_data = split_named_data(data)
+                yield StreamedResource("animation", name, res_name, animation_data)
+            elif name == b"FEQT":
+                res_name, particle_data = split_named_data(data)
+                yield StreamedResource("effect", name, res_name, particle_data)
+            elif name == b"PRCS":
+                res_name, script_data = split_named_data(data)
+                yield StreamedResource("script", name, res_name, script_data)
+
+
+class ArchiveInfo(object):
+    __slots__ = ("game", "level_name", "compressed", "file_size", "archive_size",
+                 "rxet_size", "texture_section_size", "texture_count")
+
+    def __init__(self, **values):
+        for key in self.__slots__:
+            setattr(self, key, values[key])
+
+    def is_bw(self):
+        return self.game == "bw1"
+
+    def is_bw2(self):
+        return self.game == "bw2"
+
+
+def read_archive_head(path, size):
+    # Returns the first size bytes of the archive and whether it is gzip compressed.
+    # Of a compressed archive only as much is decompressed as is needed for size bytes.
+    with open(path, "rb") as f:
+        head = f.read(2)
+        if head != GZIP_MAGIC:
+            return head + f.read(size - 2), False
+
+        f.seek(0)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        head = b""
+        while len(head) < size and not decompressor.eof:
+            chunk = decompressor.unconsumed_tail or f.read(1024)
+            if not chunk:
+                break
+            head += decompressor.decompress(chunk, size - len(head))
+
+    return head, True
+
+
+def open_archive(path):
+    # Opens an archive for reading, decompressing it if it is gzip compressed regardless of the file extension
+    with open(path, "rb") as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    return gzip.open(path, "rb") if compressed else open(path, "rb")
+
+
+def get_gzip_uncompressed_size(path):
+    # The last 4 bytes of a gzip file are the uncompressed size modulo 2**32
+    with open(path, "rb") as f:
+        f.seek(-4, os.SEEK_END)
+        return UINT32.unpack(f.read(4))[0]
+
+
+def sniff_archive(path):
+    # Identifies an archive by its first few dozen bytes instead of its file extension
+    # or parsing all of it. Returns an ArchiveInfo, or None if the file isn't a BW1 or BW2 archive.
+    head, compressed = read_archive_head(path, SNIFF_HEAD_SIZE)
+    if len(head) < 12:
+        return None
+
+    name, rxet_size = SECTION_HEADER.unpack_from(head, 0)
+    if name != b"RXET":
+        return None
+    strlength = UINT32.unpack_from(head, 8)[0]
+    if strlength > rxet_size:
+        return None
+
+    # Level name, texture section header and texture count
+    needed = 12 + strlength + SECTION_HEADER.size + 4
+    if len(head) < needed:
+        head, compressed = read_archive_head(path, needed)
+        if len(head) < needed:
+            return None
+
+    level_name = head[12:12+strlength]
+    ftb_name, texture_section_size = SECTION_HEADER.unpack_from(head, 12 + strlength)
+    if ftb_name not in (b"FTBX", b"FTBG"):
+        return None
+    texture_count = UINT32.unpack_from(head, 12 + strlength + SECTION_HEADER.size)[0]
+
+    file_size = os.path.getsize(path)
+    return ArchiveInfo(game="bw1" if ftb_name == b"FTBX" else "bw2",
+                       level_name=str(level_name, encoding="ascii", errors="replace"),
+                       compressed=compressed,
+                       file_size=file_size,
+                       archive_size=get_gzip_uncompressed_size(path) if compressed else file_size,
+                       rxet_size=SECTION_HEADER.size + rxet_size,
+                       texture_section_size=texture_section_size,
+                       texture_count=texture_count)
@@ -4,6 +4,7 @@ try:
 except: # cElementTree not available
     import xml.etree.ElementTree as etree
 from copy import copy
+from fnmatch import fnmatchcase
 
 TEXTURE = "cTextureResource"
 SOUND = "sSampleResource"
@@ -58,9 +59,19 @@ class BattWarsObject(object):
 
 
 class BattWarsLevel(object):
-    def __init__(self, fileobj):
-        self._tree = etree.parse(fileobj)
-        self._root = self._tree.getroot()
+    # types restricts which objects end up in obj_map and the indexes, it can be a type name,
+    # a pattern like "*Resource" or a list of them.
+    # With keep_xml=False the level is read with iterparse and every object that isn't indexed
+    # is thrown away as soon as it was read. That saves a lot of memory and time on big levels
+    # when only a few object types are needed, but objects then only holds the indexed objects
+    # and the level can't be written back.
+    def __init__(self, fileobj, types=None, keep_xml=True):
+        if isinstance(types, str):
+            types = [types]
+        self._types = types
+
+        self._tree = None
+        self._root = None
 
         self.obj_map = {}
 
@@ -68,28 +79,66 @@ class BattWarsLevel(object):
         self.objtypes = []
         self.objtypes_with_positions = []
 
-        for obj in self._root:
-            bw_object = BattWarsObject(obj)
-            if bw_object.type == None:
+        if keep_xml:
+            # The whole tree stays in memory anyway, parse is faster than going through iterparse
+            self._tree = etree.parse(fileobj)
+            self._root = self._tree.getroot()
+            for obj in self._root:
+                if obj.get("type") is not None and self._is_wanted(obj.get("type")):
+                    self._add_to_index(BattWarsObject(obj))
+        else:
+            self._load_streaming(fileobj)
+
+    def _load_streaming(self, fileobj):
+        wanted = {}
+        depth = 0
+        for event, elem in etree.iterparse(fileobj, events=("start", "end")):
+            if event == "start":
+                if depth == 0:
+                    self._root = elem
+                depth += 1
                 continue
 
-            self.obj_map[bw_object.id] = bw_object
-
-            if bw_object.type is not None and bw_object.type not in self.objtypes:
-                self.objtypes.append(bw_object.type)
-            if (bw_object.type is not None and bw_object.type not in self.objtypes_with_positions
-                and (bw_object.has_attr("Mat") or bw_object.has_attr("mMatrix"))):
-                self.objtypes_with_positions.append(bw_object.type)
+            depth -= 1
+            if depth != 1:
+                continue
 
-            # All resourcees
-            if bw_object.type is not None and bw_object.type.endswith("Resource"):
-                res_type = bw_object.type
-                assert bw_object.has_attr("mName") is True
-                if res_type not in self.resources:
-                    self.resources[res_type] = [bw_object]
-                else:
-                    self.resources[res_type].append(bw_object)
+            # elem is a complete object and always the last child of root, everything that
+            # isn't indexed is removed right away so only the wanted objects stay in memory
+            objtype = elem.get("type")
+            if objtype not in wanted:
+                wanted[objtype] = objtype is not None and self._is_wanted(objtype)
 
+            if wanted[objtype]:
+                self._add_to_index(BattWarsObject(elem))
+            else:
+                del self._root[-1]
+
+    def _is_wanted(self, objtype):
+        if self._types is None:
+            return True
+        for pattern in self._types:
+            if fnmatchcase(objtype, pattern):
+                return True
+        return False
+
+    def _add_to_index(self, bw_object):
+        self.obj_map[bw_object.id] = bw_object
+
+        if bw_object.type not in self.objtypes:
+            self.objtypes.append(bw_object.type)
+        if (bw_object.type not in self.objtypes_with_positions
+            and (bw_object.has_attr("Mat") or bw_object.has_attr("mMatrix"))):
+            self.objtypes_with_positions.append(bw_object.type)
+
+        # All resourcees
+        if bw_object.type.endswith("Resource"):
+            res_type = bw_object.type
+            assert bw_object.has_attr("mName") is True
+            if res_type not in self.resources:
+                self.resources[res_type] = [bw_object]
+            else:
+                self.resources[res_type].append(bw_object)
 
     # Todo: synchronize the resources dict
     def add_object(self, xml_node):
@@ -4,6 +4,18 @@ from io import BytesIO
 
 PADDING_BYTES = b"This is padding data to alignme"
 
+# Precompiled structs for reading and writing big endian values.
+# The unpack_*/pack_into_* functions below work directly on a buffer (bytes, bytearray or memoryview) at a given offset without seeking, and should be preferred in hot loops.
+U8 = struct.Struct(">B")
+U16 = struct.Struct(">H")
+U32 = struct.Struct(">I")
+FLOAT = struct.Struct(">f")
+S8 = struct.Struct(">b")
+S16 = struct.Struct(">h")
+S32 = struct.Struct(">i")
+
+_U16_ARRAY_STRUCTS = {}
+
 class InvalidOffsetError(Exception):
   pass
 
@@ -115,69 +127,134 @@ def write_str_with_null_byte(data, offset, new_string):
   write_str(data, offset, new_string, str_len+1)
 
 
+def get_buffer(data):
+  # Returns a memoryview over the contents of a BytesIO or bytes-like object.
+  # For BytesIO the view must be released (e.g. by using it in a with statement) before the BytesIO can be resized again.
+  if isinstance(data, BytesIO):
+    return data.getbuffer()
+  return memoryview(data)
+
+
+def unpack_u8(buffer, offset):
+  return U8.unpack_from(buffer, offset)[0]
+
+def unpack_u16(buffer, offset):
+  return U16.unpack_from(buffer, offset)[0]
+
+def unpack_u32(buffer, offset):
+  return U32.unpack_from(buffer, offset)[0]
+
+def unpack_float(buffer, offset):
+  return FLOAT.unpack_from(buffer, offset)[0]
+
+
+def unpack_s8(buffer, offset):
+  return S8.unpack_from(buffer, offset)[0]
+
+def unpack_s16(buffer, offset):
+  return S16.unpack_from(buffer, offset)[0]
+
+def unpack_s32(buffer, offset):
+  return S32.unpack_from(buffer, offset)[0]
+
+
+def unpack_u16_array(buffer, offset, count):
+  # Reads count consecutive u16 values with a single unpack.
+  array_struct = _U16_ARRAY_STRUCTS.get(count)
+  if array_struct is None:
+    array_struct = struct.Struct(">%dH" % count)
+    _U16_ARRAY_STRUCTS[count] = array_struct
+  return array_struct.unpack_from(buffer, offset)
+
+
+def pack_into_u8(buffer, offset, new_value):
+  U8.pack_into(buffer, offset, new_value)
+
+def pack_into_u16(buffer, offset, new_value):
+  U16.pack_into(buffer, offset, new_value)
+
+def pack_into_u32(buffer, offset, new_value):
+  U32.pack_into(buffer, offset, new_value)
+
+def pack_into_float(buffer, offset, new_value):
+  FLOAT.pack_into(buffer, offset, new_value)
+
+
+def pack_into_s8(buffer, offset, new_value):
+  S8.pack_into(buffer, offset, new_value)
+
+def pack_into_s16(buffer, offset, new_value):
+  S16.pack_into(buffer, offset, new_value)
+
+def pack_into_s32(buffer, offset, new_value):
+  S32.pack_into(buffer, offset, new_value)
+
+
+# The following read_*/write_* functions operate on file-like objects such as BytesIO.
+
 def read_u8(data, offset):
   data.seek(offset)
-  return struct.unpack(">B", data.read(1))[0]
+  return U8.unpack(data.read(1))[0]
 
 def read_u16(data, offset):
   data.seek(offset)
-  return struct.unpack(">H", data.read(2))[0]
+  return U16.unpack(data.read(2))[0]
 
 def read_u32(data, offset):
   data.seek(offset)
-  return struct.unpack(">I", data.read(4))[0]
+  return U32.unpack(data.read(4))[0]
 
 def read_float(data, offset):
   data.seek(offset)
-  return struct.unpack(">f", data.read(4))[0]
+  return FLOAT.unpack(data.read(4))[0]
 
 
 def read_s8(data, offset):
   data.seek(offset)
-  return struct.unpack(">b", data.read(1))[0]
+  return S8.unpack(data.read(1))[0]
 
 def read_s16(data, offset):
   data.seek(offset)
-  return struct.unpack(">h", data.read(2))[0]
+  return S16.unpack(data.read(2))[0]
 
 def read_s32(data, offset):
   data.seek(offset)
-  return struct.unpack(">i", data.read(4))[0]
+  return S32.unpack(data.read(4))[0]
 
 
 def write_u8(data, offset, new_value):
-  new_value = struct.pack(">B", new_value)
+  new_value = U8.pack(new_value)
   data.seek(offset)
   data.write(new_value)
 
 def write_u16(data, offset, new_value):
-  new_value = struct.pack(">H", new_value)
+  new_value = U16.pack(new_value)
   data.seek(offset)
   data.write(new_value)
 
 def write_u32(data, offset, new_value):
-  new_value = struct.pack(">I", new_value)
+  new_value = U32.pack(new_value)
   data.seek(offset)
   data.write(new_value)
 
 def write_float(data, offset, new_value):
-  new_value = struct.pack(">f", new_value)
+  new_value = FLOAT.pack(new_value)
   data.seek(offset)
   data.write(new_value)
 
 
 def write_s8(data, offset, new_value):
-  new_value = struct.pack(">b", new_value)
+  new_value = S8.pack(new_value)
   data.seek(offset)
   data.write(new_value)
 
 def write_s16(data, offset, new_value):
-  new_value = struct.pack(">h", new_value)
+  new_value = S16.pack(new_value)
   data.seek(offset)
   data.write(new_value)
 
 def write_s32(data, offset, new_value):
-  new_value = struct.pack(">i", new_value)
+  new_value = S32.pack(new_value)
   data.seek(offset)
   data.write(new_value)
 
@@ -0,0 +1,183 @@
+# Small job scheduler for the GUI. Jobs are queued and run by a fixed number of worker
+# threads, so starting several batch conversions doesn't make them all fight for the disk.
+#
+#   queue = JobQueue(workers=2)
+#   job = queue.submit("Extract C1_Bonus.res", process, unit="files")
+#
+# process is called as process(job) on a worker thread. Long running jobs should call
+# job.check_cancelled() between files and report their progress with job.set_progress().
+import collections
+import threading
+import time
+
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class CancelToken(object):
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+
+class Job(object):
+    def __init__(self, job_id, name, func, unit="files"):
+        self.id = job_id
+        self.name = name
+        self.func = func
+        self.unit = unit
+        self.token = CancelToken()
+
+        self.state = QUEUED
+        self.error = None
+        self.done = 0
+        self.total = 0
+        self.bytes_done = 0
+        self.submit_time = time.monotonic()
+        self.start_time = None
+        self.end_time = None
+
+    def is_cancelled(self):
+        return self.token.is_cancelled()
+
+    def check_cancelled(self):
+        # Called by the job between files, the file that is being processed is always finished first
+        if self.token.is_cancelled():
+            raise JobCancelled()
+
+    def set_progress(self, done, total=None, bytes_done=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        if bytes_done is not None:
+            self.bytes_done = bytes_done
+
+    def add_bytes(self, amount):
+        self.bytes_done += amount
+
+    def fail(self, error):
+        # For jobs that report their own errors instead of raising them
+        self.error = error
+
+    def is_done(self):
+        return self.state in (FINISHED, FAILED, CANCELLED)
+
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        end = self.end_time if self.end_time is not None else time.monotonic()
+        return end - self.start_time
+
+    def throughput(self):
+        # Returns (items per second, bytes per second) of the time the job was running
+        elapsed = self.elapsed()
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return self.done / elapsed, self.bytes_done / elapsed
+
+
+class JobQueue(object):
+    def __init__(self, workers=2):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = collections.deque()
+        self._jobs = []
+        self._next_id = 1
+        self._workers = 0
+        self._running = 0
+        self._max_workers = max(1, workers)
+        self._shutdown = False
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    def set_workers(self, workers):
+        # Lowering the amount doesn't interrupt running jobs, idle workers exit once they see it
+        with self._lock:
+            self._max_workers = max(1, workers)
+            self._start_workers()
+            self._wakeup.notify_all()
+
+    def submit(self, name, func, unit="files"):
+        with self._lock:
+            job = Job(self._next_id, name, func, unit)
+            self._next_id += 1
+            self._jobs.append(job)
+            self._pending.append(job)
+            self._start_workers()
+            self._wakeup.notify()
+        return job
+
+    def cancel(self, job):
+        # Queued jobs are removed right away, running jobs stop at their next check_cancelled()
+        job.token.cancel()
+        with self._lock:
+            if job.state == QUEUED:
+                self._pending.remove(job)
+                job.state = CANCELLED
+
+    def cancel_all(self):
+        for job in self.jobs():
+            if not job.is_done():
+                self.cancel(job)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def clear_finished(self):
+        with self._lock:
+            self._jobs = [job for job in self._jobs if not job.is_done()]
+
+    def shutdown(self):
+        self.cancel_all()
+        with self._lock:
+            self._shutdown = True
+            self._wakeup.notify_all()
+
+    def _start_workers(self):
+        # Needs to be called with the lock held
+        while self._workers < min(self._max_workers, len(self._pending) + self._running):
+            self._workers += 1
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._shutdown and self._workers <= self._max_workers:
+                    self._wakeup.wait()
+                if self._shutdown or self._workers > self._max_workers or not self._pending:
+                    self._workers -= 1
+                    return
+                job = self._pending.popleft()
+                job.state = RUNNING
+                job.start_time = time.monotonic()
+                self._running += 1
+
+            try:
+                job.func(job)
+            except JobCancelled:
+                job.state = CANCELLED
+            except Exception as e:
+                job.error = e
+                job.state = FAILED
+            else:
+                job.state = FAILED if job.error is not None else FINISHED
+            finally:
+                job.end_time = time.monotonic()
+                with self._lock:
+                    self._running -= 1
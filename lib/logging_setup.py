@@ -0,0 +1,25 @@
+# The modules in lib and bwtex only log messages, they never configure logging themselves.
+# Loggers are named by subsystem:
+#   bw.archive   - parsing archives (bw_archive, bw_archive_base, bw_archive_stream)
+#   bw.texture   - reading, writing and converting textures (bwtex, texture_utils, texture_cache)
+#   bw.restool   - extracting and packing archive folders (restool)
+# Unless a script calls setup_logging, nothing is shown at all (lib/__init__.py gives the
+# bw logger a NullHandler).
+import logging
+import os
+
+
+def setup_logging(debug=False, level=logging.INFO):
+    # Shows messages of the given level and above on the console. Debug messages are
+    # shown if debug is set or the BW_DEBUG environment variable is set to anything but 0.
+    if debug or os.environ.get("BW_DEBUG", "0") not in ("", "0"):
+        # Only for our own loggers, other libraries like Pillow have very chatty debug messages
+        logging.basicConfig(level=level, format="%(name)s: %(message)s")
+        logging.getLogger("bw").setLevel(logging.DEBUG)
+    else:
+        logging.basicConfig(level=level, format="%(message)s")
+
+
+def add_arguments(parser):
+    parser.add_argument("--debug", action="store_true",
+                        help="Show detailed progress messages. Same as setting the environment variable BW_DEBUG=1")
@@ -0,0 +1,157 @@
+# Opt-in timing of named spans. Profiling is disabled by default, in which case span()
+# returns a shared object that does nothing, so instrumented code costs one function call.
+#
+#   with span("archive.parse"):
+#       ...
+#
+# After enable() was called, every finished span is recorded and can be written as a
+# JSON report, printed as a summary or saved as a Chrome trace (chrome://tracing or ui.perfetto.dev).
+import json
+import os
+import threading
+import time
+
+_enabled = False
+_events = []
+_lock = threading.Lock()
+_start_time = 0.0
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    __slots__ = ("name", "category", "args", "start")
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        with _lock:
+            _events.append((self.name, self.category, self.start, end - self.start,
+                            threading.get_ident(), self.args))
+        return False
+
+
+def enable():
+    global _enabled, _start_time
+    with _lock:
+        _events.clear()
+    _start_time = time.perf_counter()
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def span(name, category="", **args):
+    # args are extra values that are shown in the Chrome trace, e.g. the name of a file.
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def get_report():
+    # Returns the total, mean and longest time of every span name, sorted by total time.
+    totals = {}
+    with _lock:
+        events = list(_events)
+
+    for name, category, start, duration, thread, args in events:
+        if name not in totals:
+            totals[name] = {"category": category, "count": 0, "total": 0.0, "max": 0.0}
+        entry = totals[name]
+        entry["count"] += 1
+        entry["total"] += duration
+        entry["max"] = max(entry["max"], duration)
+
+    report = {}
+    for name, entry in sorted(totals.items(), key=lambda item: item[1]["total"], reverse=True):
+        entry["mean"] = entry["total"] / entry["count"]
+        report[name] = entry
+
+    return report
+
+
+def write_report(path):
+    with open(path, "w") as f:
+        json.dump({"spans": get_report()}, f, indent=4)
+
+
+def print_summary():
+    report = get_report()
+    if not report:
+        print("No profiling data recorded")
+        return
+
+    width = max(len(name) for name in report)
+    print("{0}  {1:>8}  {2:>10}  {3:>10}  {4:>10}".format("span".ljust(width), "count", "total s", "mean ms", "max ms"))
+    for name, entry in report.items():
+        print("{0}  {1:8d}  {2:10.4f}  {3:10.3f}  {4:10.3f}".format(
+            name.ljust(width), entry["count"], entry["total"], entry["mean"]*1000, entry["max"]*1000))
+
+
+def write_chrome_trace(path):
+    pid = os.getpid()
+    trace_events = []
+    with _lock:
+        events = list(_events)
+
+    for name, category, start, duration, thread, args in events:
+        trace_events.append({"name": name, "cat": category, "ph": "X",
+                             "ts": (start - _start_time)*1000000, "dur": duration*1000000,
+                             "pid": pid, "tid": thread,
+                             "args": {key: str(value) for key, value in args.items()}})
+
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+def add_arguments(parser):
+    # Adds the profiling options to an argparse parser, see finish_from_arguments.
+    parser.add_argument("--profile", default=None, metavar="REPORT.json",
+                        help="Time the steps of the run, print a summary and save the timings to REPORT.json")
+    parser.add_argument("--trace", default=None, metavar="TRACE.json",
+                        help="Save a trace of the run that can be opened in chrome://tracing or ui.perfetto.dev")
+
+
+def start_from_arguments(args):
+    if args.profile is not None or args.trace is not None:
+        enable()
+
+
+def finish_from_arguments(args):
+    if not _enabled:
+        return
+
+    print_summary()
+    if args.profile is not None:
+        write_report(args.profile)
+        print("Saved profiling report to", args.profile)
+    if args.trace is not None:
+        write_chrome_trace(args.trace)
+        print("Saved trace to", args.trace)
@@ -0,0 +1,90 @@
+# Parallel directory scanning for batch operations. Directories are read with os.scandir
+# by a pool of threads and matching paths are handed out as soon as they are found, so work
+# on the first files can start while the rest of the tree is still being scanned.
+#
+#   scanner = TreeScanner(folder, lambda entry: entry.name.endswith(".res"))
+#   for path in scanner:
+#       ...
+#
+# The order of the paths depends on which thread gets to a directory first.
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Most of the time is spent waiting for the file system, network drives profit from more threads
+DEFAULT_SCAN_WORKERS = 8
+
+_DONE = object()
+
+
+class TreeScanner(object):
+    # match is called with the os.DirEntry of every file and folder below root and decides
+    # whether its path is returned. It runs on the scanning threads, so slow checks like
+    # looking for a file inside a folder are done in parallel as well.
+    # If descend_matches is False, matching folders aren't searched any further.
+    def __init__(self, root, match, descend_matches=True, workers=DEFAULT_SCAN_WORKERS):
+        self.root = root
+        self.match = match
+        self.descend_matches = descend_matches
+        self.found = 0
+        self.errors = []
+
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 1
+        self._stopped = False
+        self._done = False
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._executor.submit(self._scan_directory, root)
+
+    def is_done(self):
+        # True once the whole tree was scanned, paths that were found may still be waiting in the queue
+        return self._done
+
+    def stop(self):
+        # Stops scanning after the directories that are being read right now
+        self._stopped = True
+
+    def __iter__(self):
+        while True:
+            path = self._results.get()
+            if path is _DONE:
+                return
+            yield path
+
+    def _scan_directory(self, path):
+        try:
+            if self._stopped:
+                return
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if self._stopped:
+                        break
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        matched = self.match(entry)
+                    except Exception as e:
+                        self.errors.append((entry.path, e))
+                        continue
+
+                    if matched:
+                        # found counts every path that was discovered, including those that
+                        # weren't handed out yet, so it can be shown as the running total
+                        with self._lock:
+                            self.found += 1
+                        self._results.put(entry.path)
+                    if is_dir and (self.descend_matches or not matched):
+                        with self._lock:
+                            self._pending += 1
+                        self._executor.submit(self._scan_directory, entry.path)
+        except OSError as e:
+            self.errors.append((path, e))
+        finally:
+            with self._lock:
+                self._pending -= 1
+                finished = self._pending == 0
+            if finished:
+                self._done = True
+                self._results.put(_DONE)
+                self._executor.shutdown(wait=False)
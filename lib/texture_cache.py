@@ -0,0 +1,185 @@
+import hashlib
+import os
+import uuid
+from collections import OrderedDict
+
+from PIL import Image
+
+from lib.texture_utils import ENCODER_VERSION
+
+# Cache folders live in the user's home folder unless BWTEX_CACHE_DIR is set.
+DEFAULT_CACHE_DIR = os.environ.get("BWTEX_CACHE_DIR",
+                                   os.path.join(os.path.expanduser("~"), ".bwtex_cache"))
+DEFAULT_ENCODE_CACHE_SIZE = 512*1024*1024
+DEFAULT_DECODE_MEMORY_SIZE = 64*1024*1024
+DEFAULT_DECODE_DISK_SIZE = 1024*1024*1024
+
+
+class DiskCache(object):
+    # Stores byte strings in files named after their key. The file modification time
+    # is used as the last access time, the least recently used files are removed
+    # once the total size goes above max_size.
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self._total_size = None
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "rb") as f:
+                data = f.read()
+            os.utime(entry_path)
+        except OSError:
+            return None
+
+        return data
+
+    def put(self, key, data):
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        # Write to a temporary file first so other processes never see a partial entry.
+        # The name has to be unique per call since GUI jobs can store the same key from two threads.
+        tmp_path = "{0}.{1}.tmp".format(entry_path, uuid.uuid4().hex)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+
+        # An entry that is replaced doesn't add to the total size
+        try:
+            old_size = os.path.getsize(entry_path)
+        except OSError:
+            old_size = 0
+        os.replace(tmp_path, entry_path)
+
+        if self._total_size is None:
+            self._total_size = sum(size for _, size, _ in self._entries())
+        else:
+            self._total_size += len(data) - old_size
+
+        if self._total_size > self.max_size:
+            self.evict()
+
+    def _entries(self):
+        if not os.path.isdir(self.path):
+            return
+
+        for subdir in os.scandir(self.path):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total_size = sum(size for _, size, _ in entries)
+
+        for entry_path, size, _ in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            total_size -= size
+
+        self._total_size = total_size
+
+    def clear(self):
+        for entry_path, _, _ in list(self._entries()):
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+        self._total_size = 0
+
+
+class EncodeCache(DiskCache):
+    # Caches the .texture data produced from a png, so that unchanged images don't have to be encoded again.
+    def __init__(self, path=None, max_size=DEFAULT_ENCODE_CACHE_SIZE):
+        if path is None:
+            path = os.path.join(DEFAULT_CACHE_DIR, "encode")
+        super().__init__(path, max_size)
+
+    @staticmethod
+    def make_key(img, game, name, fmt, settings, gen_mipmap, mipmap_filter):
+        # Everything that changes the written texture has to be part of the key.
+        # The encoder converts everything to RGBA, so hashing the RGBA pixels covers all image modes.
+        hasher = hashlib.sha256()
+        hasher.update(repr((ENCODER_VERSION, game, name, fmt, settings, gen_mipmap, mipmap_filter,
+                            img.width, img.height)).encode("utf-8"))
+        hasher.update(img.convert("RGBA").tobytes())
+        return hasher.hexdigest()
+
+
+class DecodeCache(object):
+    # Caches decoded mipmaps as raw RGBA data, keyed by a hash of the encoded mipmap and palette.
+    # Recently used mipmaps are kept in memory up to memory_size bytes. If use_disk is set,
+    # mipmaps are also stored in a DiskCache so they survive between runs.
+    def __init__(self, memory_size=DEFAULT_DECODE_MEMORY_SIZE, use_disk=False, path=None,
+                 disk_size=DEFAULT_DECODE_DISK_SIZE):
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._memory_total = 0
+
+        if use_disk:
+            if path is None:
+                path = os.path.join(DEFAULT_CACHE_DIR, "decode")
+            self.disk = DiskCache(path, disk_size)
+        else:
+            self.disk = None
+
+    @staticmethod
+    def make_key(fmt, palette, num_colors, rawdata, width, height):
+        hasher = hashlib.sha256()
+        hasher.update(repr((fmt, num_colors, width, height)).encode("utf-8"))
+        if palette is not None:
+            hasher.update(palette)
+        hasher.update(rawdata)
+        return hasher.hexdigest()
+
+    def _remember(self, key, data):
+        if len(data) > self.memory_size:
+            return
+
+        if key in self._memory:
+            self._memory_total -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_total += len(data)
+
+        while self._memory_total > self.memory_size:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_total -= len(evicted)
+
+    def get(self, key, width, height):
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+        elif self.disk is not None:
+            data = self.disk.get(key)
+            if data is None or len(data) != width*height*4:
+                return None
+            self._remember(key, data)
+        else:
+            return None
+
+        # A new image is returned every time so that changes to it don't end up in the cache.
+        return Image.frombytes("RGBA", (width, height), data)
+
+    def put(self, key, image):
+        data = image.convert("RGBA").tobytes()
+        self._remember(key, data)
+        if self.disk is not None:
+            self.disk.put(key, data)
+
+    def clear(self):
+        self._memory.clear()
+        self._memory_total = 0
+        if self.disk is not None:
+            self.disk.clear()
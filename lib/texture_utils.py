@@ -4,6 +4,7 @@ from io import BytesIO
 import colorsys
 from enum import Enum
 import operator
+from concurrent.futures import ProcessPoolExecutor
 
 from .fs_helpers import *
 
@@ -19,6 +20,12 @@ try:
 except ImportError:
   PY_FAST_TEXTURE_UTILS_INSTALLED = False
 
+try:
+  import numpy
+  NUMPY_INSTALLED = True
+except ImportError:
+  NUMPY_INSTALLED = False
+
 class TooManyColorsError(Exception):
   pass
 
@@ -108,6 +115,12 @@ MAX_COLORS_FOR_IMAGE_FORMAT = {
   ImageFormat.C14X2: 1<<14,
 }
 
+# Bump this whenever a change to the encoders changes the data they output, so that cached encodes are invalidated.
+ENCODER_VERSION = 1
+
+# When encoding with multiple worker processes, mipmaps are split into horizontal bands of at least this many rows of blocks.
+MIN_PARALLEL_BAND_BLOCK_ROWS = 4
+
 
 
 def get_rgba(color):
@@ -317,6 +330,19 @@ def get_best_cmpr_key_colors(all_colors):
     
     return (color_1, color_2)
 
+# Weighted squared channel difference tables used by get_nearest_color_slow, indexed by the 5-bit channel difference (mod 128).
+COL_DIFF_G = [0]*128
+COL_DIFF_R = [0]*128
+COL_DIFF_B = [0]*128
+COL_DIFF_A = [0]*128
+for i in range(1, 63+1):
+  k = i*i
+  COL_DIFF_G[i] = COL_DIFF_G[128-i] = k * 59 * 59
+  COL_DIFF_R[i] = COL_DIFF_R[128-i] = k * 30 * 30
+  COL_DIFF_B[i] = COL_DIFF_B[128-i] = k * 11 * 11
+  COL_DIFF_A[i] = COL_DIFF_A[128-i] = k * 8 * 8
+del i, k
+
 # Picks a color from a palette that is visually the closest to the given color.
 # Based off Aseprite's code: https://github.com/aseprite/aseprite/blob/cc7bde6cd1d9ab74c31ccfa1bf41a000150a1fb2/src/doc/palette.cpp#L226-L272
 def get_nearest_color_slow(color, palette):
@@ -333,21 +359,10 @@ def get_nearest_color_slow(color, palette):
   min_dist = 9999999999.0
   value = None
   
-  col_diff_g = []
-  col_diff_r = []
-  col_diff_b = []
-  col_diff_a = []
-  for i in range(128):
-    col_diff_g.append(0)
-    col_diff_r.append(0)
-    col_diff_b.append(0)
-    col_diff_a.append(0)
-  for i in range(1, 63+1):
-    k = i*i
-    col_diff_g[i] = col_diff_g[128-i] = k * 59 * 59
-    col_diff_r[i] = col_diff_r[128-i] = k * 30 * 30
-    col_diff_b[i] = col_diff_b[128-i] = k * 11 * 11
-    col_diff_a[i] = col_diff_a[128-i] = k * 8 * 8
+  col_diff_g = COL_DIFF_G
+  col_diff_r = COL_DIFF_R
+  col_diff_b = COL_DIFF_B
+  col_diff_a = COL_DIFF_A
   
   for indexed_color in palette:
     r1, g1, b1, a1 = get_rgba(color)
@@ -416,6 +431,90 @@ def get_color_distance_fast(color_1, color_2):
   #dist = a_diff*a_diff/2.0 + rgb_dist_sqr*color_1[3]*color_2[3] / (255*255)
   #return dist
 
+# Reusable nearest color lookup for a fixed palette.
+# Gives exactly the same answers as get_nearest_color_fast, but each distinct color is only searched for once, and many colors can be looked up at once with NumPy.
+class PaletteIndex:
+  # Maximum number of (color, palette entry) distances computed at once by nearest_indexes.
+  BATCH_SIZE = 1<<20
+  
+  def __init__(self, palette):
+    self.palette = list(palette)
+    if not self.palette:
+      raise Exception("Cannot build a palette index for an empty palette.")
+    
+    # Colors that are already in the palette map to their first occurrence.
+    # This includes colors with alpha < 16: get_nearest_color_fast returns colors that are in the palette
+    # before it checks for transparency, so they must not be redirected to the transparent entry here either.
+    self._cache = {}
+    for i, indexed_color in enumerate(self.palette):
+      if indexed_color not in self._cache:
+        self._cache[indexed_color] = i
+    
+    self._transparent_index = next(
+      (i for i, indexed_color in enumerate(self.palette) if len(indexed_color) == 4 and indexed_color[3] == 0),
+      None
+    )
+    
+    self._palette_array = None
+  
+  def __len__(self):
+    return len(self.palette)
+  
+  def nearest_index(self, color):
+    index = self._cache.get(color)
+    if index is None:
+      index = self._search(color)
+      self._cache[color] = index
+    return index
+  
+  def nearest(self, color):
+    return self.palette[self.nearest_index(color)]
+  
+  def _search(self, color):
+    r, g, b, a = get_rgba(color)
+    
+    if a < 16 and self._transparent_index is not None: # Transparent
+      return self._transparent_index
+    
+    min_dist = 0x7FFFFFFF
+    best_index = 0
+    for i, (r2, g2, b2, a2) in enumerate(self.palette):
+      curr_dist = abs(r - r2) + abs(g - g2) + abs(b - b2) + abs(a - a2)
+      if curr_dist < min_dist:
+        if curr_dist == 0:
+          return i
+        min_dist = curr_dist
+        best_index = i
+    
+    return best_index
+  
+  def nearest_indexes(self, colors):
+    # Looks up the palette indexes for many colors at once.
+    # colors can be a NumPy array of shape (N, 4) or a sequence of RGBA tuples. Returns a NumPy array if NumPy is installed, a list otherwise.
+    if not NUMPY_INSTALLED:
+      return [self.nearest_index(tuple(color)) for color in colors]
+    
+    colors = numpy.asarray(colors, dtype=numpy.int32).reshape(-1, 4)
+    if self._palette_array is None:
+      self._palette_array = numpy.array(self.palette, dtype=numpy.int32)
+    palette_array = self._palette_array
+    
+    indexes = numpy.empty(len(colors), dtype=numpy.int64)
+    chunk_size = max(1, self.BATCH_SIZE // len(palette_array))
+    for start in range(0, len(colors), chunk_size):
+      chunk = colors[start:start+chunk_size]
+      dists = numpy.abs(chunk[:, None, :] - palette_array[None, :, :]).sum(axis=2)
+      # argmin picks the first of several equally close colors, just like the linear search.
+      chunk_indexes = dists.argmin(axis=1)
+      if self._transparent_index is not None:
+        min_dists = dists[numpy.arange(len(chunk)), chunk_indexes]
+        # Exact palette matches keep their own index, see __init__.
+        transparent = (chunk[:, 3] < 16) & (min_dists != 0)
+        chunk_indexes[transparent] = self._transparent_index
+      indexes[start:start+chunk_size] = chunk_indexes
+    
+    return indexes
+
 
 # Generates a palette with a certain number of colors or less based on an image (color quantization).
 def create_limited_palette_from_image(image, max_colors, with_alpha=True):
@@ -503,13 +602,13 @@ def decode_palettes(palette_data, palette_format, num_colors, image_format):
   if image_format not in IMAGE_FORMATS_THAT_USE_PALETTES:
     return []
   
+  with get_buffer(palette_data) as buffer:
+    raw_colors = unpack_u16_array(buffer, 0, num_colors)
+  
   colors = []
-  offset = 0
-  for i in range(num_colors):
-    raw_color = read_u16(palette_data, offset)
+  for raw_color in raw_colors:
     color = decode_color(raw_color, palette_format)
     colors.append(color)
-    offset += 2
   
   return colors
 
@@ -527,18 +626,18 @@ def generate_new_palettes_from_image(image, image_format, palette_format):
   if image_format not in IMAGE_FORMATS_THAT_USE_PALETTES:
     return ([],{})
   
-  pixels = image.load()
-  width, height = image.size
+  # Unique colors in the order they first appear in the image.
+  image_colors = list(dict.fromkeys(image.getdata()))
+  
   encoded_colors = []
+  encoded_colors_to_indexes = {}
   colors_to_color_indexes = {}
-  for y in range(height):
-    for x in range(width):
-      color = pixels[x,y]
-      encoded_color = encode_color(color, palette_format)
-      if encoded_color not in encoded_colors:
-        encoded_colors.append(encoded_color)
-      if color not in colors_to_color_indexes:
-        colors_to_color_indexes[color] = encoded_colors.index(encoded_color)
+  for color in image_colors:
+    encoded_color = encode_color(color, palette_format)
+    if encoded_color not in encoded_colors_to_indexes:
+      encoded_colors_to_indexes[encoded_color] = len(encoded_colors)
+      encoded_colors.append(encoded_color)
+    colors_to_color_indexes[color] = encoded_colors_to_indexes[encoded_color]
   
   if len(encoded_colors) > MAX_COLORS_FOR_IMAGE_FORMAT[image_format]:
     # If the image has more colors than the selected image format can support, we automatically reduce the number of colors.
@@ -549,18 +648,19 @@ def generate_new_palettes_from_image(image, image_format, palette_format):
     
     with_alpha = (palette_format in PALETTE_FORMATS_WITH_ALPHA)
     limited_palette = create_limited_palette_from_image(image, MAX_COLORS_FOR_IMAGE_FORMAT[image_format], with_alpha=with_alpha)
+    palette_index = PaletteIndex(limited_palette)
+    nearest_indexes = palette_index.nearest_indexes(image_colors)
     
     encoded_colors = []
+    encoded_colors_to_indexes = {}
     colors_to_color_indexes = {}
-    for y in range(height):
-      for x in range(width):
-        color = pixels[x,y]
-        new_color = get_nearest_color_fast(color, limited_palette)
-        encoded_color = encode_color(new_color, palette_format)
-        if encoded_color not in encoded_colors:
-          encoded_colors.append(encoded_color)
-        if color not in colors_to_color_indexes:
-          colors_to_color_indexes[color] = encoded_colors.index(encoded_color)
+    for color, nearest_index in zip(image_colors, nearest_indexes):
+      new_color = limited_palette[nearest_index]
+      encoded_color = encode_color(new_color, palette_format)
+      if encoded_color not in encoded_colors_to_indexes:
+        encoded_colors_to_indexes[encoded_color] = len(encoded_colors)
+        encoded_colors.append(encoded_color)
+      colors_to_color_indexes[color] = encoded_colors_to_indexes[encoded_color]
   
   return (encoded_colors, colors_to_color_indexes)
 
@@ -594,16 +694,18 @@ def encode_palette(encoded_colors, palette_format, image_format):
     )
   
   offset = 0
-  new_palette_data = BytesIO()
+  new_palette_data = bytearray(len(encoded_colors)*2)
   for raw_color in encoded_colors:
-    write_u16(new_palette_data, offset, raw_color)
+    pack_into_u16(new_palette_data, offset, raw_color)
     offset += 2
   
-  return new_palette_data
+  return BytesIO(new_palette_data)
 
 
 
-def decode_image(image_data, palette_data, image_format, palette_format, num_colors, image_width, image_height):
+def decode_image(image_data, palette_data, image_format, palette_format, num_colors, image_width, image_height, data_length=None):
+  # image_data can be a BytesIO or any bytes-like object such as a memoryview.
+  # Only the first data_length bytes are used (default: all of them). If the data ends before the last block, the missing bytes are read as zeroes.
   colors = decode_palettes(palette_data, palette_format, num_colors, image_format)
   
   block_width = BLOCK_WIDTHS[image_format]
@@ -615,24 +717,33 @@ def decode_image(image_data, palette_data, image_format, palette_format, num_col
   offset = 0
   block_x = 0
   block_y = 0
-  while block_y < image_height:
-    pixel_color_data = decode_block(image_format, image_data, offset, block_data_size, colors)
+  with get_buffer(image_data) as buffer:
+    if data_length is None or data_length > len(buffer):
+      data_length = len(buffer)
     
-    for i, color in enumerate(pixel_color_data):
-      x_in_block = i % block_width
-      y_in_block = i // block_width
-      x = block_x+x_in_block
-      y = block_y+y_in_block
-      if x >= image_width or y >= image_height:
-        continue
+    while block_y < image_height:
+      if offset+block_data_size <= data_length:
+        pixel_color_data = decode_block(image_format, buffer, offset, block_data_size, colors)
+      else:
+        # Short trailing block, only copy the bytes of this one block.
+        block_data = bytes(buffer[offset:data_length]).ljust(block_data_size, b"\x00")
+        pixel_color_data = decode_block(image_format, block_data, 0, block_data_size, colors)
       
-      pixels[x,y] = color
-    
-    offset += block_data_size
-    block_x += block_width
-    if block_x >= image_width:
-      block_x = 0
-      block_y += block_height
+      for i, color in enumerate(pixel_color_data):
+        x_in_block = i % block_width
+        y_in_block = i // block_width
+        x = block_x+x_in_block
+        y = block_y+y_in_block
+        if x >= image_width or y >= image_height:
+          continue
+        
+        pixels[x,y] = color
+      
+      offset += block_data_size
+      block_x += block_width
+      if block_x >= image_width:
+        block_x = 0
+        block_y += block_height
   
   return image
 
@@ -665,8 +776,7 @@ def decode_block(image_format, image_data, offset, block_data_size, colors):
 def decode_i4_block(image_format, image_data, offset, block_data_size, colors):
   pixel_color_data = []
   
-  for byte_index in range(block_data_size):
-    byte = read_u8(image_data, offset+byte_index)
+  for byte in image_data[offset:offset+block_data_size]:
     for nibble_index in range(2):
       i4 = (byte >> (1-nibble_index)*4) & 0xF
       color = convert_i4_to_color(i4)
@@ -678,8 +788,7 @@ def decode_i4_block(image_format, image_data, offset, block_data_size, colors):
 def decode_i8_block(image_format, image_data, offset, block_data_size, colors):
   pixel_color_data = []
   
-  for i in range(block_data_size):
-    i8 = read_u8(image_data, offset+i)
+  for i8 in image_data[offset:offset+block_data_size]:
     color = convert_i8_to_color(i8)
     
     pixel_color_data.append(color)
@@ -689,8 +798,7 @@ def decode_i8_block(image_format, image_data, offset, block_data_size, colors):
 def decode_ia4_block(image_format, image_data, offset, block_data_size, colors):
   pixel_color_data = []
   
-  for i in range(block_data_size):
-    ia4 = read_u8(image_data, offset+i)
+  for ia4 in image_data[offset:offset+block_data_size]:
     color = convert_ia4_to_color(ia4)
     
     pixel_color_data.append(color)
@@ -700,8 +808,7 @@ def decode_ia4_block(image_format, image_data, offset, block_data_size, colors):
 def decode_ia8_block(image_format, image_data, offset, block_data_size, colors):
   pixel_color_data = []
   
-  for i in range(block_data_size//2):
-    ia8 = read_u16(image_data, offset+i*2)
+  for ia8 in unpack_u16_array(image_data, offset, block_data_size//2):
     color = convert_ia8_to_color(ia8)
     
     pixel_color_data.append(color)
@@ -711,8 +818,7 @@ def decode_ia8_block(image_format, image_data, offset, block_data_size, colors):
 def decode_rgb565_block(image_format, image_data, offset, block_data_size, colors):
   pixel_color_data = []
   
-  for i in range(block_data_size//2):
-    rgb565 = read_u16(image_data, offset+i*2)
+  for rgb565 in unpack_u16_array(image_data, offset, block_data_size//2):
     color = convert_rgb565_to_color(rgb565)
     
     pixel_color_data.append(color)
@@ -722,8 +828,7 @@ def decode_rgb565_block(image_format, image_data, offset, block_data_size, color
 def decode_rgb5a3_block(image_format, image_data, offset, block_data_size, colors):
   pixel_color_data = []
   
-  for i in range(block_data_size//2):
-    rgb5a3 = read_u16(image_data, offset+i*2)
+  for rgb5a3 in unpack_u16_array(image_data, offset, block_data_size//2):
     color = convert_rgb5a3_to_color(rgb5a3)
     
     pixel_color_data.append(color)
@@ -733,11 +838,12 @@ def decode_rgb5a3_block(image_format, image_data, offset, block_data_size, color
 def decode_rgba32_block(image_format, image_data, offset, block_data_size, colors):
   pixel_color_data = []
   
+  block_data = image_data[offset:offset+block_data_size]
   for i in range(16):
-    a = read_u8(image_data, offset+(i*2))
-    r = read_u8(image_data, offset+(i*2)+1)
-    g = read_u8(image_data, offset+(i*2)+32)
-    b = read_u8(image_data, offset+(i*2)+33)
+    a = block_data[(i*2)]
+    r = block_data[(i*2)+1]
+    g = block_data[(i*2)+32]
+    b = block_data[(i*2)+33]
     color = (r, g, b, a)
     
     pixel_color_data.append(color)
@@ -747,8 +853,7 @@ def decode_rgba32_block(image_format, image_data, offset, block_data_size, color
 def decode_c4_block(image_format, image_data, offset, block_data_size, colors):
   pixel_color_data = []
   
-  for byte_index in range(block_data_size):
-    byte = read_u8(image_data, offset+byte_index)
+  for byte in image_data[offset:offset+block_data_size]:
     for nibble_index in range(2):
       color_index = (byte >> (1-nibble_index)*4) & 0xF
       if color_index >= len(colors):
@@ -764,8 +869,7 @@ def decode_c4_block(image_format, image_data, offset, block_data_size, colors):
 def decode_c8_block(image_format, image_data, offset, block_data_size, colors):
   pixel_color_data = []
   
-  for i in range(block_data_size):
-    color_index = read_u8(image_data, offset+i)
+  for color_index in image_data[offset:offset+block_data_size]:
     if color_index >= len(colors):
       # This block bleeds past the edge of the image
       color = None
@@ -779,8 +883,8 @@ def decode_c8_block(image_format, image_data, offset, block_data_size, colors):
 def decode_c14x2_block(image_format, image_data, offset, block_data_size, colors):
   pixel_color_data = []
   
-  for i in range(block_data_size//2):
-    color_index = read_u16(image_data, offset+i*2) & 0x3FFF
+  for raw_color_index in unpack_u16_array(image_data, offset, block_data_size//2):
+    color_index = raw_color_index & 0x3FFF
     if color_index >= len(colors):
       # This block bleeds past the edge of the image
       color = None
@@ -799,11 +903,11 @@ def decode_cmpr_block(image_format, image_data, offset, block_data_size, colors)
     subblock_x = (subblock_index%2)*4
     subblock_y = (subblock_index//2)*4
     
-    color_0_rgb565 = read_u16(image_data, subblock_offset)
-    color_1_rgb565 = read_u16(image_data, subblock_offset+2)
+    color_0_rgb565 = unpack_u16(image_data, subblock_offset)
+    color_1_rgb565 = unpack_u16(image_data, subblock_offset+2)
     colors = get_interpolated_cmpr_colors(color_0_rgb565, color_1_rgb565)
     
-    color_indexes = read_u32(image_data, subblock_offset+4)
+    color_indexes = unpack_u32(image_data, subblock_offset+4)
     for i in range(16):
       color_index = ((color_indexes >> ((15-i)*2)) & 3)
       color = colors[color_index]
@@ -866,12 +970,124 @@ def encode_image(image, image_format, palette_format, mipmap_count=1):
   
   return (new_image_data, new_palette_data, encoded_colors)
 
+def encode_mipmap_chain(images, image_format, palette_format, workers=None, executor=None):
+  # Encodes a list of mipmap images (largest first) that all share the same palette.
+  # The palette is generated from the first image only, and the colors of the smaller images are mapped to the nearest color in it.
+  # If workers is more than 1, the mipmaps are encoded in that many processes, with large mipmaps split into bands of block rows.
+  # Pass a ProcessPoolExecutor with that many workers as executor when encoding many images, so the processes are only started once.
+  # Returns a list with the encoded data of each mipmap, the palette data and the encoded colors.
+  base_image = images[0].convert("RGBA")
+  
+  if image_format in IMAGE_FORMATS_THAT_USE_PALETTES:
+    max_colors = MAX_COLORS_FOR_IMAGE_FORMAT[image_format]
+    if max_colors <= 256:
+      base_image = base_image.quantize(max_colors)
+      base_image = base_image.convert("RGBA")
+  
+  encoded_colors, base_colors_to_color_indexes = generate_new_palettes_from_image(base_image, image_format, palette_format)
+  palette_index = None
+  
+  mipmap_jobs = []
+  for i, mipmap_image in enumerate(images):
+    if i == 0:
+      mipmap_image = base_image
+      colors_to_color_indexes = base_colors_to_color_indexes
+    else:
+      mipmap_image = mipmap_image.convert("RGBA")
+      if image_format in IMAGE_FORMATS_THAT_USE_PALETTES:
+        if palette_index is None:
+          palette_index = PaletteIndex(base_colors_to_color_indexes.keys())
+        colors_to_color_indexes = map_image_colors_to_palette(mipmap_image, base_colors_to_color_indexes, palette_index)
+      else:
+        # Formats without a palette don't use the color index map, it's passed along unchanged
+        colors_to_color_indexes = base_colors_to_color_indexes
+    
+    mipmap_jobs.append((mipmap_image, colors_to_color_indexes))
+  
+  if workers is not None and workers > 1:
+    mipmap_image_datas = encode_mipmaps_in_parallel(mipmap_jobs, image_format, workers, executor)
+  else:
+    mipmap_image_datas = []
+    for mipmap_image, colors_to_color_indexes in mipmap_jobs:
+      mipmap_image_data = encode_mipmap_image(
+        mipmap_image, image_format,
+        colors_to_color_indexes,
+        mipmap_image.width, mipmap_image.height
+      )
+      mipmap_image_datas.append(mipmap_image_data)
+  
+  new_palette_data = encode_palette(encoded_colors, palette_format, image_format)
+  
+  return (mipmap_image_datas, new_palette_data, encoded_colors)
+
+def encode_mipmaps_in_parallel(mipmap_jobs, image_format, workers, executor=None):
+  # Encodes (image, colors_to_color_indexes) pairs in a process pool and returns the encoded data of each image in order.
+  # Since blocks never cross a band boundary, joining the encoded bands gives exactly the same data as encoding the whole image.
+  # Without an executor a pool is started just for these images.
+  if executor is None:
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+      return encode_mipmaps_in_parallel(mipmap_jobs, image_format, workers, executor)
+  
+  band_jobs = []
+  band_counts = []
+  for mipmap_image, colors_to_color_indexes in mipmap_jobs:
+    bands = split_image_into_block_row_bands(mipmap_image, image_format, workers)
+    band_counts.append(len(bands))
+    for band in bands:
+      band_jobs.append((band, image_format, colors_to_color_indexes))
+  
+  band_datas = list(executor.map(encode_mipmap_band, band_jobs))
+  
+  mipmap_image_datas = []
+  band_index = 0
+  for band_count in band_counts:
+    mipmap_image_data = BytesIO()
+    for band_data in band_datas[band_index:band_index+band_count]:
+      mipmap_image_data.write(band_data)
+    mipmap_image_datas.append(mipmap_image_data)
+    band_index += band_count
+  
+  return mipmap_image_datas
+
+def split_image_into_block_row_bands(image, image_format, band_count):
+  block_height = BLOCK_HEIGHTS[image_format]
+  block_rows = (image.height + block_height - 1) // block_height
+  rows_per_band = max(MIN_PARALLEL_BAND_BLOCK_ROWS, (block_rows + band_count - 1) // band_count)
+  if rows_per_band >= block_rows:
+    return [image]
+  
+  bands = []
+  for first_row in range(0, block_rows, rows_per_band):
+    band_top = first_row*block_height
+    band_bottom = min(image.height, (first_row+rows_per_band)*block_height)
+    bands.append(image.crop((0, band_top, image.width, band_bottom)))
+  
+  return bands
+
+def encode_mipmap_band(band_job):
+  # Runs in a worker process, so the arguments are packed into a single picklable tuple.
+  band, image_format, colors_to_color_indexes = band_job
+  band_data = encode_mipmap_image(band, image_format, colors_to_color_indexes, band.width, band.height)
+  return band_data.getvalue()
+
+def map_image_colors_to_palette(image, colors_to_color_indexes, palette_index):
+  # Extends a color to palette index mapping with the colors of another image, using the index of the nearest already mapped color.
+  # palette_index must be a PaletteIndex over the colors in colors_to_color_indexes.
+  new_colors_to_color_indexes = dict(colors_to_color_indexes)
+  missing_colors = [color for color in dict.fromkeys(image.getdata()) if color not in colors_to_color_indexes]
+  if missing_colors:
+    nearest_indexes = palette_index.nearest_indexes(missing_colors)
+    for color, nearest_index in zip(missing_colors, nearest_indexes):
+      nearest_color = palette_index.palette[nearest_index]
+      new_colors_to_color_indexes[color] = colors_to_color_indexes[nearest_color]
+  
+  return new_colors_to_color_indexes
+
 def encode_mipmap_image(image, image_format, colors_to_color_indexes, image_width, image_height):
   pixels = image.load()
-  offset_in_image_data = 0
   block_x = 0
   block_y = 0
-  mipmap_image_data = BytesIO()
+  mipmap_image_data = bytearray()
   block_width = BLOCK_WIDTHS[image_format]
   block_height = BLOCK_HEIGHTS[image_format]
   block_data_size = BLOCK_DATA_SIZES[image_format]
@@ -884,15 +1100,14 @@ def encode_mipmap_image(image, image_format, colors_to_color_indexes, image_widt
     
     assert len(block_data) == block_data_size
     
-    write_bytes(mipmap_image_data, offset_in_image_data, block_data)
+    mipmap_image_data += block_data
     
-    offset_in_image_data += block_data_size
     block_x += BLOCK_WIDTHS[image_format]
     if block_x >= image_width:
       block_x = 0
       block_y += BLOCK_HEIGHTS[image_format]
   
-  return mipmap_image_data
+  return BytesIO(mipmap_image_data)
 
 def encode_image_to_block(image_format, pixels, colors_to_color_indexes, block_x, block_y, block_width, block_height, image_width, image_height):
   if image_format == ImageFormat.I4:
@@ -921,7 +1136,7 @@ def encode_image_to_block(image_format, pixels, colors_to_color_indexes, block_x
     raise Exception("Unknown image format: %s" % ImageFormat(image_format).name)
 
 def encode_image_to_i4_block(pixels, colors_to_color_indexes, block_x, block_y, block_width, block_height, image_width, image_height):
-  new_data = BytesIO()
+  new_data = bytearray(32)
   offset = 0
   
   for y in range(block_y, block_y+block_height):
@@ -944,14 +1159,13 @@ def encode_image_to_i4_block(pixels, colors_to_color_indexes, block_x, block_y,
       
       byte = ((color_1_i4 & 0xF) << 4) | (color_2_i4 & 0xF)
       
-      write_u8(new_data, offset, byte)
+      pack_into_u8(new_data, offset, byte)
       offset += 1
   
-  new_data.seek(0)
-  return new_data.read()
+  return bytes(new_data)
 
 def encode_image_to_i8_block(pixels, colors_to_color_indexes, block_x, block_y, block_width, block_height, image_width, image_height):
-  new_data = BytesIO()
+  new_data = bytearray(32)
   offset = 0
   
   for y in range(block_y, block_y+block_height):
@@ -964,14 +1178,13 @@ def encode_image_to_i8_block(pixels, colors_to_color_indexes, block_x, block_y,
         i8 = convert_color_to_i8(color)
         assert 0 <= i8 <= 0xFF
       
-      write_u8(new_data, offset, i8)
+      pack_into_u8(new_data, offset, i8)
       offset += 1
   
-  new_data.seek(0)
-  return new_data.read()
+  return bytes(new_data)
 
 def encode_image_to_ia4_block(pixels, colors_to_color_indexes, block_x, block_y, block_width, block_height, image_width, image_height):
-  new_data = BytesIO()
+  new_data = bytearray(32)
   offset = 0
   
   for y in range(block_y, block_y+block_height):
@@ -984,14 +1197,13 @@ def encode_image_to_ia4_block(pixels, colors_to_color_indexes, block_x, block_y,
         ia4 = convert_color_to_ia4(color)
         assert 0 <= ia4 <= 0xFF
       
-      write_u8(new_data, offset, ia4)
+      pack_into_u8(new_data, offset, ia4)
       offset += 1
   
-  new_data.seek(0)
-  return new_data.read()
+  return bytes(new_data)
 
 def encode_image_to_ia8_block(pixels, colors_to_color_indexes, block_x, block_y, block_width, block_height, image_width, image_height):
-  new_data = BytesIO()
+  new_data = bytearray(32)
   offset = 0
   
   for y in range(block_y, block_y+block_height):
@@ -1004,14 +1216,13 @@ def encode_image_to_ia8_block(pixels, colors_to_color_indexes, block_x, block_y,
         ia8 = convert_color_to_ia8(color)
         assert 0 <= ia8 <= 0xFFFF
       
-      write_u16(new_data, offset, ia8)
+      pack_into_u16(new_data, offset, ia8)
       offset += 2
   
-  new_data.seek(0)
-  return new_data.read()
+  return bytes(new_data)
 
 def encode_image_to_rgb563_block(pixels, colors_to_color_indexes, block_x, block_y, block_width, block_height, image_width, image_height):
-  new_data = BytesIO()
+  new_data = bytearray(32)
   offset = 0
   for y in range(block_y, block_y+block_height):
     for x in range(block_x, block_x+block_width):
@@ -1022,14 +1233,13 @@ def encode_image_to_rgb563_block(pixels, colors_to_color_indexes, block_x, block
         color = pixels[x,y]
         rgb565 = convert_color_to_rgb565(color)
       
-      write_u16(new_data, offset, rgb565)
+      pack_into_u16(new_data, offset, rgb565)
       offset += 2
   
-  new_data.seek(0)
-  return new_data.read()
+  return bytes(new_data)
 
 def encode_image_to_rgb5a3_block(pixels, colors_to_color_indexes, block_x, block_y, block_width, block_height, image_width, image_height):
-  new_data = BytesIO()
+  new_data = bytearray(32)
   offset = 0
   for y in range(block_y, block_y+block_height):
     for x in range(block_x, block_x+block_width):
@@ -1040,14 +1250,13 @@ def encode_image_to_rgb5a3_block(pixels, colors_to_color_indexes, block_x, block
         color = pixels[x,y]
         rgb5a3 = convert_color_to_rgb5a3(color)
       
-      write_u16(new_data, offset, rgb5a3)
+      pack_into_u16(new_data, offset, rgb5a3)
       offset += 2
   
-  new_data.seek(0)
-  return new_data.read()
+  return bytes(new_data)
 
 def encode_image_to_rgba32_block(pixels, colors_to_color_indexes, block_x, block_y, block_width, block_height, image_width, image_height):
-  new_data = BytesIO()
+  new_data = bytearray(64)
   for i in range(16):
     x = block_x + (i % block_width)
     y = block_y + (i // block_width)
@@ -1058,16 +1267,15 @@ def encode_image_to_rgba32_block(pixels, colors_to_color_indexes, block_x, block
       color = pixels[x, y]
       r, g, b, a = color
     
-    write_u8(new_data, (i*2), a)
-    write_u8(new_data, (i*2)+1, r)
-    write_u8(new_data, (i*2)+32, g)
-    write_u8(new_data, (i*2)+33, b)
+    pack_into_u8(new_data, (i*2), a)
+    pack_into_u8(new_data, (i*2)+1, r)
+    pack_into_u8(new_data, (i*2)+32, g)
+    pack_into_u8(new_data, (i*2)+33, b)
   
-  new_data.seek(0)
-  return new_data.read()
+  return bytes(new_data)
 
 def encode_image_to_c4_block(pixels, colors_to_color_indexes, block_x, block_y, block_width, block_height, image_width, image_height):
-  new_data = BytesIO()
+  new_data = bytearray(32)
   offset = 0
   
   for y in range(block_y, block_y+block_height):
@@ -1090,14 +1298,13 @@ def encode_image_to_c4_block(pixels, colors_to_color_indexes, block_x, block_y,
       
       byte = ((color_1_index & 0xF) << 4) | (color_2_index & 0xF)
       
-      write_u8(new_data, offset, byte)
+      pack_into_u8(new_data, offset, byte)
       offset += 1
   
-  new_data.seek(0)
-  return new_data.read()
+  return bytes(new_data)
 
 def encode_image_to_c8_block(pixels, colors_to_color_indexes, block_x, block_y, block_width, block_height, image_width, image_height):
-  new_data = BytesIO()
+  new_data = bytearray(32)
   offset = 0
   
   for y in range(block_y, block_y+block_height):
@@ -1109,14 +1316,13 @@ def encode_image_to_c8_block(pixels, colors_to_color_indexes, block_x, block_y,
         color = pixels[x,y]
         color_index = colors_to_color_indexes[color]
       
-      write_u8(new_data, offset, color_index)
+      pack_into_u8(new_data, offset, color_index)
       offset += 1
   
-  new_data.seek(0)
-  return new_data.read()
+  return bytes(new_data)
 
 def encode_image_to_c14x2_block(pixels, colors_to_color_indexes, block_x, block_y, block_width, block_height, image_width, image_height):
-  new_data = BytesIO()
+  new_data = bytearray(32)
   offset = 0
   
   for y in range(block_y, block_y+block_height):
@@ -1128,14 +1334,13 @@ def encode_image_to_c14x2_block(pixels, colors_to_color_indexes, block_x, block_
         color = pixels[x,y]
         color_index = colors_to_color_indexes[color]
       
-      write_u16(new_data, offset, color_index)
+      pack_into_u16(new_data, offset, color_index)
       offset += 2
   
-  new_data.seek(0)
-  return new_data.read()
+  return bytes(new_data)
 
 def encode_image_to_cmpr_block(pixels, colors_to_color_indexes, block_x, block_y, block_width, block_height, image_width, image_height):
-  new_data = BytesIO()
+  new_data = bytearray(32)
   subblock_offset = 0
   for subblock_index in range(4):
     subblock_x = block_x + (subblock_index%2)*4
@@ -1174,8 +1379,8 @@ def encode_image_to_cmpr_block(pixels, colors_to_color_indexes, block_x, block_y
     colors[0] = color_0
     colors[1] = color_1
     
-    write_u16(new_data, subblock_offset, color_0_rgb565)
-    write_u16(new_data, subblock_offset+2, color_1_rgb565)
+    pack_into_u16(new_data, subblock_offset, color_0_rgb565)
+    pack_into_u16(new_data, subblock_offset+2, color_1_rgb565)
     
     color_indexes = 0
     for i in range(16):
@@ -1189,18 +1394,18 @@ def encode_image_to_cmpr_block(pixels, colors_to_color_indexes, block_x, block_y
       
       color = pixels[x,y]
       
+      # With only 4 colors a direct search is cheaper than building a PaletteIndex for every subblock
       if color in colors:
         color_index = colors.index(color)
       else:
         new_color = get_nearest_color_fast(color, colors)
         color_index = colors.index(new_color)
       color_indexes |= (color_index << ((15-i)*2))
-    write_u32(new_data, subblock_offset+4, color_indexes)
+    pack_into_u32(new_data, subblock_offset+4, color_indexes)
     
     subblock_offset += 8
   
-  new_data.seek(0)
-  return new_data.read()
+  return bytes(new_data)
 
 def color_exchange(image, base_color, replacement_color, mask_path=None, validate_mask_colors=True, ignore_bright=False):
   if mask_path:
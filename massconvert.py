@@ -1,9 +1,14 @@
-import subprocess
 import os
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import bwtex
+from lib.texture_cache import EncodeCache, DecodeCache
+from lib import profiling
+from lib import logging_setup
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     parser = argparse.ArgumentParser()
     parser.add_argument("inputfolder",
                         help="Path to folder with textures.")
@@ -15,42 +20,69 @@ if __name__ == "__main__":
                         action='store_true')
     parser.add_argument('--bw2',
                         action='store_true')
+    parser.add_argument("--mipmap-filter", default="nearest",
+                        choices=list(bwtex.MIPMAP_FILTERS),
+                        help=("Filter used for downsampling generated mipmaps. Default: nearest"))
+    parser.add_argument("-j", "--jobs", default=1, type=int,
+                        help=("Number of processes used for encoding each texture. 0 uses all cores. Default: 1"))
+    parser.add_argument("--no-cache", action="store_true",
+                        help=("Always encode or decode the textures instead of reusing the results of earlier identical conversions."))
+    parser.add_argument("--disk-cache", action="store_true",
+                        help=("Also keep decoded textures in the cache folder so later conversions of the same textures can reuse them."))
     parser.add_argument("outputfolder", default=None, nargs = '?',
                         help=("Path to output folder. Default is same folder as input.") )
 
+    profiling.add_arguments(parser)
+    logging_setup.add_arguments(parser)
+
     args = parser.parse_args()
-    
-    currdir = os.path.dirname("__file__")
+    logging_setup.setup_logging(args.debug)
+    profiling.start_from_arguments(args)
     
     assert args.bw1 is not args.bw2 
     assert args.tobw is not args.topng 
     
-    game = "--bw1" if args.bw1 else "--bw2"
+    game = "bw1" if args.bw1 else "bw2"
     
     outputfolder = args.outputfolder
     if outputfolder is None:
         outputfolder = args.inputfolder
     
+    encode_cache = None if args.no_cache else EncodeCache()
+    decode_cache = None if args.no_cache else DecodeCache(use_disk=args.disk_cache)
+    
+    # One pool for all textures, starting the processes again for every texture takes longer than encoding small ones
+    workers = args.jobs or os.cpu_count()
+    executor = ProcessPoolExecutor(max_workers=workers) if args.tobw and workers > 1 else None
+    
     for fname in os.listdir(args.inputfolder):
         if args.tobw:
             if fname.endswith(".png"):
                 texname = fname.split(".")[0]
                 print("Converting", os.path.join(args.inputfolder, fname))
-                result = subprocess.call(["python",  
-                    os.path.join(currdir, "conv.py"), 
-                    game,
-                    os.path.join(args.inputfolder, fname),
-                    os.path.join(outputfolder, texname+".texture")])
+                try:
+                    bwtex.convert_png_to_texture(os.path.join(args.inputfolder, fname),
+                                                 game,
+                                                 os.path.join(outputfolder, texname+".texture"),
+                                                 mipmap_filter=args.mipmap_filter,
+                                                 workers=workers,
+                                                 encode_cache=encode_cache,
+                                                 executor=executor)
+                except Exception as e:
+                    print("Failed to convert", fname+":", e)
+                    continue
                 
                 print("Saved to", os.path.join(outputfolder, texname+".texture"))
         else:
             if fname.endswith(".texture"):
                 print("Converting", os.path.join(args.inputfolder, fname))
                 with open(os.path.join(args.inputfolder, fname), "rb") as f:
-                    if args.bw1:
-                        tex = bwtex.BW1Texture.from_file(f)
-                    else:
-                        tex = bwtex.BW2Texture.from_file(f)
-                settings = tex.header_to_string()
-                tex.mipmaps[0].save(os.path.join(outputfolder, fname.replace(".texture", "")+"."+tex.fmt+"."+settings+".png"))
-                print("Saved to", os.path.join(outputfolder, fname.replace(".texture", "")+"."+tex.fmt+"."+settings+".png"))
\ No newline at end of file
+                    tex = bwtex.TEXTURE_CLASSES[game].from_file(f, decode_cache=decode_cache)
+                outpath = bwtex.png_path_for_texture(os.path.join(outputfolder, fname), tex)
+                tex.mipmaps[0].save(outpath)
+                print("Saved to", outpath)
+    
+    if executor is not None:
+        executor.shutdown()
+    
+    profiling.finish_from_arguments(args)
@@ -1,14 +1,26 @@
-
 import gzip
+import logging
+import hashlib
+import itertools
 import os 
 import json
+import shutil
+import stat
+import uuid
 
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial 
 
 from lib.bw_archive import BWArchive
 from lib.bw_archive_base import BWResourceFromData
+from lib.bw_archive_stream import BWArchiveStream, open_archive
 from lib.helper import write_uint32
+from lib.profiling import span
+from lib import profiling
+from lib import logging_setup
+
+log = logging.getLogger("bw.restool")
 
 def read_bwres(filepath):
     if filepath.endswith(".gz"):
@@ -30,125 +42,221 @@ def write_bwres(filepath, bwres):
 
 
 
-def dump_res_to_folder(inputpath, outputfolder):
-    bwarc = read_bwres(inputpath)
-    archeader = bwarc.entries[0]
-    filename = str(archeader.filename, encoding="ascii")
-    print("making", filename)
-
-    os.makedirs(outputfolder, exist_ok=True)
-
-    TEXTUREFOLDER = os.path.join(outputfolder, "Textures")
-    SOUNDFOLDER = os.path.join(outputfolder, "Sounds")
-    MODELFOLDER = os.path.join(outputfolder, "Models")
-    ANIMFOLDER = os.path.join(outputfolder, "Animations")
-    EFFECTS = os.path.join(outputfolder, "SpecialEffects")
-    SCRIPTS = os.path.join(outputfolder, "Scripts")
+class ContentStore(object):
+    # Keeps a single copy of every extracted file in a shared folder and hardlinks
+    # the extracted files to it, so resources that appear in many levels are only stored once.
+    # Files in the store are made read-only so that writing to one of the links fails
+    # instead of silently changing the file in every level. Editors that save by
+    # replacing the file are fine.
+    # If hardlinks aren't supported (e.g. FAT32 or the store is on another drive) the file is copied instead.
+    def __init__(self, path):
+        self.path = path
+        self.files_written = 0
+        self.files_linked = 0
+        self.bytes_saved = 0
+        os.makedirs(self.path, exist_ok=True)
+        
+    def _blob_path(self, digest):
+        return os.path.join(self.path, digest[:2], digest)
+        
+    def write(self, filepath, data):
+        digest = hashlib.sha256(data).hexdigest()
+        blobpath = self._blob_path(digest)
+        
+        if os.path.exists(blobpath):
+            self.files_linked += 1
+            self.bytes_saved += len(data)
+        else:
+            os.makedirs(os.path.dirname(blobpath), exist_ok=True)
+            tmppath = "{0}.{1}.tmp".format(blobpath, uuid.uuid4().hex)
+            with open(tmppath, "wb") as f:
+                f.write(data)
+            os.chmod(tmppath, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmppath, blobpath)
+            self.files_written += 1
+        
+        if os.path.lexists(filepath):
+            self.remove(filepath)
+        
+        try:
+            os.link(blobpath, filepath)
+        except OSError:
+            shutil.copyfile(blobpath, filepath)
     
-    game = "Battalion Wars" if bwarc.is_bw() else "Battalion Wars 2"
-    print("Archive detected as", game)
-
-    data = {"Game": game,
-            "Level name": filename}
-    original_order = []
+    def remove(self, filepath):
+        # Removes an extracted file that may be a link to a file in the store.
+        # Removing a link doesn't need write permission on the file itself, so the file in the store
+        # is left alone. Only Windows refuses to remove read-only files, and since all links share
+        # the read-only flag, the file in the store is made read-only again afterwards.
+        if os.name != "nt":
+            os.remove(filepath)
+            return
+        
+        blobpath = None
+        if os.stat(filepath).st_nlink > 1:
+            with open(filepath, "rb") as f:
+                blobpath = self._blob_path(hashlib.sha256(f.read()).hexdigest())
+        
+        os.chmod(filepath, stat.S_IREAD | stat.S_IWRITE)
+        os.remove(filepath)
+        
+        if blobpath is not None and os.path.exists(blobpath):
+            os.chmod(blobpath, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
 
 
-    with open(os.path.join(outputfolder, "resinfo.txt"), "w") as f:
-        json.dump(data, f, indent=" "*4)
+def dump_res_to_folder(inputpath, outputfolder, content_store=None, textures_as_png=False, keep_textures=True,
+                       decode_cache=None):
+    # If a ContentStore is passed, identical files are shared with other extracted archives using the same store.
+    def write_file(filepath, data):
+        with span("extract.write_file", "io", path=filepath):
+            if content_store is not None:
+                content_store.write(filepath, bytes(data))
+            else:
+                with open(filepath, "wb") as f:
+                    f.write(data)
+    
+    # With textures_as_png every texture is decoded straight from the archive data and saved as
+    # name.FORMAT.headervalues.png like massconvert.py does, so it doesn't need to be converted afterwards.
+    # If keep_textures is False, only the PNG is written. The .texture file is still written for
+    # textures that can't be decoded.
+    if textures_as_png:
+        import bwtex
+
+    def write_texture(texturename, data, game):
+        # Returns the names of the files written to the texture folder
+        filenames = []
+        if textures_as_png:
+            try:
+                with span("extract.texture_to_png", "texture", texture=texturename):
+                    tex = bwtex.TEXTURE_CLASSES[game].from_file(BytesIO(data), decode_cache=decode_cache)
+                    pngname = bwtex.png_path_for_texture(texturename+".texture", tex)
+                    tex.mipmaps[0].save(os.path.join(TEXTUREFOLDER, pngname))
+                filenames.append(pngname)
+            except Exception as e:
+                log.warning("Could not convert texture %s to PNG: %s", texturename, e)
+        
+        if keep_textures or not filenames:
+            write_file(os.path.join(TEXTUREFOLDER, texturename+".texture"), data)
+            filenames.append(texturename+".texture")
         
-    for folder in ( TEXTUREFOLDER, SOUNDFOLDER, MODELFOLDER,
-                    ANIMFOLDER, EFFECTS, SCRIPTS):
-        os.makedirs(folder, exist_ok=True)
+        return filenames
+    
+    # The archive is read one resource at a time and every resource is written as soon as
+    # it has been read, so only one resource is held in memory at a time.
+    with open_archive(inputpath) as resfile:
+        bwarc = BWArchiveStream(resfile)
+        filename = str(bwarc.filename, encoding="ascii")
+        log.info("making %s", filename)
+
+        os.makedirs(outputfolder, exist_ok=True)
+
+        TEXTUREFOLDER = os.path.join(outputfolder, "Textures")
+        SOUNDFOLDER = os.path.join(outputfolder, "Sounds")
+        MODELFOLDER = os.path.join(outputfolder, "Models")
+        ANIMFOLDER = os.path.join(outputfolder, "Animations")
+        EFFECTS = os.path.join(outputfolder, "SpecialEffects")
+        SCRIPTS = os.path.join(outputfolder, "Scripts")
         
-    print("Created directory structure")
+        game = "Battalion Wars" if bwarc.is_bw() else "Battalion Wars 2"
+        log.info("Archive detected as %s", game)
 
-    for script in bwarc.scripts:
-        filename = str(script.res_name, encoding="ascii") + ".luap"
-        original_order.append(filename)
-        with open(os.path.join(SCRIPTS, filename), "wb") as f:
-            f.write(script.script_data)
+        data = {"Game": game,
+                "Level name": filename}
 
-    print("Dumped scripts")
+        with open(os.path.join(outputfolder, "resinfo.txt"), "w") as f:
+            json.dump(data, f, indent=" "*4)
             
-    for animation in bwarc.animations:
-        filename = str(animation.res_name, encoding="ascii") + ".anim"
-        original_order.append(filename)
-        with open(os.path.join(ANIMFOLDER, filename), "wb") as f:
-            f.write(animation.animation_data)
-
-    print("Dumped animations")
+        for folder in ( TEXTUREFOLDER, SOUNDFOLDER, MODELFOLDER,
+                        ANIMFOLDER, EFFECTS, SCRIPTS):
+            os.makedirs(folder, exist_ok=True)
             
-    for effect in bwarc.effects:
-        filename = str(effect.res_name, encoding="ascii") + ".txt"
-        original_order.append(filename)
-        with open(os.path.join(EFFECTS, filename), "wb") as f:
-            f.write(effect.particle_data)
-
-    print("Dumped effects")
+        log.info("Created directory structure")
+
+        # fileorder.txt lists the files by type in this order, independent of the order in the archive
+        original_order = {"script": [], "animation": [], "effect": [], "sound": [], "texture": [], "model": []}
+
+        texturenames = []
+        texture_files = {}
+        used_textures = {}
+
+        # Textures come before the models in the archive, so it is not known yet which of them
+        # belong into a model folder. All textures are written to the texture folder first, copied
+        # into the folders of the models that use them and removed from the texture folder at the end.
+        for resource in bwarc.resources():
+            if resource.kind == "texture":
+                texturename = str(resource.res_name, encoding="ascii").strip("\x00")
+                texturenames.append((bytes(resource.res_name).strip(b"\x00"), texturename))
+                original_order["texture"].append(texturename+".texture")
+                texture_files[texturename] = write_texture(texturename, resource.data,
+                                                           "bw1" if bwarc.is_bw() else "bw2")
             
-    for (soundname, sounddata) in bwarc.sounds:
-        filename = str(soundname.res_name, encoding="ascii").strip("\x00") + ".adp"
-        original_order.append(filename)
-        with open(os.path.join(SOUNDFOLDER, filename), "wb") as f:
-            f.write(sounddata.data)
-
-    print("Dumped sounds")
-
-    texturenames = []
-
-    used_textures = {}
-
-    for tex in bwarc.textures:
-        texturenames.append((bytes(tex.res_name).strip(b"\x00"), tex))
-        original_order.append(str(tex.res_name, encoding="ascii").strip("\x00")+".texture")
-
-    for model in bwarc.models:
-        modelname = str(model.res_name, encoding="ascii") 
-        modeldata = bytes(model.entries[0].data)
-        
-        modelfolder = os.path.join(MODELFOLDER, modelname)
-        
-        filename = modelname+".modl"
-        original_order.append(filename)
-        os.makedirs(modelfolder, exist_ok=True)
-        with open(os.path.join(modelfolder, filename), "wb") as f:
-            f.write(modeldata)
-        
-        textures = []
-        print("searching textures for", filename)
-        for name, tex in texturenames:
-            if modeldata.find(name) != -1:
-                textures.append(tex)
-                
-        print("found", textures)
-        
-        for tex in textures:
-            texturename = str(tex.res_name, encoding="ascii").strip("\x00")
-            texfilename = texturename+".texture"
+            elif resource.kind == "sound":
+                filename = str(resource.res_name, encoding="ascii").strip("\x00") + ".adp"
+                original_order["sound"].append(filename)
+                write_file(os.path.join(SOUNDFOLDER, filename), resource.data)
+            
+            elif resource.kind == "script":
+                filename = str(resource.res_name, encoding="ascii") + ".luap"
+                original_order["script"].append(filename)
+                write_file(os.path.join(SCRIPTS, filename), resource.data)
+            
+            elif resource.kind == "animation":
+                filename = str(resource.res_name, encoding="ascii") + ".anim"
+                original_order["animation"].append(filename)
+                write_file(os.path.join(ANIMFOLDER, filename), resource.data)
             
-            if texturename not in used_textures:
-                used_textures[texturename] = True 
+            elif resource.kind == "effect":
+                filename = str(resource.res_name, encoding="ascii") + ".txt"
+                original_order["effect"].append(filename)
+                write_file(os.path.join(EFFECTS, filename), resource.data)
             
-            with open(os.path.join(modelfolder, texfilename), "wb") as f:
-                f.write(tex.data)
+            elif resource.kind == "model":
+                modelname = str(resource.res_name, encoding="ascii") 
+                modeldata = bytes(resource.data)
                 
-    print("Dumped models and their textures")
-    for tex in bwarc.textures:
-        texname = str(tex.res_name, encoding="ascii").strip("\x00")
-        
-        if texname not in used_textures:
-            filename = texname+".texture"
-            with open(os.path.join(TEXTUREFOLDER, filename), "wb") as f:
-                f.write(tex.data)
+                modelfolder = os.path.join(MODELFOLDER, modelname)
+                
+                filename = modelname+".modl"
+                original_order["model"].append(filename)
+                os.makedirs(modelfolder, exist_ok=True)
+                write_file(os.path.join(modelfolder, filename), modeldata)
+                
+                log.debug("searching textures for %s", filename)
+                textures = []
+                for name, texturename in texturenames:
+                    if modeldata.find(name) != -1:
+                        textures.append(texturename)
+                        
+                log.debug("found %s", textures)
                 
-    print("Dumped all remaining textures")
+                for texturename in textures:
+                    used_textures[texturename] = True 
+                    
+                    for texfilename in texture_files[texturename]:
+                        with open(os.path.join(TEXTUREFOLDER, texfilename), "rb") as f:
+                            write_file(os.path.join(modelfolder, texfilename), f.read())
+
+    for texturename in used_textures:
+        for texfilename in texture_files[texturename]:
+            texpath = os.path.join(TEXTUREFOLDER, texfilename)
+            if content_store is not None:
+                content_store.remove(texpath)
+            else:
+                os.remove(texpath)
+                
+    log.info("Dumped all resources")
     
     with open(os.path.join(outputfolder, "fileorder.txt"), "w") as f:
-        for fname in original_order:
-            f.write(fname)
-            f.write("\n")
+        for kind in ("script", "animation", "effect", "sound", "texture", "model"):
+            for fname in original_order[kind]:
+                f.write(fname)
+                f.write("\n")
 
-    print("Done!")
+    if content_store is not None:
+        log.info("Content store: %s new files, %s linked to existing files (%s bytes saved)",
+                 content_store.files_written, content_store.files_linked, content_store.bytes_saved)
+
+    log.info("Done!")
 
 
 def find_pos(namelist, name):
@@ -167,255 +275,429 @@ def choose_open_func(path):
         return open 
 
     
-if __name__ == "__main__":
-    import itertools
-    import argparse
+def encode_texture_from_png(path, game, mipmap_filter, use_cache):
+    # Runs in the worker processes of pack_folder_to_res
+    import bwtex
+    from lib.texture_cache import EncodeCache
+    
+    encode_cache = EncodeCache() if use_cache else None
+    return bwtex.encode_png_texture(path, game, mipmap_filter=mipmap_filter, encode_cache=encode_cache)
 
-    parser = argparse.ArgumentParser()
-    parser.add_argument("input",
-                        help="Path to folder, .res or .res.gz file.")
-    parser.add_argument("output", default=None, nargs = '?',
-                        help=(
-                            "If input is a folder, write packed data into output file. "
-                            "If output ends with .gz, output file will be compressed with gzip."
-                            "If input is a .res or .res.gz file, write extracted data into output folder."
-                            
-                        ))
 
-    args = parser.parse_args()
+def texture_name_of_file(filename):
+    # Both tex01.texture and tex01.DXT1.4100.255.255.1.1024.0.png belong to the texture tex01
+    if filename.endswith(".png"):
+        return filename.split(".")[0]
+    return filename[0:filename.rfind(".")]
+
+
+def is_texture_png(filename):
+    # Only PNGs named like massconvert.py names them (name.FORMAT.headervalues.png) are textures.
+    # parse_png_name accepts any name and falls back to DXT1, so the name is checked here.
+    import bwtex
     
-    input_path = args.input
-    output = args.output
+    if not filename.endswith(".png"):
+        return False
+    name, fmt, header, gen_mipmap = bwtex.parse_png_name(filename)
+    if filename.split(".")[1] != fmt:
+        return False
+    values = header.split(".")[:-1]
+    if gen_mipmap:
+        values.pop(0)
+    return len(values) == 6 and all(value.lstrip("-").isdigit() for value in values)
+
+
+def encode_changed_pngs(all_files, game, mipmap_filter="nearest", workers=1, use_cache=True, write_textures=False):
+    # Encodes every texture whose newest PNG is newer than its newest .texture file, or that has no
+    # .texture file at all. Returns a dict of texture name to texture data. If write_textures is True,
+    # the data is also saved as name.texture next to the PNG.
+    newest = {}
+    for dirpath, filename in all_files:
+        if filename.endswith((".png", ".texture")):
+            fullpath = os.path.join(dirpath, filename)
+            key = (texture_name_of_file(filename), filename.endswith(".png"))
+            mtime = os.path.getmtime(fullpath)
+            if key not in newest or mtime > newest[key][0]:
+                newest[key] = (mtime, fullpath)
     
-    if os.path.isfile(input_path):
-        # extract res file to folder 
-        if output is None:
-            output = input_path + "_Folder"
-        
-        dump_res_to_folder(input_path, output)
+    changed = {}
+    for (name, is_png), (mtime, fullpath) in newest.items():
+        if is_png:
+            texture = newest.get((name, False))
+            if texture is None or mtime > texture[0]:
+                changed[name] = fullpath
     
-    else:
-        # pack folder into res file 
-
-        textures = []
-        models = []
-        sounds = []
-        animations = []
-        effects = []
-        scripts = []
-        
-        textures_already_added = {}
-        
-        original_order = []
-        try:
-            with open(os.path.join(input_path, "fileorder.txt"), "r") as f:
-                for line in f:
-                    original_order.append(line.strip())
-        except FileNotFoundError:
-            print("fileorder.txt not found, original file order won't be retained")
+    if not changed:
+        return {}
+    
+    log.info("Encoding %s textures from PNG", len(changed))
+    names = sorted(changed)
+    with span("pack.encode_pngs", "texture", count=len(names)):
+        if workers > 1 and len(names) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(encode_texture_from_png,
+                                            [changed[name] for name in names],
+                                            itertools.repeat(game),
+                                            itertools.repeat(mipmap_filter),
+                                            itertools.repeat(use_cache)))
+        else:
+            results = [encode_texture_from_png(changed[name], game, mipmap_filter, use_cache) for name in names]
+    
+    encoded = dict(zip(names, results))
+    if write_textures:
+        for name, texdata in encoded.items():
+            with open(os.path.join(os.path.dirname(changed[name]), name+".texture"), "wb") as f:
+                f.write(texdata)
+    
+    return encoded
+
+
+def pack_folder_to_res(input_path, output=None, textures_from_png=False, write_textures=False,
+                       mipmap_filter="nearest", workers=1, use_cache=True):
+    # Packs an extracted folder back into a resource archive and returns the path of the archive.
+    # If output is None, the name of the archive is derived from the folder name.
+    # With textures_from_png, PNGs named like massconvert.py names them are used for textures as well,
+    # see encode_changed_pngs. They are encoded in memory, with workers processes.
+    textures = []
+    models = []
+    sounds = []
+    animations = []
+    effects = []
+    scripts = []
+    
+    textures_already_added = {}
+    
+    original_order = []
+    try:
+        with open(os.path.join(input_path, "fileorder.txt"), "r") as f:
+            for line in f:
+                original_order.append(line.strip())
+    except FileNotFoundError:
+        log.warning("fileorder.txt not found, original file order won't be retained")
+    
+    with open(os.path.join(input_path, "resinfo.txt"), "rb") as f:
+        resinfo = json.load(f)
         
-        with open(os.path.join(input_path, "resinfo.txt"), "rb") as f:
-            resinfo = json.load(f)
-            
-        is_bw2 = resinfo["Game"] == "Battalion Wars 2"
-        compress = False 
-        if output is None:
-            if input_path.endswith("_Folder"):
-                output = input_path[0:-7]
-            else:
-                if is_bw2:
-                    output = input_path + ".res.gz"
-                else:
-                    output = input_path + ".res"
-                    
+    is_bw2 = resinfo["Game"] == "Battalion Wars 2"
+    compress = False 
+    if output is None:
+        if input_path.endswith("_Folder"):
+            output = input_path[0:-7]
+        else:
             if is_bw2:
-                compress = True 
+                output = input_path + ".res.gz"
+            else:
+                output = input_path + ".res"
                 
-        
-        if output.endswith(".gz"):
-            compress = True
+        if is_bw2:
+            compress = True 
             
-        print("Searching path", input_path, "for files to pack into the resource archive")
-        all_files = []
-        for dirpath, dirnames, filenames in os.walk(input_path):
-            for filename in filenames:
-                fullpath = os.path.join(dirpath, filename)
-                if any(filename.endswith(ext) for ext in (
-                    ".texture", ".modl", ".adp", ".anim", ".txt", ".luap")):
-                    if filename != "fileorder.txt":
-                        all_files.append((dirpath, filename))
-        all_files.sort(key=lambda x: find_pos(original_order, x[1]))
-        for dirpath, filename in all_files:
+    
+    if output.endswith(".gz"):
+        compress = True
+        
+    log.info("Searching path %s for files to pack into the resource archive", input_path)
+    extensions = (".texture", ".modl", ".adp", ".anim", ".txt", ".luap")
+    if textures_from_png:
+        extensions += (".png",)
+    all_files = []
+    png_textures = set()
+    for dirpath, dirnames, filenames in os.walk(input_path):
+        for filename in filenames:
             fullpath = os.path.join(dirpath, filename)
-            filename_noextension = filename[0:filename.rfind(".")]
-                            
-            # Textures 
+            if filename.endswith(".png"):
+                if not is_texture_png(filename):
+                    if textures_from_png:
+                        log.warning("Ignoring %s, it isn't named like a texture (name.FORMAT.headervalues.png)",
+                                    fullpath)
+                    continue
+                png_textures.add(texture_name_of_file(filename))
+            if any(filename.endswith(ext) for ext in extensions):
+                if filename != "fileorder.txt":
+                    all_files.append((dirpath, filename))
+    
+    # Textures that are missing would silently be left out of the archive
+    packed_textures = set(texture_name_of_file(filename) for dirpath, filename in all_files
+                          if filename.endswith((".texture", ".png")))
+    for filename in original_order:
+        if filename.endswith(".texture") and texture_name_of_file(filename) not in packed_textures:
+            texturename = texture_name_of_file(filename)
+            if texturename in png_textures:
+                log.warning("Texture %s has no .texture file, only a PNG, and is left out. "
+                            "Pack with --png (\"Use textures edited as PNG\" in the GUI) to use the PNG", texturename)
+            else:
+                log.warning("Texture %s from fileorder.txt not found, it is left out", texturename)
+    
+    def order_key(item):
+        filename = item[1]
+        if filename.endswith(".png"):
+            # fileorder.txt lists the textures by their .texture name
+            filename = texture_name_of_file(filename) + ".texture"
+        return find_pos(original_order, filename)
+    
+    all_files.sort(key=order_key)
+    
+    encoded_textures = {}
+    texture_paths = {}
+    if textures_from_png:
+        encoded_textures = encode_changed_pngs(all_files, "bw2" if is_bw2 else "bw1", mipmap_filter,
+                                               workers, use_cache, write_textures)
+        for dirpath, filename in all_files:
             if filename.endswith(".texture"):
-                if filename_noextension not in textures_already_added:
-                    textures_already_added[filename_noextension] = True
-                    data = BytesIO()
-                    
-                    with open(fullpath, "rb") as f:
-                        data.write(f.read())
-                    
-                    if is_bw2:
-                        resource = BWResourceFromData(b"DXTG", data)
-                    else:
-                        resource = BWResourceFromData(b"TXET", data)
-                    
-                    
-                    textures.append(resource)
-            
-            # Models
-            elif filename.endswith(".modl"):
+                texture_paths.setdefault(texture_name_of_file(filename), os.path.join(dirpath, filename))
+    
+    for dirpath, filename in all_files:
+        fullpath = os.path.join(dirpath, filename)
+        filename_noextension = filename[0:filename.rfind(".")]
+                        
+        # Textures 
+        if filename.endswith((".texture", ".png")):
+            texturename = texture_name_of_file(filename)
+            if texturename not in textures_already_added:
+                textures_already_added[texturename] = True
                 data = BytesIO()
-                write_uint32(data, len(filename_noextension))
-                data.write(bytes(filename_noextension, encoding="ascii"))
                 
-                with open(fullpath, "rb") as f:
-                    modeldata = f.read()
+                if texturename in encoded_textures:
+                    data.write(encoded_textures[texturename])
+                else:
+                    # A PNG that is older than the .texture file of the same texture
+                    with open(texture_paths.get(texturename, fullpath), "rb") as f:
+                        data.write(f.read())
                 
-                # Model data is embedded inside another LDOM section
-                data.write(b"LDOM")
-                write_uint32(data, len(modeldata))
-                data.write(modeldata)
+                if is_bw2:
+                    resource = BWResourceFromData(b"DXTG", data)
+                else:
+                    resource = BWResourceFromData(b"TXET", data)
                 
-                resource = BWResourceFromData(b"LDOM", data)
                 
-                models.append(resource)
+                textures.append(resource)
+        
+        # Models
+        elif filename.endswith(".modl"):
+            data = BytesIO()
+            write_uint32(data, len(filename_noextension))
+            data.write(bytes(filename_noextension, encoding="ascii"))
             
-            # Sounds 
-            elif filename.endswith(".adp"):
-                # Write sound data 
-                data = BytesIO()
-                
-                with open(fullpath, "rb") as f:
-                    data.write(f.read())
-                
-                resource = BWResourceFromData(b"DPSD", data)
-                
-                # Write sound header
-                assert len(filename_noextension) <= 32
-                
-                data = BytesIO()
-                data.write(bytes(filename_noextension, encoding="ascii"))
-                data.write(b"\x00"*(32-len(filename_noextension)))
-                
-                soundheader = BWResourceFromData(b"HPSD", data)
-                sounds.append(soundheader)
-                sounds.append(resource)
+            with open(fullpath, "rb") as f:
+                modeldata = f.read()
             
-            # Animations 
-            elif filename.endswith(".anim"):
-                data = BytesIO()
-                write_uint32(data, len(filename_noextension))
-                data.write(bytes(filename_noextension, encoding="ascii"))
-                
-                with open(fullpath, "rb") as f:
-                    data.write(f.read())
-                
-                resource = BWResourceFromData(b"MINA", data)
-                animations.append(resource)
-                
-            # Special effects 
-            elif filename.endswith(".txt") and filename != "resinfo.txt":
-                data = BytesIO()
-                write_uint32(data, len(filename_noextension))
-                data.write(bytes(filename_noextension, encoding="ascii"))
-                
-                with open(fullpath, "rb") as f:
-                    data.write(f.read())
-                
-                resource = BWResourceFromData(b"FEQT", data)
-                effects.append(resource)
+            # Model data is embedded inside another LDOM section
+            data.write(b"LDOM")
+            write_uint32(data, len(modeldata))
+            data.write(modeldata)
             
-            # Scripts 
-            elif filename.endswith(".luap"):
-                data = BytesIO()
-                write_uint32(data, len(filename_noextension))
-                data.write(bytes(filename_noextension, encoding="ascii"))
-                
-                with open(fullpath, "rb") as f:
-                    data.write(f.read())
-                
-                resource = BWResourceFromData(b"PRCS", data)
-                scripts.append(resource)
-                
-        print("Done searching.")
-        print("{0} textures\n{1} models\n{2} sounds\n{3} animations\n{4} effects\n{5} scripts".format(
-            len(textures), len(models), len(sounds)//2, len(animations), len(effects), len(scripts)
-        ))
-        
-        if compress:
-            # BW2 archives are gzip compressed and always end with .gz 
-            bwopen = gzip.open
-        else:
-            bwopen = open 
+            resource = BWResourceFromData(b"LDOM", data)
             
-        print("Writing to", output)
+            models.append(resource)
         
-        f = BytesIO()
-        
-        #with bwopen(output, "wb") as f:
-        if True:
-            f.write(b"RXET")
-            fxet_size_offset = f.tell()
-            f.write(b"ABCD")
-            write_uint32(f, len(resinfo["Level name"]))
-            f.write(bytes(resinfo["Level name"], encoding="ascii"))
+        # Sounds 
+        elif filename.endswith(".adp"):
+            # Write sound data 
+            data = BytesIO()
             
-            if is_bw2:
-                f.write(b"FTBG")
-            else:
-                f.write(b"FTBX")
-                
-            texsection_size_offset = f.tell()
-            f.write(b"BACD")
-            write_uint32(f, len(textures))
+            with open(fullpath, "rb") as f:
+                data.write(f.read())
             
-            for texdata in textures:
-                #f.write(texdata.data)
-                texdata.write(f)
-            texdata_end = f.tell()
+            resource = BWResourceFromData(b"DPSD", data)
             
-            texsection_size = texdata_end - texsection_size_offset - 4
+            # Write sound header
+            assert len(filename_noextension) <= 32
             
-            fxet_size = texdata_end - fxet_size_offset - 4
+            data = BytesIO()
+            data.write(bytes(filename_noextension, encoding="ascii"))
+            data.write(b"\x00"*(32-len(filename_noextension)))
             
-            f.seek(fxet_size_offset)
-            write_uint32(f, fxet_size)
+            soundheader = BWResourceFromData(b"HPSD", data)
+            sounds.append(soundheader)
+            sounds.append(resource)
+        
+        # Animations 
+        elif filename.endswith(".anim"):
+            data = BytesIO()
+            write_uint32(data, len(filename_noextension))
+            data.write(bytes(filename_noextension, encoding="ascii"))
             
-            f.seek(texsection_size_offset)
-            write_uint32(f, texsection_size)
+            with open(fullpath, "rb") as f:
+                data.write(f.read())
             
-            f.seek(texdata_end)
+            resource = BWResourceFromData(b"MINA", data)
+            animations.append(resource)
             
-            f.write(b"DNOS")
-            sound_size_offset = f.tell()
-            f.write(b"FOOO")
-            write_uint32(f, len(resinfo["Level name"]))
-            f.write(bytes(resinfo["Level name"], encoding="ascii"))
+        # Special effects 
+        elif filename.endswith(".txt") and filename != "resinfo.txt":
+            data = BytesIO()
+            write_uint32(data, len(filename_noextension))
+            data.write(bytes(filename_noextension, encoding="ascii"))
             
-            f.write(b"HFSB")
-            write_uint32(f, 4)
-            write_uint32(f, len(sounds)//2)
+            with open(fullpath, "rb") as f:
+                data.write(f.read())
             
-            for entry in sounds:
-                #f.write(entry.data)
-                entry.write(f)
-                
-            end = f.tell()
-            sound_section_size = end - sound_size_offset - 4 
-            f.seek(sound_size_offset)
-            write_uint32(f, sound_section_size)
-            f.seek(end)
+            resource = BWResourceFromData(b"FEQT", data)
+            effects.append(resource)
+        
+        # Scripts 
+        elif filename.endswith(".luap"):
+            data = BytesIO()
+            write_uint32(data, len(filename_noextension))
+            data.write(bytes(filename_noextension, encoding="ascii"))
+            
+            with open(fullpath, "rb") as f:
+                data.write(f.read())
+            
+            resource = BWResourceFromData(b"PRCS", data)
+            scripts.append(resource)
+            
+    log.info("Done searching.")
+    log.info("%s textures\n%s models\n%s sounds\n%s animations\n%s effects\n%s scripts",
+        len(textures), len(models), len(sounds)//2, len(animations), len(effects), len(scripts)
+    )
+    
+    if compress:
+        # BW2 archives are gzip compressed and always end with .gz 
+        bwopen = gzip.open
+    else:
+        bwopen = open 
+        
+    log.info("Writing to %s", output)
+    
+    f = BytesIO()
+    
+    #with bwopen(output, "wb") as f:
+    if True:
+        f.write(b"RXET")
+        fxet_size_offset = f.tell()
+        f.write(b"ABCD")
+        write_uint32(f, len(resinfo["Level name"]))
+        f.write(bytes(resinfo["Level name"], encoding="ascii"))
+        
+        if is_bw2:
+            f.write(b"FTBG")
+        else:
+            f.write(b"FTBX")
+            
+        texsection_size_offset = f.tell()
+        f.write(b"BACD")
+        write_uint32(f, len(textures))
+        
+        for texdata in textures:
+            #f.write(texdata.data)
+            texdata.write(f)
+        texdata_end = f.tell()
+        
+        texsection_size = texdata_end - texsection_size_offset - 4
+        
+        fxet_size = texdata_end - fxet_size_offset - 4
+        
+        f.seek(fxet_size_offset)
+        write_uint32(f, fxet_size)
+        
+        f.seek(texsection_size_offset)
+        write_uint32(f, texsection_size)
+        
+        f.seek(texdata_end)
+        
+        f.write(b"DNOS")
+        sound_size_offset = f.tell()
+        f.write(b"FOOO")
+        write_uint32(f, len(resinfo["Level name"]))
+        f.write(bytes(resinfo["Level name"], encoding="ascii"))
+        
+        f.write(b"HFSB")
+        write_uint32(f, 4)
+        write_uint32(f, len(sounds)//2)
+        
+        for entry in sounds:
+            #f.write(entry.data)
+            entry.write(f)
             
-            for entry in itertools.chain(models, animations, scripts, effects):
-                #f.write(entry.data)
-                entry.write(f)
+        end = f.tell()
+        sound_section_size = end - sound_size_offset - 4 
+        f.seek(sound_size_offset)
+        write_uint32(f, sound_section_size)
+        f.seek(end)
+        
+        for entry in itertools.chain(models, animations, scripts, effects):
+            #f.write(entry.data)
+            entry.write(f)
 
+    with span("pack.write", "io", compressed=compress):
         with bwopen(output, "wb") as final:
             final.write(f.getbuffer())
 
+    return output
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+    
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input",
+                        help="Path to folder, .res or .res.gz file.")
+    parser.add_argument("output", default=None, nargs = '?',
+                        help=(
+                            "If input is a folder, write packed data into output file. "
+                            "If output ends with .gz, output file will be compressed with gzip."
+                            "If input is a .res or .res.gz file, write extracted data into output folder."
+                            
+                        ))
+    parser.add_argument("--dedup", default=None, metavar="STOREFOLDER",
+                        help=(
+                            "When extracting, store every file once in STOREFOLDER and hardlink the extracted "
+                            "files to it. Use the same folder for several archives to share identical files."
+                        ))
+    parser.add_argument("--png", action="store_true",
+                        help=(
+                            "When extracting, also save every texture as a PNG named like massconvert.py does, "
+                            "so the textures don't need to be converted afterwards. "
+                            "When packing, use PNGs that are newer than the .texture file of the same texture "
+                            "or have none, they are converted in memory."
+                        ))
+    parser.add_argument("--png-only", action="store_true",
+                        help="Like --png, but don't write the .texture files when extracting.")
+    parser.add_argument("--write-textures", action="store_true",
+                        help="With --png, also save the textures converted from PNGs as .texture files when packing.")
+    parser.add_argument("--mipmap-filter", default="nearest",
+                        help="With --png, filter used for generated mipmaps when packing: nearest, box or lanczos. Default: nearest")
+    parser.add_argument("-j", "--jobs", default=0, type=int,
+                        help="With --png, number of processes used for converting PNGs when packing. Default: 0, all cores")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="With --png, always convert the textures instead of reusing earlier results.")
+    parser.add_argument("--disk-cache", action="store_true",
+                        help="With --png, also keep decoded textures in the cache folder so extracting them again is faster.")
+    profiling.add_arguments(parser)
+    logging_setup.add_arguments(parser)
+
+    args = parser.parse_args()
+    logging_setup.setup_logging(args.debug)
+    profiling.start_from_arguments(args)
+    
+    input_path = args.input
+    output = args.output
+    
+    if os.path.isfile(input_path):
+        # extract res file to folder 
+        if output is None:
+            output = input_path + "_Folder"
+        
+        content_store = ContentStore(args.dedup) if args.dedup is not None else None
+        textures_as_png = args.png or args.png_only
+        decode_cache = None
+        if textures_as_png and not args.no_cache:
+            from lib.texture_cache import DecodeCache
+            decode_cache = DecodeCache(use_disk=args.disk_cache)
+        
+        with span("extract", "restool", archive=input_path):
+            dump_res_to_folder(input_path, output, content_store, textures_as_png=textures_as_png,
+                               keep_textures=not args.png_only, decode_cache=decode_cache)
+    
+    else:
+        # pack folder into res file 
+        with span("pack", "restool", folder=input_path):
+            pack_folder_to_res(input_path, output, textures_from_png=args.png or args.png_only,
+                               write_textures=args.write_textures, mipmap_filter=args.mipmap_filter,
+                               workers=args.jobs or os.cpu_count(), use_cache=not args.no_cache)
     
-    
\ No newline at end of file
+    profiling.finish_from_arguments(args)
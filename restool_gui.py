@@ -1,14 +1,31 @@
+import logging
+import multiprocessing
 import tkinter as tk
 from tkinter import ttk, filedialog
 import os
-import threading
+import queue
 import subprocess
 import sys
+import time
+import zlib
 from pathlib import Path
 
 # Import the restool functions
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from restool import dump_res_to_folder
+import bwtex
+from restool import dump_res_to_folder, ContentStore
+from lib import logging_setup
+from lib.bw_archive_stream import sniff_archive
+from lib.scan import TreeScanner
+from lib.texture_cache import EncodeCache, DecodeCache
+from lib.jobs import JobQueue, JobCancelled, QUEUED, RUNNING, FINISHED, FAILED, CANCELLED
+
+# Jobs that run at the same time by default, more than this mostly makes them wait for the disk
+DEFAULT_PARALLEL_JOBS = 2
+
+# Log lines and progress updates from jobs are applied this often, older log lines are dropped after MAX_LOG_LINES
+UI_UPDATE_INTERVAL_MS = 50
+MAX_LOG_LINES = 5000
 
 
 class ModernButton(tk.Canvas):
@@ -302,11 +319,24 @@ class UnifiedToolGUI:
         self.res_tab = tk.Frame(self.notebook, bg=self.colors['bg'])
         self.texture_tab = tk.Frame(self.notebook, bg=self.colors['bg'])
         
+        self.jobs_tab = tk.Frame(self.notebook, bg=self.colors['bg'])
+        
         self.notebook.add(self.res_tab, text='  RES Converter  ')
         self.notebook.add(self.texture_tab, text='  Texture Converter  ')
+        self.notebook.add(self.jobs_tab, text='  Jobs  ')
+        
+        # Every action runs as a job, at most DEFAULT_PARALLEL_JOBS of them at once unless changed in the Jobs tab
+        self.jobs = JobQueue(DEFAULT_PARALLEL_JOBS)
+        
+        # Tkinter may only be used from the main thread, jobs put their UI updates into this queue instead
+        self.ui_queue = queue.Queue()
         
         self.setup_res_tab()
         self.setup_texture_tab()
+        self.setup_jobs_tab()
+        self.refresh_jobs_panel()
+        self.process_ui_queue()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
     def setup_res_tab(self):
         """Setup the RES converter tab"""
@@ -328,7 +358,7 @@ class UnifiedToolGUI:
             is_single=True
         )
         
-        self.create_res_card(
+        batch_card = self.create_res_card(
             right_card_frame,
             "Batch Convert",
             "Search folders and convert all .res files found",
@@ -336,9 +366,55 @@ class UnifiedToolGUI:
             is_single=False
         )
         
+        # Identical files of all extracted levels are stored once and hardlinked into the level folders
+        self.dedup_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            batch_card,
+            text="Share identical files between levels (saves disk space, files become read-only)",
+            variable=self.dedup_var,
+            font=("Segoe UI", 9),
+            bg=self.colors['surface'],
+            fg=self.colors['text_muted'],
+            activebackground=self.colors['surface'],
+            activeforeground=self.colors['text'],
+            selectcolor=self.colors['surface_light'],
+            anchor='w'
+        ).pack(fill=tk.X, pady=(10, 0))
+        
+        # Textures are decoded while the archive is read, instead of converting the extracted files afterwards
+        self.extract_png_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            batch_card,
+            text="Also save textures as PNG",
+            variable=self.extract_png_var,
+            font=("Segoe UI", 9),
+            bg=self.colors['surface'],
+            fg=self.colors['text_muted'],
+            activebackground=self.colors['surface'],
+            activeforeground=self.colors['text'],
+            selectcolor=self.colors['surface_light'],
+            anchor='w'
+        ).pack(fill=tk.X, pady=(2, 0))
+        
+        # Without the .texture files every texture has to be encoded again when repacking
+        self.png_only_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            batch_card,
+            text="PNG only, no .texture files (repacking then needs \"Use textures edited as PNG\" "
+                 "and re-encodes every texture, which is lossy)",
+            variable=self.png_only_var,
+            font=("Segoe UI", 9),
+            bg=self.colors['surface'],
+            fg=self.colors['text_muted'],
+            activebackground=self.colors['surface'],
+            activeforeground=self.colors['text'],
+            selectcolor=self.colors['surface_light'],
+            anchor='w'
+        ).pack(fill=tk.X, pady=(2, 0))
+        
         # Bottom row - Repack cards
         bottom_cards_container = tk.Frame(self.res_tab, bg=self.colors['bg'])
-        bottom_cards_container.pack(fill=tk.X, pady=(10, 20), padx=20)
+        bottom_cards_container.pack(fill=tk.X, pady=(10, 10), padx=20)
         
         repack_left_card = tk.Frame(bottom_cards_container, bg=self.colors['bg'])
         repack_left_card.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
@@ -365,6 +441,24 @@ class UnifiedToolGUI:
             button_color=self.colors['success']
         )
         
+        # Converting PNGs back is lossy, so edited PNGs are only used when asked for
+        repack_options = tk.Frame(self.res_tab, bg=self.colors['bg'])
+        repack_options.pack(fill=tk.X, pady=(0, 15), padx=20)
+        
+        self.repack_png_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            repack_options,
+            text="Use textures edited as PNG (PNGs newer than their .texture file are converted, this is lossy)",
+            variable=self.repack_png_var,
+            font=("Segoe UI", 9),
+            bg=self.colors['bg'],
+            fg=self.colors['text_muted'],
+            activebackground=self.colors['bg'],
+            activeforeground=self.colors['text'],
+            selectcolor=self.colors['surface_light'],
+            anchor='w'
+        ).pack(fill=tk.X)
+        
         progress_container = tk.Frame(self.res_tab, bg=self.colors['surface'], 
                                      relief=tk.FLAT, bd=0)
         progress_container.pack(fill=tk.BOTH, expand=True, padx=20, pady=(0, 20))
@@ -505,6 +599,8 @@ class UnifiedToolGUI:
                 wraplength=350
             )
             self.single_res_label.pack(fill=tk.X, pady=(10, 0))
+        
+        return card_content
     
     def setup_texture_tab(self):
         """Setup the texture converter tab with 8 cards in 4x2 layout (4 columns, 2 rows)"""
@@ -703,6 +799,192 @@ class UnifiedToolGUI:
         self.texture_log_text.pack(fill=tk.BOTH, expand=True)
         scrollbar.config(command=self.texture_log_text.yview)
     
+    def setup_jobs_tab(self):
+        """Setup the jobs tab that lists queued, running and finished jobs"""
+        jobs_container = tk.Frame(self.jobs_tab, bg=self.colors['surface'], relief=tk.FLAT, bd=0)
+        jobs_container.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        
+        jobs_content = tk.Frame(jobs_container, bg=self.colors['surface'])
+        jobs_content.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        
+        header = tk.Frame(jobs_content, bg=self.colors['surface'])
+        header.pack(fill=tk.X, pady=(0, 15))
+        
+        tk.Label(
+            header,
+            text="Jobs",
+            font=("Segoe UI", 11, "bold"),
+            bg=self.colors['surface'],
+            fg=self.colors['text']
+        ).pack(side=tk.LEFT)
+        
+        self.jobs_summary_label = tk.Label(
+            header,
+            text="",
+            font=("Segoe UI", 10),
+            bg=self.colors['surface'],
+            fg=self.colors['text_muted']
+        )
+        self.jobs_summary_label.pack(side=tk.RIGHT)
+        
+        controls = tk.Frame(jobs_content, bg=self.colors['surface'])
+        controls.pack(fill=tk.X, pady=(0, 15))
+        
+        tk.Label(
+            controls,
+            text="Parallel jobs:",
+            font=("Segoe UI", 10),
+            bg=self.colors['surface'],
+            fg=self.colors['text']
+        ).pack(side=tk.LEFT, padx=(0, 8))
+        
+        self.parallel_jobs_var = tk.IntVar(value=DEFAULT_PARALLEL_JOBS)
+        tk.Spinbox(
+            controls,
+            from_=1,
+            to=max(1, os.cpu_count() or 1),
+            width=4,
+            textvariable=self.parallel_jobs_var,
+            command=self.apply_parallel_jobs,
+            font=("Segoe UI", 10),
+            bg=self.colors['surface_light'],
+            fg=self.colors['text'],
+            buttonbackground=self.colors['surface_light'],
+            relief=tk.FLAT
+        ).pack(side=tk.LEFT, padx=(0, 20))
+        
+        ModernButton(
+            controls,
+            text="Cancel Selected",
+            command=self.cancel_selected_jobs,
+            bg_color='#ef4444',
+            hover_color='#dc2626',
+            fg_color='white',
+            bg=self.colors['surface'],
+            width=200
+        ).pack(side=tk.LEFT, padx=(0, 10))
+        
+        ModernButton(
+            controls,
+            text="Clear Finished",
+            command=self.clear_finished_jobs,
+            bg_color=self.colors['primary'],
+            hover_color=self.colors['primary_hover'],
+            fg_color='white',
+            bg=self.colors['surface'],
+            width=200
+        ).pack(side=tk.LEFT)
+        
+        style = ttk.Style()
+        style.configure("Jobs.Treeview",
+                       background=self.colors['surface_light'],
+                       fieldbackground=self.colors['surface_light'],
+                       foreground=self.colors['text'],
+                       borderwidth=0,
+                       rowheight=24)
+        style.configure("Jobs.Treeview.Heading",
+                       background=self.colors['surface'],
+                       foreground=self.colors['text'],
+                       borderwidth=0)
+        style.map("Jobs.Treeview", background=[('selected', self.colors['primary'])])
+        
+        tree_frame = tk.Frame(jobs_content, bg=self.colors['surface_light'])
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        
+        scrollbar = tk.Scrollbar(tree_frame, bg=self.colors['surface_light'])
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        columns = ("state", "progress", "elapsed", "throughput")
+        self.jobs_tree = ttk.Treeview(
+            tree_frame,
+            columns=columns,
+            style="Jobs.Treeview",
+            yscrollcommand=scrollbar.set
+        )
+        self.jobs_tree.heading("#0", text="Job", anchor='w')
+        self.jobs_tree.heading("state", text="State", anchor='w')
+        self.jobs_tree.heading("progress", text="Progress", anchor='w')
+        self.jobs_tree.heading("elapsed", text="Elapsed", anchor='w')
+        self.jobs_tree.heading("throughput", text="Throughput", anchor='w')
+        self.jobs_tree.column("#0", width=600)
+        self.jobs_tree.column("state", width=120)
+        self.jobs_tree.column("progress", width=160)
+        self.jobs_tree.column("elapsed", width=120)
+        self.jobs_tree.column("throughput", width=220)
+        self.jobs_tree.pack(fill=tk.BOTH, expand=True)
+        scrollbar.config(command=self.jobs_tree.yview)
+    
+    def apply_parallel_jobs(self):
+        try:
+            workers = int(self.parallel_jobs_var.get())
+        except (tk.TclError, ValueError):
+            return
+        self.jobs.set_workers(workers)
+    
+    def cancel_selected_jobs(self):
+        selected = set(self.jobs_tree.selection())
+        for job in self.jobs.jobs():
+            if str(job.id) in selected and not job.is_done():
+                self.jobs.cancel(job)
+    
+    def clear_finished_jobs(self):
+        self.jobs.clear_finished()
+        self.refresh_jobs_panel(reschedule=False)
+    
+    def refresh_jobs_panel(self, reschedule=True):
+        """Update the jobs list, runs twice a second on the Tk thread"""
+        jobs = self.jobs.jobs()
+        shown = set(self.jobs_tree.get_children())
+        counts = {QUEUED: 0, RUNNING: 0, FINISHED: 0, FAILED: 0, CANCELLED: 0}
+        
+        for job in jobs:
+            counts[job.state] += 1
+            if job.total:
+                progress = f"{job.done}/{job.total} {job.unit}"
+            else:
+                progress = f"{job.done} {job.unit}" if job.done else ""
+            
+            elapsed = job.elapsed()
+            if job.start_time is None:
+                elapsed_text = ""
+            else:
+                elapsed_text = time.strftime("%M:%S", time.gmtime(elapsed)) if elapsed < 3600 else f"{elapsed/3600:.1f} h"
+            
+            items_per_second, bytes_per_second = job.throughput()
+            throughput = ""
+            if job.done and elapsed > 0:
+                throughput = f"{items_per_second:.2f} {job.unit}/s"
+                if bytes_per_second:
+                    throughput += f", {bytes_per_second / (1024*1024):.1f} MB/s"
+            
+            state = job.state
+            if job.state == RUNNING and job.is_cancelled():
+                state = "cancelling"
+            
+            values = (state, progress, elapsed_text, throughput)
+            item = str(job.id)
+            if item in shown:
+                self.jobs_tree.item(item, values=values)
+                shown.discard(item)
+            else:
+                self.jobs_tree.insert("", tk.END, iid=item, text=job.name, values=values)
+        
+        for item in shown:
+            self.jobs_tree.delete(item)
+        
+        self.jobs_summary_label.config(
+            text=f"{counts[RUNNING]} running, {counts[QUEUED]} queued, "
+                 f"{counts[FINISHED]} finished, {counts[FAILED]} failed, {counts[CANCELLED]} cancelled"
+        )
+        
+        if reschedule:
+            self.root.after(500, self.refresh_jobs_panel)
+    
+    def on_close(self):
+        # Running jobs are daemon threads, cancelling lets them stop at the next file boundary
+        self.jobs.shutdown()
+        self.root.destroy()
+    
     def create_texture_card(self, parent, title, description, command, bg_color, hover_color, is_batch=False):
         """Create a modern card-style section for texture converter"""
         card_frame = tk.Frame(parent, bg=self.colors['surface'], relief=tk.FLAT)
@@ -752,24 +1034,89 @@ class UnifiedToolGUI:
         )
         btn.pack(anchor='w')
     
+    def process_ui_queue(self):
+        """Apply the UI updates queued by jobs, runs every UI_UPDATE_INTERVAL_MS on the Tk thread"""
+        log_lines = {}
+        cleared = set()
+        values = {}
+        calls = []
+        
+        # Only take what is there now, a job that logs very quickly must not keep the UI busy forever
+        for i in range(self.ui_queue.qsize()):
+            try:
+                kind, widget, value = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            
+            if kind == "log":
+                log_lines.setdefault(widget, []).append(value)
+            elif kind == "clear":
+                cleared.add(widget)
+                log_lines[widget] = []
+            elif kind == "value":
+                # Only the latest progress of a frame is shown
+                values[widget] = value
+            elif kind == "config":
+                values.setdefault(("config", widget), {}).update(value)
+            elif kind == "call":
+                calls.append(value)
+        
+        for widget, lines in log_lines.items():
+            widget.config(state=tk.NORMAL)
+            if widget in cleared:
+                widget.delete(1.0, tk.END)
+            if lines:
+                widget.insert(tk.END, "\n".join(lines) + "\n")
+                line_count = int(widget.index("end-1c").split(".")[0])
+                if line_count > MAX_LOG_LINES:
+                    widget.delete(1.0, f"{line_count - MAX_LOG_LINES}.0")
+                widget.see(tk.END)
+            widget.config(state=tk.DISABLED)
+        
+        for widget, value in values.items():
+            if isinstance(widget, tuple):
+                widget[1].config(**value)
+            else:
+                widget['value'] = value
+        
+        # Message boxes wait for the user, they are shown outside of this function so updates keep coming
+        for func in calls:
+            self.root.after_idle(func)
+        
+        self.root.after(UI_UPDATE_INTERVAL_MS, self.process_ui_queue)
+    
+    def show_message(self, title, message, msg_type="info"):
+        """Show a message box, can be called from any thread"""
+        self.ui_queue.put(("call", None, lambda: ModernMessageBox.show(self.root, title, message, msg_type)))
+    
+    def set_texture_progress(self, value):
+        self.ui_queue.put(("value", self.texture_progress_bar, value))
+    
+    def set_texture_status(self, **kwargs):
+        self.ui_queue.put(("config", self.texture_progress_label, kwargs))
+    
     def texture_log(self, message):
-        """Log message to texture tab"""
-        self.texture_log_text.config(state=tk.NORMAL)
-        self.texture_log_text.insert(tk.END, message + "\n")
-        self.texture_log_text.see(tk.END)
-        self.texture_log_text.config(state=tk.DISABLED)
-        self.root.update()
+        """Log message to texture tab, can be called from any thread"""
+        self.ui_queue.put(("log", self.texture_log_text, message))
     
     def reset_texture_ui(self):
         """Reset the texture UI to fresh state"""
-        self.texture_progress_bar['value'] = 0
-        self.texture_progress_label.config(text="Ready", fg=self.colors['text_muted'])
-        self.texture_log_text.config(state=tk.NORMAL)
-        self.texture_log_text.delete(1.0, tk.END)
-        self.texture_log_text.config(state=tk.DISABLED)
+        self.set_texture_progress(0)
+        self.set_texture_status(text="Ready", fg=self.colors['text_muted'])
+        self.ui_queue.put(("clear", self.texture_log_text, None))
+    
+    def convert_texture_file(self, input_file, game_version, direction, decode_cache=None, encode_cache=None):
+        """Convert one texture to PNG or one PNG to a texture and return the output path"""
+        if direction == "to_png":
+            return bwtex.convert_texture_to_png(input_file, game_version, decode_cache=decode_cache)
+        else:
+            # Same naming as massconvert.py: everything after the first dot is format and header values
+            texname = os.path.basename(input_file).split(".")[0]
+            output_file = os.path.join(os.path.dirname(input_file), texname + ".texture")
+            return bwtex.convert_png_to_texture(input_file, game_version, output_file, encode_cache=encode_cache)
     
     def convert_texture_direct(self, game_version, direction, is_batch=False):
-        """Convert single texture file using convert_bw1.bat or convert_bw2.bat"""
+        """Convert a single texture file with bwtex"""
         self.reset_texture_ui()
         
         if direction == "to_png":
@@ -791,102 +1138,44 @@ class UnifiedToolGUI:
         self.texture_log(f"Game: {game_version.upper()}, Direction: {direction}")
         self.texture_log("-" * 60)
         
-        def process():
+        def process(job):
             try:
-                self.texture_progress_label.config(text="Converting...", fg=self.colors['primary'])
-                self.texture_progress_bar['value'] = 25
+                self.set_texture_status(text="Converting...", fg=self.colors['primary'])
+                self.set_texture_progress(25)
                 
-                # Determine which batch file to use
-                if game_version == "bw1":
-                    bat_file = "convert_bw1.bat"
-                else:  # bw2
-                    bat_file = "convert_bw2.bat"
+                start = time.perf_counter()
+                output_file = self.convert_texture_file(input_file, game_version, direction,
+                                                        encode_cache=EncodeCache())
+                duration = time.perf_counter() - start
+                job.set_progress(1, 1, os.path.getsize(input_file))
                 
-                bat_path = os.path.join(self.app_dir, bat_file)
-                
-                if not os.path.exists(bat_path):
-                    self.texture_progress_bar['value'] = 0
-                    self.texture_progress_label.config(text="Error", fg='#ef4444')
-                    self.texture_log(f"Error: {bat_file} not found at {bat_path}")
-                    ModernMessageBox.show(
-                        self.root,
-                        "Error",
-                        f"Batch file not found: {bat_file}\n\nExpected location: {bat_path}",
-                        "error"
-                    )
-                    return
-                
-                input_dir = os.path.dirname(input_file)
-                input_basename = os.path.basename(input_file)
-                filename, ext = os.path.splitext(input_basename)
-                
-                if direction == "to_png":
-                    output_file = os.path.join(input_dir, f"{filename}.png")
-                else:
-                    output_file = os.path.join(input_dir, f"{filename}.texture")
-                
-                self.texture_progress_bar['value'] = 50
-                self.texture_log(f"Using batch file: {bat_file}")
-                self.texture_log(f"Running conversion...")
-                
-                # Run the batch file with input and output file paths
-                result = subprocess.run(
-                    [bat_path, input_file, output_file],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    cwd=self.app_dir
+                self.set_texture_progress(100)
+                self.set_texture_status(text="Complete!", fg=self.colors['success'])
+                self.texture_log(f"Success! Output: {output_file}")
+                self.texture_log(f"Converted in {duration*1000:.0f} ms")
+                self.texture_log("-" * 60)
+                self.show_message(
+                    "Success",
+                    f"Texture converted successfully!\n\nOutput: {output_file}",
+                    "success"
                 )
-                
-                self.texture_progress_bar['value'] = 90
-                
-                if result.returncode == 0:
-                    self.texture_progress_bar['value'] = 100
-                    self.texture_progress_label.config(text="Complete!", fg=self.colors['success'])
-                    self.texture_log(f"Success! Output: {output_file}")
-                    if result.stdout:
-                        self.texture_log(f"Output: {result.stdout}")
-                    self.texture_log("-" * 60)
-                    ModernMessageBox.show(
-                        self.root,
-                        "Success",
-                        f"Texture converted successfully!\n\nOutput: {output_file}",
-                        "success"
-                    )
-                else:
-                    self.texture_progress_bar['value'] = 0
-                    self.texture_progress_label.config(text="Failed", fg='#ef4444')
-                    error_msg = result.stderr if result.stderr else result.stdout
-                    self.texture_log(f"Error: {error_msg}")
-                    ModernMessageBox.show(
-                        self.root,
-                        "Error",
-                        f"Conversion failed:\n{error_msg}",
-                        "error"
-                    )
             except Exception as e:
-                self.texture_progress_bar['value'] = 0
-                self.texture_progress_label.config(text="Error", fg='#ef4444')
+                self.set_texture_progress(0)
+                self.set_texture_status(text="Error", fg='#ef4444')
                 self.texture_log(f"Exception: {str(e)}")
-                ModernMessageBox.show(
-                    self.root,
+                self.show_message(
                     "Error",
                     f"Error during conversion:\n{str(e)}",
                     "error"
                 )
+                raise
         
-        thread = threading.Thread(target=process)
-        thread.start()
+        self.jobs.submit(f"{game_version.upper()} texture: {os.path.basename(input_file)}", process)
     
     def convert_texture_batch(self, game_version, direction):
-        """Batch convert textures using the respective massconvert .bat files"""
+        """Batch convert the textures of all 'Textures' folders with bwtex"""
         self.reset_texture_ui()
         
-        if direction == "to_png":
-            file_desc = "texture files (.texture)"
-        else:
-            file_desc = "PNG files (.png)"
-        
         input_folder = filedialog.askdirectory(
             title=f"Select root folder to search for 'Textures' folders"
         )
@@ -899,153 +1188,124 @@ class UnifiedToolGUI:
         self.texture_log(f"Game: {game_version.upper()}, Direction: {direction}")
         self.texture_log("-" * 60)
         
-        def process():
+        extension = ".texture" if direction == "to_png" else ".png"
+        
+        # Files directly inside any folder called 'Textures'
+        def is_texture_file(entry):
+            return (entry.name.endswith(extension)
+                    and os.path.basename(os.path.dirname(entry.path)).lower() == 'textures'
+                    and entry.is_file())
+        
+        def process(job):
+            # Files are converted as soon as the scanner finds them, the search continues in the background
+            scanner = TreeScanner(input_folder, is_texture_file)
             try:
-                self.texture_progress_label.config(text="Searching for Textures folders...", 
-                                                   fg=self.colors['primary'])
-                self.texture_progress_bar['value'] = 5
+                self.set_texture_status(text="Searching for Textures folders...", 
+                                        fg=self.colors['primary'])
+                self.set_texture_progress(0)
                 
-                # Find all 'Textures' folders in subdirectories
-                textures_folders = []
-                for root, dirs, files in os.walk(input_folder):
-                    for dir_name in dirs:
-                        if dir_name.lower() == 'textures':
-                            textures_path = os.path.join(root, dir_name)
-                            textures_folders.append(textures_path)
-                            self.texture_log(f"Found: {textures_path}")
+                # Shared by all files of the batch, textures that are in several levels are only converted once
+                decode_cache = DecodeCache()
+                encode_cache = EncodeCache()
                 
-                if not textures_folders:
-                    self.texture_progress_bar['value'] = 0
-                    self.texture_progress_label.config(text="No folders found", fg='#ef4444')
-                    self.texture_log("No 'Textures' folders found in the selected directory")
-                    ModernMessageBox.show(
-                        self.root,
-                        "No Folders Found",
-                        "No 'Textures' folders found in the selected directory or its subdirectories.",
-                        "info"
+                textures_folders = set()
+                total = 0
+                failed = 0
+                batch_start = time.perf_counter()
+                for i, input_file in enumerate(scanner, 1):
+                    job.check_cancelled()
+                    total = i
+                    job.set_progress(i - 1, scanner.found)
+                    
+                    textures_folder = os.path.dirname(input_file)
+                    if textures_folder not in textures_folders:
+                        textures_folders.add(textures_folder)
+                        self.texture_log(f"Found: {textures_folder}")
+                    
+                    progress_percent = self.batch_progress_percent(i, scanner)
+                    if progress_percent is not None:
+                        self.set_texture_progress(progress_percent)
+                    self.set_texture_status(
+                        text=f"Converting file {self.batch_count_text(i, scanner)}...",
+                        fg=self.colors['primary']
                     )
-                    return
-                
-                self.texture_log(f"Total 'Textures' folders found: {len(textures_folders)}")
-                self.texture_log("-" * 60)
-                
-                self.texture_progress_bar['value'] = 10
-                
-                # Determine which batch file to use based on the correct naming
-                if game_version == "bw1":
-                    if direction == "to_png":
-                        bat_file = "massconvert_bw1_to_png.bat"
-                    else:
-                        bat_file = "massconvert_png_to_bw1.bat"
-                else:  # bw2
-                    if direction == "to_png":
-                        bat_file = "massconvert_bw2_to_png.bat"
-                    else:
-                        bat_file = "massconvert_png_to_bw2.bat"
+                    
+                    start = time.perf_counter()
+                    try:
+                        output_file = self.convert_texture_file(input_file, game_version, direction,
+                                                                decode_cache, encode_cache)
+                        duration = time.perf_counter() - start
+                        self.texture_log(f"[{self.batch_count_text(i, scanner)}] {input_file} -> "
+                                         f"{os.path.basename(output_file)} ({duration*1000:.0f} ms)")
+                        job.add_bytes(os.path.getsize(input_file))
+                    except Exception as e:
+                        failed += 1
+                        self.texture_log(f"[{self.batch_count_text(i, scanner)}] {input_file}: Error: {str(e)}")
+                    job.set_progress(i)
                 
-                bat_path = os.path.join(self.app_dir, bat_file)
+                for path, error in scanner.errors:
+                    self.texture_log(f"Could not search {path}: {str(error)}")
                 
-                if not os.path.exists(bat_path):
-                    self.texture_progress_bar['value'] = 0
-                    self.texture_progress_label.config(text="Error", fg='#ef4444')
-                    self.texture_log(f"Error: {bat_file} not found at {bat_path}")
-                    ModernMessageBox.show(
-                        self.root,
-                        "Error",
-                        f"Batch file not found: {bat_file}\n\nExpected location: {bat_path}",
-                        "error"
+                if total == 0:
+                    self.set_texture_progress(0)
+                    self.set_texture_status(text="No files found", fg='#ef4444')
+                    self.texture_log(f"No {extension} files found in 'Textures' folders of the selected directory")
+                    self.show_message(
+                        "No Files Found",
+                        f"No {extension} files found in 'Textures' folders of the selected directory or its subdirectories.",
+                        "info"
                     )
                     return
                 
-                self.texture_log(f"Using batch file: {bat_file}")
-                self.texture_log(f"Running batch conversion on {len(textures_folders)} folder(s)...")
-                
-                # Process each Textures folder
-                total = len(textures_folders)
-                for i, textures_folder in enumerate(textures_folders, 1):
-                    progress_percent = 10 + ((i / total) * 80)
-                    self.texture_progress_bar['value'] = progress_percent
-                    self.texture_progress_label.config(
-                        text=f"Processing folder {i}/{total}...",
-                        fg=self.colors['primary']
-                    )
-                    self.texture_log(f"[{i}/{total}] Processing: {textures_folder}")
-                    
-                    # Use Popen instead of run to handle interactive batch files
-                    # Hide the console window when running as frozen executable
-                    startupinfo = None
-                    if getattr(sys, 'frozen', False):
-                        startupinfo = subprocess.STARTUPINFO()
-                        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                        startupinfo.wShowWindow = subprocess.SW_HIDE
-                    
-                    process = subprocess.Popen(
-                        [bat_path, textures_folder],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        stdin=subprocess.PIPE,
-                        text=True,
-                        cwd=self.app_dir,
-                        startupinfo=startupinfo
-                    )
-                    
-                    # Send Enter key to bypass any pause commands
-                    stdout, stderr = process.communicate(input='\n')
-                    result_code = process.returncode
-                    
-                    # Log all output for debugging
-                    if stdout and stdout.strip():
-                        self.texture_log(f"  Output: {stdout.strip()}")
-                    if stderr and stderr.strip():
-                        self.texture_log(f"  Error output: {stderr.strip()}")
-                    
-                    if result_code == 0:
-                        self.texture_log(f"  Batch file completed with code 0")
-                    else:
-                        self.texture_log(f"  Batch file failed with code {result_code}")
-                
-                self.texture_progress_bar['value'] = 100
-                self.texture_progress_label.config(text="Batch conversion complete!", 
-                                                   fg=self.colors['success'])
+                duration = time.perf_counter() - batch_start
+                self.set_texture_progress(100)
+                self.set_texture_status(text="Batch conversion complete!", 
+                                        fg=self.colors['success'])
                 self.texture_log("-" * 60)
-                self.texture_log(f"Batch processing complete! Processed {total} 'Textures' folder(s).")
+                self.texture_log(f"Batch processing complete! Converted {total - failed} of {total} file(s) "
+                                 f"in {len(textures_folders)} 'Textures' folder(s) in {duration:.2f} s.")
                 
-                ModernMessageBox.show(
-                    self.root,
+                self.show_message(
                     "Batch Complete",
-                    f"Successfully processed {total} 'Textures' folder(s)!",
+                    f"Converted {total - failed} of {total} file(s) in {len(textures_folders)} 'Textures' folder(s)!",
                     "success"
                 )
+            except JobCancelled:
+                self.set_texture_status(text="Cancelled", fg=self.colors['text_muted'])
+                self.texture_log("-" * 60)
+                self.texture_log(f"Batch conversion cancelled after {job.done} file(s).")
+                raise
             except Exception as e:
-                self.texture_progress_bar['value'] = 0
-                self.texture_progress_label.config(text="Error", fg='#ef4444')
+                self.set_texture_progress(0)
+                self.set_texture_status(text="Error", fg='#ef4444')
                 self.texture_log(f"Exception: {str(e)}")
-                ModernMessageBox.show(
-                    self.root,
+                self.show_message(
                     "Error",
                     f"Error during batch conversion:\n{str(e)}",
                     "error"
                 )
+                raise
+            finally:
+                scanner.stop()
         
-        thread = threading.Thread(target=process)
-        thread.start()
+        self.jobs.submit(f"{game_version.upper()} batch textures: {input_folder}", process)
+    
+    def set_res_progress(self, value):
+        self.ui_queue.put(("value", self.res_progress_bar, value))
+    
+    def set_res_status(self, **kwargs):
+        self.ui_queue.put(("config", self.res_progress_label, kwargs))
     
     def res_log(self, message):
-        """Log message to RES tab"""
-        self.res_log_text.config(state=tk.NORMAL)
-        self.res_log_text.insert(tk.END, message + "\n")
-        self.res_log_text.see(tk.END)
-        self.res_log_text.config(state=tk.DISABLED)
-        self.root.update()
+        """Log message to RES tab, can be called from any thread"""
+        self.ui_queue.put(("log", self.res_log_text, message))
     
     def reset_res_ui(self):
         """Reset the RES UI to fresh state"""
-        self.res_progress_bar['value'] = 0
-        self.res_progress_label.config(text="Ready", fg=self.colors['text_muted'])
+        self.set_res_progress(0)
+        self.set_res_status(text="Ready", fg=self.colors['text_muted'])
         self.single_res_label.config(text="", fg=self.colors['text_muted'])
-        self.res_log_text.config(state=tk.NORMAL)
-        self.res_log_text.delete(1.0, tk.END)
-        self.res_log_text.config(state=tk.DISABLED)
+        self.ui_queue.put(("clear", self.res_log_text, None))
     
     def select_single_res(self):
         self.reset_res_ui()
@@ -1059,16 +1319,29 @@ class UnifiedToolGUI:
         )
         
         if file_path:
-            # Auto-detect game version based on file extension
-            if file_path.endswith('.res.gz'):
-                game_version = "bw2"
-            else:  # .res
-                game_version = "bw1"
+            # Detect the game version from the archive header, the file extension isn't reliable
+            try:
+                info = sniff_archive(file_path)
+            except (OSError, EOFError, zlib.error) as e:
+                ModernMessageBox.show(self.root, "Error", f"Could not read file:\n{str(e)}", "error")
+                return
+            
+            if info is None:
+                ModernMessageBox.show(
+                    self.root,
+                    "Unknown File",
+                    f"{os.path.basename(file_path)} is not a Battalion Wars resource archive.",
+                    "error"
+                )
+                return
             
+            game_version = info.game
             self.single_res_label.config(
-                text=f"{os.path.basename(file_path)} ({game_version.upper()})",
+                text=f"{os.path.basename(file_path)} ({game_version.upper()}, {info.level_name})",
                 fg=self.colors['success']
             )
+            self.res_log(f"Level: {info.level_name}, {info.texture_count} textures, "
+                         f"{info.archive_size / (1024*1024):.1f} MB uncompressed")
             self.process_single_res(file_path, game_version)
     
     def process_single_res(self, file_path, game_version):
@@ -1080,39 +1353,38 @@ class UnifiedToolGUI:
         else:  # bw2
             output_folder = os.path.join(self.single_res_bw2, filename + "_Folder")
         
-        def process():
+        def process(job):
             try:
-                self.res_progress_label.config(text="Processing...", fg=self.colors['primary'])
-                self.res_progress_bar['value'] = 0
+                self.set_res_status(text="Processing...", fg=self.colors['primary'])
+                self.set_res_progress(0)
                 self.res_log(f"Processing: {os.path.basename(file_path)} ({game_version.upper()})")
                 
-                self.res_progress_bar['value'] = 50
+                self.set_res_progress(50)
                 dump_res_to_folder(file_path, output_folder)
+                job.set_progress(1, 1, os.path.getsize(file_path))
                 
-                self.res_progress_bar['value'] = 100
-                self.res_progress_label.config(text="Complete!", fg=self.colors['success'])
+                self.set_res_progress(100)
+                self.set_res_status(text="Complete!", fg=self.colors['success'])
                 self.res_log(f"Extracted to: {output_folder}")
                 self.res_log("-" * 60)
                 
-                ModernMessageBox.show(
-                    self.root,
+                self.show_message(
                     "Success",
                     f"File extracted successfully!\n\nOutput: {output_folder}",
                     "success"
                 )
             except Exception as e:
-                self.res_progress_bar['value'] = 0
-                self.res_progress_label.config(text="Error", fg='#ef4444')
+                self.set_res_progress(0)
+                self.set_res_status(text="Error", fg='#ef4444')
                 self.res_log(f"Error: {str(e)}")
-                ModernMessageBox.show(
-                    self.root,
+                self.show_message(
                     "Error",
                     f"Failed to process file:\n{str(e)}",
                     "error"
                 )
+                raise
         
-        thread = threading.Thread(target=process)
-        thread.start()
+        self.jobs.submit(f"Extract {filename} ({game_version.upper()})", process)
     
     def select_batch_res(self):
         self.reset_res_ui()
@@ -1124,111 +1396,144 @@ class UnifiedToolGUI:
         if not input_folder:
             return
         
-        res_files = []
-        for root, dirs, files in os.walk(input_folder):
-            for file in files:
-                if file.endswith('.res') or file.endswith('.res.gz'):
-                    res_files.append(os.path.join(root, file))
-        
-        if not res_files:
-            ModernMessageBox.show(
-                self.root,
-                "No Files Found",
-                "No .res or .res.gz files found in the selected folder.",
-                "info"
-            )
-            return
+        self.res_log(f"Searching for .res and .res.gz files in: {input_folder}")
+        self.res_log(f"Output folder: {self.batch_output_folder}")
         
-        # Auto-create output folder in the app directory
-        output_base = self.batch_output_folder
+        self.process_batch_res(input_folder)
+    
+    def batch_count_text(self, current, scanner):
+        """Returns e.g. 3/17, with a + while more files are still being searched for"""
+        return f"{current}/{scanner.found}" + ("" if scanner.is_done() else "+")
+    
+    def batch_progress_percent(self, current, scanner):
+        """Returns how much of the batch is done in percent, or None while the total isn't known yet"""
+        if not scanner.is_done() or not scanner.found:
+            return None
+        return (current / scanner.found) * 100
+    
+    def process_batch_res(self, input_folder):
+        if self.dedup_var.get():
+            content_store = ContentStore(os.path.join(self.batch_output_folder, "shared_files"))
+        else:
+            content_store = None
+        textures_as_png = self.extract_png_var.get()
+        keep_textures = not (textures_as_png and self.png_only_var.get())
         
-        self.res_log(f"Output folder: {output_base}")
+        def is_res_file(entry):
+            return entry.name.endswith(('.res', '.res.gz')) and entry.is_file()
         
-        self.process_batch_res(res_files, output_base)
-    
-    def process_batch_res(self, res_files_bw1, res_files_bw2):
-        def process():
+        def process(job):
+            # Files are extracted as soon as the scanner finds them, the search continues in the background
+            scanner = TreeScanner(input_folder, is_res_file)
+            decode_cache = DecodeCache() if textures_as_png else None
             try:
-                total = len(res_files_bw1) + len(res_files_bw2)
                 current = 0
+                count = {"bw1": 0, "bw2": 0}
+                skipped = 0
                 
-                self.res_progress_label.config(text=f"Processing 0/{total} files...", 
-                                          fg=self.colors['primary'])
-                self.res_progress_bar['value'] = 0
-                self.res_log(f"Starting batch processing of {total} files...")
+                self.set_res_status(text="Searching for files...", fg=self.colors['primary'])
+                self.set_res_progress(0)
                 self.res_log("-" * 60)
                 
-                # Process BW1 files
-                if res_files_bw1:
-                    self.res_log(f"Processing {len(res_files_bw1)} BW1 files...")
-                    for file_path in res_files_bw1:
-                        current += 1
-                        filename = os.path.basename(file_path)
-                        output_folder = os.path.join(self.batch_res_bw1, filename + "_Folder")
-                        
-                        progress_percent = (current / total) * 100
-                        self.res_progress_bar['value'] = progress_percent
-                        self.res_progress_label.config(
-                            text=f"Processing {current}/{total}: {filename} (BW1)",
-                            fg=self.colors['primary']
-                        )
-                        self.res_log(f"[{current}/{total}] Processing: {filename} (BW1)")
-                        
-                        try:
-                            dump_res_to_folder(file_path, output_folder)
-                            self.res_log(f"  Extracted to: {output_folder}")
-                        except Exception as e:
-                            self.res_log(f"  Error: {str(e)}")
+                for file_path in scanner:
+                    job.check_cancelled()
+                    current += 1
+                    filename = os.path.basename(file_path)
+                    job.set_progress(current - 1, scanner.found)
+                    
+                    # Sort the file by game using its header, before anything is extracted
+                    try:
+                        info = sniff_archive(file_path)
+                    except (OSError, EOFError, zlib.error) as e:
+                        info = None
+                        self.res_log(f"[{self.batch_count_text(current, scanner)}] Skipping {filename}: {str(e)}")
+                    else:
+                        if info is None:
+                            self.res_log(f"[{self.batch_count_text(current, scanner)}] Skipping {filename}: "
+                                         f"not a Battalion Wars resource archive")
+                    
+                    if info is None:
+                        skipped += 1
+                        job.set_progress(current)
+                        continue
+                    
+                    game_version = info.game
+                    count[game_version] += 1
+                    output_base = self.batch_res_bw2 if info.is_bw2() else self.batch_res_bw1
+                    output_folder = os.path.join(output_base, filename + "_Folder")
+                    
+                    progress_percent = self.batch_progress_percent(current, scanner)
+                    if progress_percent is not None:
+                        self.set_res_progress(progress_percent)
+                    self.set_res_status(
+                        text=f"Processing {self.batch_count_text(current, scanner)}: {filename} ({game_version.upper()})",
+                        fg=self.colors['primary']
+                    )
+                    self.res_log(f"[{self.batch_count_text(current, scanner)}] Processing: {filename} "
+                                 f"({game_version.upper()}, {info.level_name})")
+                    
+                    try:
+                        dump_res_to_folder(file_path, output_folder, content_store,
+                                           textures_as_png=textures_as_png, keep_textures=keep_textures,
+                                           decode_cache=decode_cache)
+                        self.res_log(f"  Extracted to: {output_folder}")
+                        job.add_bytes(info.file_size)
+                    except Exception as e:
+                        self.res_log(f"  Error: {str(e)}")
+                    job.set_progress(current)
                 
-                # Process BW2 files
-                if res_files_bw2:
-                    self.res_log(f"Processing {len(res_files_bw2)} BW2 files...")
-                    for file_path in res_files_bw2:
-                        current += 1
-                        filename = os.path.basename(file_path)
-                        output_folder = os.path.join(self.batch_res_bw2, filename + "_Folder")
-                        
-                        progress_percent = (current / total) * 100
-                        self.res_progress_bar['value'] = progress_percent
-                        self.res_progress_label.config(
-                            text=f"Processing {current}/{total}: {filename} (BW2)",
-                            fg=self.colors['primary']
-                        )
-                        self.res_log(f"[{current}/{total}] Processing: {filename} (BW2)")
-                        
-                        try:
-                            dump_res_to_folder(file_path, output_folder)
-                            self.res_log(f"  Extracted to: {output_folder}")
-                        except Exception as e:
-                            self.res_log(f"  Error: {str(e)}")
+                for path, error in scanner.errors:
+                    self.res_log(f"Could not search {path}: {str(error)}")
+                
+                total = count["bw1"] + count["bw2"]
+                if total == 0:
+                    self.set_res_status(text="No files found", fg='#ef4444')
+                    self.show_message(
+                        "No Files Found",
+                        "No Battalion Wars .res or .res.gz files found in the selected folder.",
+                        "info"
+                    )
+                    return
                 
-                self.res_progress_bar['value'] = 100
-                self.res_progress_label.config(text="Batch processing complete!", 
-                                          fg=self.colors['success'])
+                if content_store is not None:
+                    self.res_log(f"Shared files: {content_store.files_written} stored, "
+                                 f"{content_store.files_linked} duplicates linked "
+                                 f"({content_store.bytes_saved / (1024*1024):.1f} MB saved)")
+                
+                self.set_res_progress(100)
+                self.set_res_status(text="Batch processing complete!", 
+                                    fg=self.colors['success'])
                 self.res_log("-" * 60)
                 self.res_log(f"Batch processing complete! Processed {total} files.")
+                if skipped:
+                    self.res_log(f"Skipped {skipped} files that aren't resource archives.")
                 self.res_log(f"BW1 output: {self.batch_res_bw1}")
                 self.res_log(f"BW2 output: {self.batch_res_bw2}")
                 
-                ModernMessageBox.show(
-                    self.root,
+                self.show_message(
                     "Batch Complete",
-                    f"Successfully processed {total} files!\n\nBW1: {len(res_files_bw1)} files\nBW2: {len(res_files_bw2)} files",
+                    f"Successfully processed {total} files!\n\nBW1: {count['bw1']} files\nBW2: {count['bw2']} files",
                     "success"
                 )
+            except JobCancelled:
+                self.set_res_status(text="Cancelled", fg=self.colors['text_muted'])
+                self.res_log("-" * 60)
+                self.res_log(f"Batch processing cancelled after {job.done} files.")
+                raise
             except Exception as e:
-                self.res_progress_bar['value'] = 0
-                self.res_progress_label.config(text="Error", fg='#ef4444')
+                self.set_res_progress(0)
+                self.set_res_status(text="Error", fg='#ef4444')
                 self.res_log(f"Batch error: {str(e)}")
-                ModernMessageBox.show(
-                    self.root,
+                self.show_message(
                     "Error",
                     f"Batch processing failed:\n{str(e)}",
                     "error"
                 )
+                raise
+            finally:
+                scanner.stop()
         
-        thread = threading.Thread(target=process)
-        thread.start()
+        self.jobs.submit(f"Batch extract {input_folder}", process)
     
     def select_single_repack(self):
         """Select a single extracted folder to repack into RES"""
@@ -1256,10 +1561,12 @@ class UnifiedToolGUI:
     
     def process_single_repack(self, folder_path):
         """Repack a single folder back into RES file"""
-        def process():
+        repack_args = self.repack_arguments()
+        
+        def process(job):
             try:
-                self.res_progress_label.config(text="Repacking...", fg=self.colors['primary'])
-                self.res_progress_bar['value'] = 25
+                self.set_res_status(text="Repacking...", fg=self.colors['primary'])
+                self.set_res_progress(25)
                 self.res_log(f"Repacking: {os.path.basename(folder_path)}")
                 
                 # Read resinfo.txt to determine game version
@@ -1293,7 +1600,7 @@ class UnifiedToolGUI:
                 
                 output_file = os.path.join(output_dir, base_name + extension)
                 
-                self.res_progress_bar['value'] = 50
+                self.set_res_progress(50)
                 self.res_log(f"Output file: {output_file}")
                 self.res_log(f"Game version: {game_version.upper()}")
                 
@@ -1301,50 +1608,49 @@ class UnifiedToolGUI:
                 restool_path = os.path.join(self.app_dir, "restool.py")
                 
                 result = subprocess.run(
-                    [sys.executable, restool_path, folder_path, output_file],
+                    [sys.executable, restool_path] + repack_args + [folder_path, output_file],
                     stdout=subprocess.PIPE,
                     stderr=subprocess.PIPE,
                     text=True,
                     cwd=self.app_dir
                 )
                 
-                self.res_progress_bar['value'] = 90
+                self.set_res_progress(90)
                 
                 if result.returncode == 0:
-                    self.res_progress_bar['value'] = 100
-                    self.res_progress_label.config(text="Complete!", fg=self.colors['success'])
+                    job.set_progress(1, 1, os.path.getsize(output_file))
+                    self.set_res_progress(100)
+                    self.set_res_status(text="Complete!", fg=self.colors['success'])
                     self.res_log(f"Repacked to: {output_file}")
                     self.res_log("-" * 60)
-                    ModernMessageBox.show(
-                        self.root,
+                    self.show_message(
                         "Success",
                         f"Folder repacked successfully!\n\nOutput: {output_file}",
                         "success"
                     )
                 else:
-                    self.res_progress_bar['value'] = 0
-                    self.res_progress_label.config(text="Error", fg='#ef4444')
+                    self.set_res_progress(0)
+                    self.set_res_status(text="Error", fg='#ef4444')
                     error_msg = result.stderr if result.stderr else result.stdout
                     self.res_log(f"Error: {error_msg}")
-                    ModernMessageBox.show(
-                        self.root,
+                    job.fail(error_msg)
+                    self.show_message(
                         "Error",
                         f"Failed to repack folder:\n{error_msg}",
                         "error"
                     )
             except Exception as e:
-                self.res_progress_bar['value'] = 0
-                self.res_progress_label.config(text="Error", fg='#ef4444')
+                self.set_res_progress(0)
+                self.set_res_status(text="Error", fg='#ef4444')
                 self.res_log(f"Error: {str(e)}")
-                ModernMessageBox.show(
-                    self.root,
+                self.show_message(
                     "Error",
                     f"Failed to repack folder:\n{str(e)}",
                     "error"
                 )
+                raise
         
-        thread = threading.Thread(target=process)
-        thread.start()
+        self.jobs.submit(f"Repack {os.path.basename(folder_path)}", process)
     
     def select_batch_repack(self):
         """Select a folder containing multiple extracted folders to repack"""
@@ -1357,51 +1663,49 @@ class UnifiedToolGUI:
         if not root_folder:
             return
         
-        # Find all folders with resinfo.txt (indicating they're extracted RES folders)
-        folders_to_repack = []
-        for item in os.listdir(root_folder):
-            item_path = os.path.join(root_folder, item)
-            if os.path.isdir(item_path):
-                resinfo_path = os.path.join(item_path, "resinfo.txt")
-                if os.path.exists(resinfo_path):
-                    folders_to_repack.append(item_path)
+        self.res_log(f"Searching for extracted folders in: {root_folder}")
+        self.process_batch_repack(root_folder)
+    
+    def repack_arguments(self):
+        """Returns the extra restool.py arguments for repacking, read on the main thread"""
+        # With --png, PNGs that are newer than their .texture file are converted while packing
+        return ["--png"] if self.repack_png_var.get() else []
+    
+    def process_batch_repack(self, root_folder):
+        """Repack all extracted folders below root_folder back into RES files"""
+        repack_args = self.repack_arguments()
         
-        if not folders_to_repack:
-            ModernMessageBox.show(
-                self.root,
-                "No Folders Found",
-                "No extracted RES folders found in the selected directory.",
-                "info"
-            )
-            return
+        # Folders with resinfo.txt are extracted RES folders, their subfolders don't need to be searched
+        def is_extracted_folder(entry):
+            return entry.is_dir() and os.path.isfile(os.path.join(entry.path, "resinfo.txt"))
         
-        self.res_log(f"Found {len(folders_to_repack)} folders to repack")
-        self.process_batch_repack(folders_to_repack)
-    
-    def process_batch_repack(self, folders_to_repack):
-        """Repack multiple folders back into RES files"""
-        def process():
+        def process(job):
+            # Folders are repacked as soon as the scanner finds them, the search continues in the background
+            scanner = TreeScanner(root_folder, is_extracted_folder, descend_matches=False)
             try:
                 import json
-                total = len(folders_to_repack)
-                self.res_progress_label.config(text=f"Repacking 0/{total} folders...", 
-                                          fg=self.colors['primary'])
-                self.res_progress_bar['value'] = 0
-                self.res_log(f"Starting batch repacking of {total} folders...")
+                self.set_res_status(text="Searching for extracted folders...", 
+                                    fg=self.colors['primary'])
+                self.set_res_progress(0)
                 self.res_log("-" * 60)
                 
                 restool_path = os.path.join(self.app_dir, "restool.py")
+                total = 0
                 
-                for i, folder_path in enumerate(folders_to_repack, 1):
+                for i, folder_path in enumerate(scanner, 1):
+                    job.check_cancelled()
+                    total = i
                     folder_name = os.path.basename(folder_path)
+                    job.set_progress(i - 1, scanner.found)
                     
-                    progress_percent = (i / total) * 100
-                    self.res_progress_bar['value'] = progress_percent
-                    self.res_progress_label.config(
-                        text=f"Repacking {i}/{total}: {folder_name}",
+                    progress_percent = self.batch_progress_percent(i, scanner)
+                    if progress_percent is not None:
+                        self.set_res_progress(progress_percent)
+                    self.set_res_status(
+                        text=f"Repacking {self.batch_count_text(i, scanner)}: {folder_name}",
                         fg=self.colors['primary']
                     )
-                    self.res_log(f"[{i}/{total}] Repacking: {folder_name}")
+                    self.res_log(f"[{self.batch_count_text(i, scanner)}] Repacking: {folder_name}")
                     
                     try:
                         # Read resinfo.txt to determine game version
@@ -1434,7 +1738,7 @@ class UnifiedToolGUI:
                         output_file = os.path.join(output_dir, base_name + extension)
                         
                         result = subprocess.run(
-                            [sys.executable, restool_path, folder_path, output_file],
+                            [sys.executable, restool_path] + repack_args + [folder_path, output_file],
                             stdout=subprocess.PIPE,
                             stderr=subprocess.PIPE,
                             text=True,
@@ -1443,39 +1747,58 @@ class UnifiedToolGUI:
                         
                         if result.returncode == 0:
                             self.res_log(f"  Repacked to: {output_file} ({game_version.upper()})")
+                            job.add_bytes(os.path.getsize(output_file))
                         else:
                             error_msg = result.stderr if result.stderr else result.stdout
                             self.res_log(f"  Error: {error_msg}")
                     except Exception as e:
                         self.res_log(f"  Error: {str(e)}")
+                    job.set_progress(i)
+                
+                for path, error in scanner.errors:
+                    self.res_log(f"Could not search {path}: {str(error)}")
+                
+                if total == 0:
+                    self.set_res_status(text="No folders found", fg='#ef4444')
+                    self.show_message(
+                        "No Folders Found",
+                        "No extracted RES folders found in the selected directory.",
+                        "info"
+                    )
+                    return
                 
-                self.res_progress_bar['value'] = 100
-                self.res_progress_label.config(text="Batch repacking complete!", 
-                                          fg=self.colors['success'])
+                self.set_res_progress(100)
+                self.set_res_status(text="Batch repacking complete!", 
+                                    fg=self.colors['success'])
                 self.res_log("-" * 60)
                 self.res_log(f"Batch repacking complete! Processed {total} folders.")
                 self.res_log(f"BW1 output: {self.repacked_bw1}")
                 self.res_log(f"BW2 output: {self.repacked_bw2}")
                 
-                ModernMessageBox.show(
-                    self.root,
+                self.show_message(
                     "Batch Complete",
                     f"Successfully repacked {total} folders!",
                     "success"
                 )
+            except JobCancelled:
+                self.set_res_status(text="Cancelled", fg=self.colors['text_muted'])
+                self.res_log("-" * 60)
+                self.res_log(f"Batch repacking cancelled after {job.done} folders.")
+                raise
             except Exception as e:
-                self.res_progress_bar['value'] = 0
-                self.res_progress_label.config(text="Error", fg='#ef4444')
+                self.set_res_progress(0)
+                self.set_res_status(text="Error", fg='#ef4444')
                 self.res_log(f"Batch error: {str(e)}")
-                ModernMessageBox.show(
-                    self.root,
+                self.show_message(
                     "Error",
                     f"Batch repacking failed:\n{str(e)}",
                     "error"
                 )
+                raise
+            finally:
+                scanner.stop()
         
-        thread = threading.Thread(target=process)
-        thread.start()
+        self.jobs.submit(f"Batch repack {root_folder}", process, unit="folders")
 
 
 # Add method to Canvas for rounded rectangles
@@ -1498,10 +1821,13 @@ tk.Canvas.create_rounded_rectangle = _create_rounded_rectangle
 
 
 def main():
+    # Progress is shown in the GUI log, the console only gets warnings unless BW_DEBUG is set
+    logging_setup.setup_logging(level=logging.WARNING)
     root = tk.Tk()
     app = UnifiedToolGUI(root)
     root.mainloop()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file